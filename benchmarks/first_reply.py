@@ -0,0 +1,132 @@
+"""Cold start of the bot process answering the first request of the new question.
+
+It is run by the startup benchmark in a fresh interpreter for every measurement:
+the module of the bot is imported, the readiness gate of the entrypoint is passed
+and the first question is asked through the quiz engine of the bot.
+Only the standard library and the readiness module are imported before the bot, so
+the time of importing the bot is measured as the container pays it.
+Timings are printed as the JSON line once the question is asked.
+
+main() of the bot is not run, as it needs the token and the network of the platform:
+the updater or the long poll client, the persistence of conversations, the outbox
+and the metrics server are not started, and the question is asked by calling the engine
+rather than by the handler of the update. The time they take on start isn't measured,
+so the measurement is the lower bound of the time to the first reply.
+
+Run it with: python -m benchmarks.first_reply telegram /path/to/redis.sock
+"""
+
+import asyncio
+import importlib
+import json
+import sys
+import time
+from types import MappingProxyType
+from typing import Any, Dict
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from bots.constants import TASKS_DATABASE, USERS_DATABASE
+from bots.readiness import wait_for_tasks
+
+TELEGRAM_BOT = 'telegram'
+VKONTAKTE_BOT = 'vkontakte'
+BOT_MODULES = MappingProxyType({
+    TELEGRAM_BOT: 'bots.telegram_bot', VKONTAKTE_BOT: 'bots.vkontakte_bot',
+})
+GATE_TIMEOUT = 60
+FIRST_USER_ID = 1
+DEFERRED_MODULES = ('rapidfuzz', 'concurrent.futures.process')
+
+
+def ask_telegram_question(bot_module: Any, socket_path: str) -> Any:
+    """Ask the first question with the quiz engine of the telegram bot.
+
+    Args:
+        bot_module: imported module of the bot.
+        socket_path: path to the socket of Redis server with tasks.
+
+    Returns:
+        Reply of the quiz.
+    """
+    quiz = bot_module.QuizEngine(
+        scripts=bot_module.register_quiz_scripts(
+            users_db=Redis(unix_socket_path=socket_path, db=USERS_DATABASE, decode_responses=True),
+            tasks_db=Redis(unix_socket_path=socket_path, db=TASKS_DATABASE, decode_responses=True),
+        ),
+        platform=bot_module.PLATFORM,
+    )
+    quiz.register_user(FIRST_USER_ID)
+    return quiz.ask_question(FIRST_USER_ID)
+
+
+async def ask_vkontakte_question(bot_module: Any, socket_path: str) -> Any:
+    """Ask the first question with the quiz engine of the vkontakte bot.
+
+    Args:
+        bot_module: imported module of the bot.
+        socket_path: path to the socket of Redis server with tasks.
+
+    Returns:
+        Reply of the quiz.
+    """
+    users_db: AsyncRedis = AsyncRedis(
+        unix_socket_path=socket_path, db=USERS_DATABASE, decode_responses=True,
+    )
+    tasks_db: AsyncRedis = AsyncRedis(
+        unix_socket_path=socket_path, db=TASKS_DATABASE, decode_responses=True,
+    )
+    quiz = bot_module.AsyncQuizEngine(
+        scripts=bot_module.register_quiz_scripts(users_db=users_db, tasks_db=tasks_db),
+        platform=bot_module.PLATFORM,
+    )
+    await quiz.register_user(FIRST_USER_ID)
+    reply = await quiz.ask_question(FIRST_USER_ID)
+    await users_db.close()
+    await tasks_db.close()
+    return reply
+
+
+def measure_first_reply(bot_name: str, socket_path: str) -> Dict[str, Any]:
+    """Import the bot, pass the readiness gate and ask the first question.
+
+    Args:
+        bot_name: "telegram" or "vkontakte".
+        socket_path: path to the socket of Redis server with tasks.
+
+    Returns:
+        Seconds every step has taken and deferred modules loaded by the bot.
+
+    Raises:
+        RuntimeError: if there are no tasks to ask the question from.
+    """
+    starting_time = time.perf_counter()
+    bot_module = importlib.import_module(BOT_MODULES[bot_name])
+    imported_time = time.perf_counter()
+    tasks_db = Redis(unix_socket_path=socket_path, db=TASKS_DATABASE, decode_responses=True)
+    if not wait_for_tasks(tasks_db, GATE_TIMEOUT):
+        raise RuntimeError(f'No tasks to serve in {GATE_TIMEOUT} seconds.')
+    ready_time = time.perf_counter()
+    if bot_name == TELEGRAM_BOT:
+        reply = ask_telegram_question(bot_module, socket_path)
+    else:
+        reply = asyncio.run(ask_vkontakte_question(bot_module, socket_path))
+    if not reply.is_question_open:
+        raise RuntimeError(f'No question is asked: {reply.text}')
+    return {
+        'import': imported_time - starting_time,
+        'gate': ready_time - imported_time,
+        'reply': time.perf_counter() - ready_time,
+        'deferred_loaded': [name for name in DEFERRED_MODULES if name in sys.modules],
+    }
+
+
+def main() -> None:
+    """Run the measurement as script printing timings to stdout."""
+    bot_name, socket_path = sys.argv[1:3]
+    print(json.dumps(measure_first_reply(bot_name, socket_path)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,683 @@
+"""Load test of both bots replaying synthetic users against their handlers.
+
+Every simulated user follows a script: greets the bot, then in every round asks
+a new question, makes several wrong guesses and either answers right or gives up,
+sometimes checking the score. APIs of Telegram and VK are replaced by local fakes
+recording replies, and a throwaway Redis server without persistence is started
+on a unix socket, so the test needs no network and doesn't touch data of the bots.
+Telegram handlers are run one by one in the order messages of all users are interleaved,
+as the dispatcher does; VK users send their messages concurrently through the same
+handling path as the long poll listener.
+
+Throughput, latency percentiles and Redis commands per message are reported for every bot
+as medians over repeated runs and compared with the stored baseline; the script fails
+if any of them regresses past its tolerance. Throughput and latencies depend on the machine,
+so they are only comparable with the baseline taken in the same environment.
+
+Run it with: python -m benchmarks.load --users 1000
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from types import MappingProxyType, SimpleNamespace
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, cast
+
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+from telegram import Bot, Chat, Message, Update, User
+from telegram.ext import CallbackContext
+from vk_api.longpoll import Event
+
+from bots import telegram_bot, vkontakte_bot
+from bots.async_utils import KeyedLock
+from bots.constants import TASKS_DATABASE, USERS_DATABASE, VK_CONCURRENT_EVENTS, ButtonText
+from bots.outbox import AsyncOutbox, Outbox, Pacer
+from bots.quiz_engine import AsyncQuizEngine, QuizEngine
+from bots.quiz_scripts import register_quiz_scripts
+from bots.task_store import add_task, allocate_task_ids, bump_tasks_generation
+from bots.vk_client import AsyncVkApi
+from bots.vk_handlers import PLATFORM as VK_PLATFORM
+
+DEFAULT_USERS = 1000
+DEFAULT_ROUNDS = 3
+DEFAULT_TASKS = 5000
+DEFAULT_SEED = 667
+DEFAULT_REPEATS = 3
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'load_baseline.json')
+DEFAULT_REDIS_SERVER = 'redis-server'
+REDIS_SOCKET = 'redis.sock'
+REDIS_SERVER_OPTIONS = ('--port', '0', '--save', '', '--appendonly', 'no')
+REDIS_STARTUP_TIMEOUT = 10
+REDIS_STARTUP_POLL = 0.05
+MAX_WRONG_GUESSES = 3
+GIVE_UP_SHARE = 0.3
+SCORE_SHARE = 0.2
+UNLIMITED_RATE = 1e9
+QUESTION_TEXT = 'Вопрос номер {task_id}: сколько будет {task_id} плюс один?'
+ANSWER_TEXT = 'Ответ {task_id}'
+WRONG_GUESS = 'Неверная догадка {guess}'
+TASK_ID_PATTERN = re.compile(r'\d+')
+START_ACTION = 'start'
+QUESTION_ACTION = 'question'
+WRONG_ACTION = 'wrong'
+RIGHT_ACTION = 'right'
+GIVE_UP_ACTION = 'give_up'
+SCORE_ACTION = 'score'
+ACTION_TEXTS = MappingProxyType({
+    START_ACTION: '/start',
+    QUESTION_ACTION: ButtonText.QUESTION.value,
+    GIVE_UP_ACTION: ButtonText.GIVE_UP.value,
+    SCORE_ACTION: ButtonText.SCORE.value,
+})
+TELEGRAM_HANDLERS = MappingProxyType({
+    START_ACTION: telegram_bot.start,
+    QUESTION_ACTION: telegram_bot.handle_new_question_request,
+    WRONG_ACTION: telegram_bot.handle_solution_attempt,
+    RIGHT_ACTION: telegram_bot.handle_solution_attempt,
+    GIVE_UP_ACTION: telegram_bot.handle_give_up_request,
+    SCORE_ACTION: telegram_bot.handle_score_request,
+})
+MESSAGES_PER_SECOND = 'messages_per_second'
+REDIS_COMMANDS_PER_MESSAGE = 'redis_commands_per_message'
+PERCENTILES = MappingProxyType({'p50_ms': 50, 'p95_ms': 95, 'p99_ms': 99})
+TOLERANCES = MappingProxyType({
+    MESSAGES_PER_SECOND: -0.3,
+    'p50_ms': 0.5,
+    'p95_ms': 0.5,
+    'p99_ms': 0.5,
+    REDIS_COMMANDS_PER_MESSAGE: 0.05,
+})
+HEADER = '{0:<10} {1:>10} {2:>9} {3:>9} {4:>9} {5:>15}'
+REGRESSION = 'Regression of {bot_name} {metric}: {measured:.2f}, baseline {reference:.2f}.'
+ROW = '{0:<10} {1:>10.0f} {2:>9.2f} {3:>9.2f} {4:>9.2f} {5:>15.2f}'
+
+Report = Dict[str, float]
+Reports = Dict[str, Report]
+
+
+class CommandsCounter(object):
+    """Class counting commands sent to Redis by all connectors of the bot."""
+
+    def __init__(self) -> None:
+        """Create counter."""
+        self.commands = 0
+        self.lock = threading.Lock()
+
+    def increment(self) -> None:
+        """Count the command."""
+        with self.lock:
+            self.commands += 1
+
+
+class CountingRedis(Redis):
+    """Synchronous connector to Redis counting sent commands."""
+
+    counter = CommandsCounter()
+
+    def execute_command(self, *args: Any, **options: Any) -> Any:
+        """Count and execute the command.
+
+        Args:
+            args: command and its arguments.
+            options: options of the command.
+
+        Returns:
+            Result of the command.
+        """
+        self.counter.increment()
+        return super().execute_command(*args, **options)
+
+
+class CountingAsyncRedis(AsyncRedis):
+    """Asynchronous connector to Redis counting sent commands."""
+
+    counter = CommandsCounter()
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        """Count and execute the command.
+
+        Args:
+            args: command and its arguments.
+            options: options of the command.
+
+        Returns:
+            Result of the command.
+        """
+        self.counter.increment()
+        return await super().execute_command(*args, **options)
+
+
+class FakeTelegramBot(object):
+    """Fake of Telegram Bot API remembering the last reply to every chat."""
+
+    defaults = None
+
+    def __init__(self) -> None:
+        """Create fake bot."""
+        self.replies: Dict[int, str] = {}
+        self.replies_count: Dict[int, int] = {}
+        self.replied = threading.Condition()
+
+    def send_message(self, chat_id: int, text: str, **options: Any) -> None:
+        """Remember the reply sent by the outbox.
+
+        Args:
+            chat_id: ID of the chat.
+            text: text of the reply.
+            options: other options of the message.
+        """
+        with self.replied:
+            self.replies[chat_id] = text
+            self.replies_count[chat_id] = self.replies_count.get(chat_id, 0) + 1
+            self.replied.notify_all()
+
+    def get_last_reply(self, chat_id: int, replies: int) -> Optional[str]:
+        """Get the last reply to the chat once all replies expected by the user are sent.
+
+        Args:
+            chat_id: ID of the chat.
+            replies: amount of replies expected by the user.
+
+        Returns:
+            Text of the last reply if any.
+        """
+        with self.replied:
+            self.replied.wait_for(lambda: self.replies_count.get(chat_id, 0) >= replies)
+            return self.replies.get(chat_id)
+
+
+class FakeVkApi(object):
+    """Fake of VK API remembering the last reply to every user."""
+
+    def __init__(self) -> None:
+        """Create fake API."""
+        self.replies: Dict[int, str] = {}
+        self.reply_events: Dict[int, asyncio.Event] = {}
+
+    async def call(self, method: str, **message_fields: Any) -> None:
+        """Remember the reply sent with messages.send by the outbox.
+
+        Args:
+            method: name of the method.
+            message_fields: fields of the message.
+        """
+        user_id = message_fields['user_id']
+        self.replies[user_id] = message_fields['message']
+        self.reply_events.setdefault(user_id, asyncio.Event()).set()
+
+    async def wait_for_reply(self, user_id: int) -> None:
+        """Wait until the reply to the last message of the user is sent.
+
+        Args:
+            user_id: ID of the user.
+        """
+        reply_event = self.reply_events.setdefault(user_id, asyncio.Event())
+        await reply_event.wait()
+        reply_event.clear()
+
+
+class VkMessage(NamedTuple):
+    """Class with fields of VK event read by the handlers."""
+
+    user_id: int
+    message: str
+
+
+def make_script(generator: random.Random, rounds: int) -> List[str]:
+    """Make script of actions of the simulated user.
+
+    Args:
+        generator: random generator.
+        rounds: amount of questions asked by the user.
+
+    Returns:
+        Actions of the user in their order.
+    """
+    actions = [START_ACTION]
+    for _ in range(rounds):
+        actions.append(QUESTION_ACTION)
+        actions.extend(WRONG_ACTION for _ in range(generator.randint(1, MAX_WRONG_GUESSES)))
+        actions.append(GIVE_UP_ACTION if generator.random() < GIVE_UP_SHARE else RIGHT_ACTION)
+        if generator.random() < SCORE_SHARE:
+            actions.append(SCORE_ACTION)
+    return actions
+
+
+def get_action_text(action: str, step: int, last_reply: Optional[str]) -> str:
+    """Make text of the message the user sends for the action.
+
+    The right answer is made from ID of the task found in the text of the asked question.
+
+    Args:
+        action: action of the user.
+        step: index of the action in the script.
+        last_reply: last reply of the bot to the user.
+
+    Returns:
+        Text of the message.
+    """
+    if action == WRONG_ACTION:
+        return WRONG_GUESS.format(guess=step)
+    if action == RIGHT_ACTION:
+        task_match = TASK_ID_PATTERN.search(last_reply or '')
+        return ANSWER_TEXT.format(task_id=task_match.group() if task_match else '')
+    return ACTION_TEXTS[action]
+
+
+@contextmanager
+def run_redis_server(executable: str) -> Iterator[str]:
+    """Start throwaway Redis server listening only on the unix socket.
+
+    Args:
+        executable: path to redis-server.
+
+    Yields:
+        Path to the socket of the server.
+    """
+    with tempfile.TemporaryDirectory() as server_folder:
+        socket_path = os.path.join(server_folder, REDIS_SOCKET)
+        server_command = [
+            executable, *REDIS_SERVER_OPTIONS, '--unixsocket', socket_path, '--dir', server_folder,
+        ]
+        server_process = subprocess.Popen(server_command, stdout=subprocess.DEVNULL)
+        try:
+            yield wait_for_redis(socket_path)
+        finally:
+            server_process.terminate()
+            server_process.wait()
+
+
+def wait_for_redis(socket_path: str) -> str:
+    """Wait until Redis server accepts connections.
+
+    Args:
+        socket_path: path to the socket of the server.
+
+    Returns:
+        Path to the socket of the server ready to use.
+
+    Raises:
+        RuntimeError: if the server doesn't start in time.
+    """
+    deadline = time.monotonic() + REDIS_STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            Redis(unix_socket_path=socket_path).ping()
+        except RedisError:
+            time.sleep(REDIS_STARTUP_POLL)
+        else:
+            return socket_path
+    raise RuntimeError(f'Redis server at {socket_path} did not start in time.')
+
+
+def populate_tasks(socket_path: str, tasks: int) -> None:
+    """Replace all data with synthetic tasks whose answers could be made from their questions.
+
+    Args:
+        socket_path: path to the socket of Redis server.
+        tasks: amount of tasks.
+    """
+    tasks_db = Redis(unix_socket_path=socket_path, db=TASKS_DATABASE, decode_responses=True)
+    tasks_db.flushall()
+    pipeline = tasks_db.pipeline(transaction=False)
+    for task_id in allocate_task_ids(tasks_db, tasks):
+        add_task(
+            pipeline,
+            task_id,
+            QUESTION_TEXT.format(task_id=task_id),
+            ANSWER_TEXT.format(task_id=task_id),
+        )
+    pipeline.execute()
+    bump_tasks_generation(tasks_db)
+
+
+class Measurements(object):
+    """Class collecting latencies of messages and commands sent to Redis while they are handled."""
+
+    def __init__(self, counter: CommandsCounter) -> None:
+        """Start measurements.
+
+        Args:
+            counter: counter of commands sent by connectors of the bot.
+        """
+        self.counter = counter
+        self.latencies: List[float] = []
+        self.starting_commands = counter.commands
+        self.starting_time = time.perf_counter()
+
+    def record(self, handling_start: float) -> None:
+        """Record latency of the message handled just now.
+
+        Args:
+            handling_start: time when handling of the message has started.
+        """
+        self.latencies.append(time.perf_counter() - handling_start)
+
+    def make_report(self) -> Report:
+        """Summarise measurements.
+
+        Returns:
+            Values of all reported metrics.
+        """
+        elapsed = time.perf_counter() - self.starting_time
+        messages = len(self.latencies)
+        cut_points = statistics.quantiles(self.latencies, n=100)
+        report = {
+            MESSAGES_PER_SECOND: messages / elapsed,
+            REDIS_COMMANDS_PER_MESSAGE: (self.counter.commands - self.starting_commands) / messages,
+        }
+        for metric, percentile in PERCENTILES.items():
+            report[metric] = cut_points[percentile - 1] * 1000
+        return report
+
+
+def make_telegram_update(
+    user_id: int, action: str, step: int, fake_bot: FakeTelegramBot,
+) -> Update:
+    """Make update with the message of the user as it comes from Telegram.
+
+    Args:
+        user_id: ID of the user.
+        action: action of the user.
+        step: index of the action in the script.
+        fake_bot: fake bot replies are sent with.
+
+    Returns:
+        Update with the message.
+    """
+    user = User(id=user_id, first_name=f'User {user_id}', is_bot=False)
+    incoming_message = Message(
+        message_id=user_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=user,
+        text=get_action_text(action, step, fake_bot.get_last_reply(user_id, step)),
+        bot=cast(Bot, fake_bot),
+    )
+    return Update(update_id=user_id, message=incoming_message)
+
+
+def interleave_scripts(scripts: List[List[str]]) -> Iterator[Tuple[int, int, str]]:
+    """Interleave actions of all users, so every user is in the middle of the conversation.
+
+    Args:
+        scripts: scripts of users indexed by their IDs.
+
+    Yields:
+        ID of the user, index of the action and the action.
+    """
+    for step in range(max(len(script) for script in scripts)):
+        for user_id, script in enumerate(scripts):
+            if step < len(script):
+                yield user_id, step, script[step]
+
+
+def run_telegram(socket_path: str, scripts: List[List[str]]) -> Report:
+    """Replay users against handlers of the telegram bot.
+
+    Args:
+        socket_path: path to the socket of Redis server with tasks.
+        scripts: scripts of users indexed by their IDs.
+
+    Returns:
+        Values of all reported metrics.
+    """
+    users_db = CountingRedis(
+        unix_socket_path=socket_path, db=USERS_DATABASE, decode_responses=True,
+    )
+    fake_bot = FakeTelegramBot()
+    outbox = Outbox(
+        send=partial(telegram_bot.send_message, cast(Bot, fake_bot)),
+        pacer=Pacer(rate=UNLIMITED_RATE, chat_rate=UNLIMITED_RATE, chat_burst=1),
+        get_retry_after=telegram_bot.get_retry_after,
+        name=telegram_bot.SEND_METHOD,
+    )
+    context = cast(CallbackContext, SimpleNamespace(bot_data={
+        telegram_bot.QUIZ_KEY: QuizEngine(
+            scripts=register_quiz_scripts(
+                users_db=users_db,
+                tasks_db=CountingRedis(
+                    unix_socket_path=socket_path, db=TASKS_DATABASE, decode_responses=True,
+                ),
+            ),
+            platform=telegram_bot.PLATFORM,
+        ),
+        telegram_bot.OUTBOX_KEY: outbox,
+    }))
+    outbox.start()
+    measurements = Measurements(users_db.counter)
+    for user_id, step, action in interleave_scripts(scripts):
+        update = make_telegram_update(user_id, action, step, fake_bot)
+        handling_start = time.perf_counter()
+        TELEGRAM_HANDLERS[action](update, context)
+        measurements.record(handling_start)
+    outbox.close()
+    return measurements.make_report()
+
+
+async def replay_vk_user(
+    user_id: int,
+    script: List[str],
+    context: vkontakte_bot.BotContext,
+    measurements: Measurements,
+) -> None:
+    """Send messages of the user one by one waiting for replies.
+
+    Args:
+        user_id: ID of the user.
+        script: actions of the user.
+        context: everything needed to handle events.
+        measurements: measurements of the run.
+    """
+    fake_api = cast(FakeVkApi, context.vk_api)
+    for step, action in enumerate(script):
+        text = get_action_text(action, step, fake_api.replies.get(user_id))
+        event = cast(Event, VkMessage(user_id=user_id, message=text))
+        await context.handling_slots.acquire()
+        handling_start = time.perf_counter()
+        await vkontakte_bot.handle_event(event, context)
+        measurements.record(handling_start)
+        await fake_api.wait_for_reply(user_id)
+
+
+async def run_vk(socket_path: str, scripts: List[List[str]]) -> Report:
+    """Replay users concurrently against the handling path of the vkontakte bot.
+
+    Args:
+        socket_path: path to the socket of Redis server with tasks.
+        scripts: scripts of users indexed by their IDs.
+
+    Returns:
+        Values of all reported metrics.
+    """
+    users_db = CountingAsyncRedis(
+        unix_socket_path=socket_path, db=USERS_DATABASE, decode_responses=True,
+    )
+    tasks_db = CountingAsyncRedis(
+        unix_socket_path=socket_path, db=TASKS_DATABASE, decode_responses=True,
+    )
+    vk_api = cast(AsyncVkApi, FakeVkApi())
+    context = vkontakte_bot.BotContext(
+        vk_api=vk_api,
+        quiz=AsyncQuizEngine(
+            scripts=register_quiz_scripts(users_db=users_db, tasks_db=tasks_db),
+            platform=VK_PLATFORM,
+        ),
+        outbox=AsyncOutbox(
+            send=partial(vkontakte_bot.send_message, vk_api, vkontakte_bot.create_keyboard()),
+            pacer=Pacer(rate=UNLIMITED_RATE, chat_rate=UNLIMITED_RATE, chat_burst=1),
+            get_retry_after=vkontakte_bot.get_retry_after,
+            name=vkontakte_bot.SEND_METHOD,
+        ),
+        users_lock=KeyedLock(),
+        handling_slots=asyncio.Semaphore(VK_CONCURRENT_EVENTS),
+    )
+    measurements = Measurements(users_db.counter)
+    async with context.outbox:
+        await asyncio.gather(*(
+            replay_vk_user(user_id, script, context, measurements)
+            for user_id, script in enumerate(scripts)
+        ))
+    report = measurements.make_report()
+    await users_db.close()
+    await tasks_db.close()
+    return report
+
+
+def find_regressions(reports: Reports, baseline: Reports) -> List[str]:
+    """Compare reports with the baseline.
+
+    Tolerance is the allowed relative change: negative for metrics which should not fall,
+    positive for metrics which should not grow, so the metric regresses when its excess
+    over the limit has the same sign as the tolerance.
+
+    Args:
+        reports: values of metrics of every bot.
+        baseline: stored values of metrics of every bot.
+
+    Returns:
+        Descriptions of regressed metrics.
+    """
+    regressions = []
+    for bot_name, report in reports.items():
+        for metric, tolerance in TOLERANCES.items():
+            if (reference := baseline.get(bot_name, {}).get(metric)) is None:
+                continue
+            measured = report[metric]
+            if (measured - reference * (1 + tolerance)) * tolerance > 0:
+                regressions.append(REGRESSION.format(
+                    bot_name=bot_name, metric=metric, measured=measured, reference=reference,
+                ))
+    return regressions
+
+
+def print_reports(reports: Reports) -> None:
+    """Print values of metrics of every bot.
+
+    Args:
+        reports: values of metrics of every bot.
+    """
+    print(HEADER.format('bot', 'msg/s', *PERCENTILES, 'redis cmd/msg'))
+    for bot_name, report in reports.items():
+        latencies = [report[metric] for metric in PERCENTILES]
+        print(ROW.format(
+            bot_name, report[MESSAGES_PER_SECOND], *latencies, report[REDIS_COMMANDS_PER_MESSAGE],
+        ))
+
+
+def run_bots(socket_path: str, scripts: List[List[str]], tasks: int) -> Reports:
+    """Replay users against both bots starting every bot with the same tasks and no users.
+
+    Args:
+        socket_path: path to the socket of Redis server.
+        scripts: scripts of users indexed by their IDs.
+        tasks: amount of synthetic tasks.
+
+    Returns:
+        Values of metrics of every bot.
+    """
+    populate_tasks(socket_path, tasks)
+    telegram_report = run_telegram(socket_path, scripts)
+    populate_tasks(socket_path, tasks)
+    return {'telegram': telegram_report, 'vk': asyncio.run(run_vk(socket_path, scripts))}
+
+
+def get_median_reports(runs: List[Reports]) -> Reports:
+    """Take median of every metric over repeated runs, so a single noisy run doesn't count.
+
+    Args:
+        runs: values of metrics of every bot in every run.
+
+    Returns:
+        Median values of metrics of every bot.
+    """
+    return {
+        bot_name: {
+            metric: statistics.median(run[bot_name][metric] for run in runs)
+            for metric in report
+        }
+        for bot_name, report in runs[0].items()
+    }
+
+
+def check_baseline(reports: Reports, baseline_path: str) -> bool:
+    """Print regressions of metrics against the stored baseline.
+
+    Args:
+        reports: values of metrics of every bot.
+        baseline_path: path to the baseline.
+
+    Returns:
+        True if nothing has regressed else False.
+    """
+    if not os.path.exists(baseline_path):
+        print('No baseline to compare with, save it with --update-baseline.')
+        return True
+    with open(baseline_path) as baseline_file:
+        regressions = find_regressions(reports, json.load(baseline_file))
+    for regression in regressions:
+        print(regression)
+    return not regressions
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parse arguments of the script.
+
+    Returns:
+        Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Load test of the bots.')
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS, help='simulated users')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help='questions per user')
+    parser.add_argument('--tasks', type=int, default=DEFAULT_TASKS, help='synthetic tasks')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed of random generator')
+    parser.add_argument(
+        '--repeats', type=int, default=DEFAULT_REPEATS, help='runs to take median of metrics over',
+    )
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='path to the baseline')
+    parser.add_argument(
+        '--redis-server', default=DEFAULT_REDIS_SERVER, help='path to redis-server executable',
+    )
+    parser.add_argument(
+        '--update-baseline', action='store_true', help='save results as the new baseline',
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run the load test as script."""
+    arguments = parse_arguments()
+    generator = random.Random(arguments.seed)
+    random.seed(arguments.seed)
+    scripts = [make_script(generator, arguments.rounds) for _ in range(arguments.users)]
+    messages = sum(len(script) for script in scripts)
+    print(f'Users: {arguments.users}, messages per bot: {messages}.')
+    with run_redis_server(arguments.redis_server) as socket_path:
+        runs = [
+            run_bots(socket_path, scripts, arguments.tasks) for _ in range(arguments.repeats)
+        ]
+    reports = get_median_reports(runs)
+    print_reports(reports)
+    if arguments.update_baseline:
+        with open(arguments.baseline, 'w') as baseline_file:
+            json.dump(reports, baseline_file, indent=2)
+        print(f'Baseline saved to {arguments.baseline}.')
+    elif not check_baseline(reports, arguments.baseline):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
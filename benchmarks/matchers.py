@@ -0,0 +1,250 @@
+"""Benchmark of answer matchers on answer and guess pairs generated from the quiz corpus.
+
+For every answer of the sampled quiz files several guesses are made: exact answer,
+answer in upper case, answer with a typo, truncated answer, answer with extra words
+and answer to a different question. Throughput of every available matcher is measured
+along with the share of pairs where its verdict differs from the difflib one.
+
+Run it with: python -m benchmarks.matchers --files 500
+"""
+
+import argparse
+import os
+import random
+import time
+from collections import Counter
+from types import MappingProxyType
+from typing import Callable, List, Tuple
+
+from bots.check_answer import (
+    STRING_EQUALITY_RATIO, Matcher, get_available_matchers, normalise_answer,
+    normalise_correct_answer,
+)
+from bots.quiz_parser import parse_quiz_file
+from bots.upload_quiz import DEFAULT_QUIZ_TASKS_DIR
+
+REFERENCE_MATCHER = 'difflib'
+DEFAULT_FILES = 300
+DEFAULT_SEED = 667
+TRUNCATED_SHARE = 0.75
+TYPO_SYMBOLS = 'абвгдеж'
+EXTRA_WORDS = 2
+HEADER = '{0:<10} {1:>10} {2:>9} {3:>9}  {4}'
+ROW = '{0:<10} {1:>10.0f} {2:>9} {3:>9.2%}  {4}'
+
+GuessMaker = Callable[[str, str, random.Random], str]
+Pair = Tuple[str, str, str]
+
+
+def repeat_answer(answer: str, other_answer: str, generator: random.Random) -> str:
+    """Repeat the answer as is.
+
+    Args:
+        answer: correct answer.
+        other_answer: answer to a different question.
+        generator: random generator.
+
+    Returns:
+        Exact guess.
+    """
+    return answer
+
+
+def shout_answer(answer: str, other_answer: str, generator: random.Random) -> str:
+    """Bring the answer to upper case.
+
+    Args:
+        answer: correct answer.
+        other_answer: answer to a different question.
+        generator: random generator.
+
+    Returns:
+        Guess in upper case.
+    """
+    return answer.upper()
+
+
+def make_typo(answer: str, other_answer: str, generator: random.Random) -> str:
+    """Replace random symbol of the answer.
+
+    Args:
+        answer: correct answer.
+        other_answer: answer to a different question.
+        generator: random generator.
+
+    Returns:
+        Guess with a typo.
+    """
+    position = generator.randrange(len(answer))
+    symbols = list(answer)
+    symbols[position] = generator.choice(TYPO_SYMBOLS)
+    return ''.join(symbols)
+
+
+def truncate_answer(answer: str, other_answer: str, generator: random.Random) -> str:
+    """Cut the end of the answer.
+
+    Args:
+        answer: correct answer.
+        other_answer: answer to a different question.
+        generator: random generator.
+
+    Returns:
+        Truncated guess.
+    """
+    return answer[:max(1, int(len(answer) * TRUNCATED_SHARE))]
+
+
+def extend_answer(answer: str, other_answer: str, generator: random.Random) -> str:
+    """Add first words of another answer to the answer.
+
+    Args:
+        answer: correct answer.
+        other_answer: answer to a different question.
+        generator: random generator.
+
+    Returns:
+        Guess with extra words.
+    """
+    extra_words = other_answer.split()[:EXTRA_WORDS]
+    return ' '.join([answer, *extra_words])
+
+
+def give_other_answer(answer: str, other_answer: str, generator: random.Random) -> str:
+    """Give answer to a different question.
+
+    Args:
+        answer: correct answer.
+        other_answer: answer to a different question.
+        generator: random generator.
+
+    Returns:
+        Wrong guess.
+    """
+    return other_answer
+
+
+GUESS_MAKERS = MappingProxyType({
+    'exact': repeat_answer,
+    'upper': shout_answer,
+    'typo': make_typo,
+    'truncated': truncate_answer,
+    'extended': extend_answer,
+    'other': give_other_answer,
+})
+
+
+def load_answers(quiz_folder: str, files: int, seed: int) -> List[str]:
+    """Load answers from randomly sampled quiz files.
+
+    Args:
+        quiz_folder: path to folder with quiz tasks.
+        files: amount of files to be sampled.
+        seed: seed of random generator.
+
+    Returns:
+        Non-empty answers.
+    """
+    file_names = sorted(os.listdir(quiz_folder))
+    sample_size = min(files, len(file_names))
+    sampled_files = random.Random(seed).sample(file_names, sample_size)
+    answers: List[str] = []
+    for file_name in sampled_files:
+        tasks = parse_quiz_file(os.path.join(quiz_folder, file_name))
+        answers.extend(task.answer for task in tasks if task.answer.strip())
+    return answers
+
+
+def make_pairs(answers: List[str], seed: int) -> List[Pair]:
+    """Make normalised pairs of correct answers and guesses of every kind.
+
+    Args:
+        answers: correct answers.
+        seed: seed of random generator.
+
+    Returns:
+        Kinds of guesses along with normalised correct answers and guesses.
+    """
+    generator = random.Random(seed)
+    pairs = []
+    for correct_answer in answers:
+        wrong_answer = generator.choice(answers)
+        for kind, make_guess in GUESS_MAKERS.items():
+            guess = make_guess(correct_answer, wrong_answer, generator)
+            pairs.append((kind, normalise_correct_answer(correct_answer), normalise_answer(guess)))
+    return pairs
+
+
+def run_matcher(matcher: Matcher, pairs: List[Pair]) -> Tuple[List[bool], float]:
+    """Run matcher over all pairs.
+
+    Args:
+        matcher: matcher to be measured.
+        pairs: kinds of guesses along with normalised correct answers and guesses.
+
+    Returns:
+        Verdicts of the matcher and throughput in pairs per second.
+    """
+    starting_time = time.perf_counter()
+    verdicts = [matcher(answer, guess, STRING_EQUALITY_RATIO) for _, answer, guess in pairs]
+    return verdicts, len(pairs) / (time.perf_counter() - starting_time)
+
+
+def describe_disagreements(
+    pairs: List[Pair], verdicts: List[bool], reference_verdicts: List[bool],
+) -> Tuple[float, str]:
+    """Count share of pairs where verdict differs from the reference one.
+
+    Args:
+        pairs: kinds of guesses along with normalised correct answers and guesses.
+        verdicts: verdicts of the matcher.
+        reference_verdicts: verdicts of the reference matcher.
+
+    Returns:
+        Total share of disagreements and description of disagreements per kind of guess.
+    """
+    kinds = [kind for kind, _, _ in pairs]
+    kinds_total = Counter(kinds)
+    disagreements = Counter(
+        kind
+        for kind, verdict, reference in zip(kinds, verdicts, reference_verdicts)
+        if verdict != reference
+    )
+    per_kind = ', '.join(
+        '{0} {1:.2%}'.format(kind, disagreements[kind] / total)
+        for kind, total in kinds_total.items()
+    )
+    return sum(disagreements.values()) / len(pairs), per_kind
+
+
+def report(pairs: List[Pair]) -> None:
+    """Measure all available matchers and print the report.
+
+    Args:
+        pairs: kinds of guesses along with normalised correct answers and guesses.
+    """
+    measurements = {
+        name: run_matcher(matcher, pairs) for name, matcher in get_available_matchers().items()
+    }
+    reference_verdicts, _ = measurements[REFERENCE_MATCHER]
+    pairs_amount = len(pairs)
+    print(f'Pairs of answers and guesses: {pairs_amount}.')
+    print(HEADER.format('matcher', 'pairs/s', 'accepted', 'disagree', 'disagree per kind'))
+    for name, (verdicts, throughput) in measurements.items():
+        disagreement, per_kind = describe_disagreements(pairs, verdicts, reference_verdicts)
+        print(ROW.format(name, throughput, sum(verdicts), disagreement, per_kind))
+
+
+def main() -> None:
+    """Run the benchmark as script."""
+    parser = argparse.ArgumentParser(description='Benchmark of answer matchers.')
+    parser.add_argument('--files', type=int, default=DEFAULT_FILES, help='quiz files to sample')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed of random generator')
+    arguments = parser.parse_args()
+    quiz_folder = os.getenv('QUIZ_TASKS_DIR', DEFAULT_QUIZ_TASKS_DIR)
+    answers = load_answers(quiz_folder, arguments.files, arguments.seed)
+    report(make_pairs(answers, arguments.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Benchmark of the quiz parser against the legacy one on files of the quiz corpus.
+
+The legacy parser split the whole content of a file into blocks and paired
+questions with answers by their order, so a single malformed block shifted
+all later pairs. Throughput of both parsers is measured along with the amount
+of pairs of questions and answers which differ from the results of the legacy parser.
+
+Run it with: python -m benchmarks.parser --files 1000
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import random
+import re
+import time
+from types import MappingProxyType
+from typing import Callable, List, Tuple
+
+from bots.manifest import DIGEST_ALGORITHM
+from bots.quiz_parser import PICTURE_INDICATOR, QUIZ_FILE_ENCODING, QuizFileParser, decode_chunks
+from bots.upload_quiz import DEFAULT_QUIZ_TASKS_DIR
+
+REFERENCE_PARSER = 'legacy'
+DEFAULT_FILES = 0
+DEFAULT_SEED = 667
+LEGACY_QUESTION_PATTERN = re.compile(r'^Вопрос.+\n')
+LEGACY_ANSWER_PATTERN = re.compile(r'^Ответ.+\n')
+BYTES_IN_MEGABYTE = 1024 * 1024
+HEADER = '{0:<10} {1:>10} {2:>8} {3:>9} {4:>10} {5:>8}'
+ROW = '{0:<10} {1:>10.0f} {2:>8.2f} {3:>9} {4:>10} {5:>8}'
+
+Pairs = List[Tuple[str, str]]
+FileParser = Callable[[str, bytes], Tuple[Pairs, int]]
+
+
+def parse_legacy(file_name: str, raw_content: bytes) -> Tuple[Pairs, int]:
+    """Parse content of quiz file the way the legacy parser did.
+
+    Args:
+        file_name: name of quiz file.
+        raw_content: raw content of quiz file.
+
+    Returns:
+        Pairs of questions and answers and zero as malformed blocks were not detected.
+    """
+    quiz_content = raw_content.decode(QUIZ_FILE_ENCODING)
+    split_content = iter(quiz_content.replace('\n\n\n', '\n\n').split('\n\n'))
+    questions = []
+    answers = []
+    for split in split_content:
+        if PICTURE_INDICATOR in split:
+            next(split_content, None)
+        elif LEGACY_QUESTION_PATTERN.match(split):
+            questions.append(LEGACY_QUESTION_PATTERN.sub('', split).strip())
+        elif LEGACY_ANSWER_PATTERN.match(split):
+            answers.append(LEGACY_ANSWER_PATTERN.sub('', split).strip())
+    return list(zip(questions, answers)), 0
+
+
+def parse_streaming(file_name: str, raw_content: bytes) -> Tuple[Pairs, int]:
+    """Parse content of quiz file by chunks with the current parser hashing it on the way.
+
+    Args:
+        file_name: name of quiz file.
+        raw_content: raw content of quiz file.
+
+    Returns:
+        Pairs of questions and answers and amount of malformed blocks.
+    """
+    parser = QuizFileParser(file_name=file_name)
+    content_digest = hashlib.new(DIGEST_ALGORITHM)
+    tasks = parser.parse(decode_chunks(io.BytesIO(raw_content), content_digest))
+    pairs = [(task.question.strip(), task.answer.strip()) for task in tasks]
+    return pairs, len(parser.malformed_blocks)
+
+
+PARSERS = MappingProxyType({
+    REFERENCE_PARSER: parse_legacy,
+    'streaming': parse_streaming,
+})
+
+
+def load_files(quiz_folder: str, files: int, seed: int) -> List[Tuple[str, bytes]]:
+    """Read sampled quiz files into memory, so reading doesn't affect measurements.
+
+    Args:
+        quiz_folder: path to folder with quiz tasks.
+        files: amount of files to be sampled, all files are taken if it is zero.
+        seed: seed of random generator.
+
+    Returns:
+        Names of files along with their raw content.
+    """
+    file_names = sorted(os.listdir(quiz_folder))
+    if 0 < files < len(file_names):
+        file_names = random.Random(seed).sample(file_names, files)
+    loaded_files = []
+    for file_name in file_names:
+        with open(os.path.join(quiz_folder, file_name), 'rb') as quiz_file:
+            loaded_files.append((file_name, quiz_file.read()))
+    return loaded_files
+
+
+def run_parser(
+    file_parser: FileParser, loaded_files: List[Tuple[str, bytes]],
+) -> Tuple[List[Pairs], int, float]:
+    """Run parser over all files.
+
+    Args:
+        file_parser: parser to be measured.
+        loaded_files: names of files along with their raw content.
+
+    Returns:
+        Pairs parsed from every file, amount of malformed blocks and elapsed seconds.
+    """
+    starting_time = time.perf_counter()
+    parsed_files = [file_parser(file_name, raw_content) for file_name, raw_content in loaded_files]
+    elapsed = time.perf_counter() - starting_time
+    malformed_blocks = sum(malformed for _, malformed in parsed_files)
+    return [pairs for pairs, _ in parsed_files], malformed_blocks, elapsed
+
+
+def count_differences(parsed_pairs: List[Pairs], reference_pairs: List[Pairs]) -> int:
+    """Count pairs of questions and answers which are not found in the reference results.
+
+    Args:
+        parsed_pairs: pairs parsed from every file.
+        reference_pairs: pairs parsed from every file by the reference parser.
+
+    Returns:
+        Amount of differing pairs.
+    """
+    return sum(
+        len(set(pairs) ^ set(reference))
+        for pairs, reference in zip(parsed_pairs, reference_pairs)
+    )
+
+
+def report(loaded_files: List[Tuple[str, bytes]]) -> None:
+    """Measure both parsers and print the report.
+
+    Args:
+        loaded_files: names of files along with their raw content.
+    """
+    measurements = {
+        name: run_parser(file_parser, loaded_files) for name, file_parser in PARSERS.items()
+    }
+    reference_pairs, _, _ = measurements[REFERENCE_PARSER]
+    megabytes = sum(len(raw_content) for _, raw_content in loaded_files) / BYTES_IN_MEGABYTE
+    files_amount = len(loaded_files)
+    print(f'Files: {files_amount}, {megabytes:.1f} MB.')
+    print(HEADER.format('parser', 'files/s', 'MB/s', 'tasks', 'malformed', 'differ'))
+    for name, (parsed_pairs, malformed_blocks, elapsed) in measurements.items():
+        print(ROW.format(
+            name,
+            files_amount / elapsed,
+            megabytes / elapsed,
+            sum(len(pairs) for pairs in parsed_pairs),
+            malformed_blocks,
+            count_differences(parsed_pairs, reference_pairs),
+        ))
+
+
+def main() -> None:
+    """Run the benchmark as script."""
+    parser = argparse.ArgumentParser(description='Benchmark of quiz parsers.')
+    parser.add_argument(
+        '--files', type=int, default=DEFAULT_FILES, help='quiz files to sample, 0 for all',
+    )
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed of random generator')
+    arguments = parser.parse_args()
+    quiz_folder = os.getenv('QUIZ_TASKS_DIR', DEFAULT_QUIZ_TASKS_DIR)
+    report(load_files(quiz_folder, arguments.files, arguments.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Benchmark of the cold start of both bots measuring time to the first reply.
+
+The bot is started in a fresh interpreter while the upload of synthetic tasks runs
+in the background, as the entrypoint does on deployment: the process imports the bot,
+waits at the readiness gate and asks the first question. Two cases are measured:
+the redeployment, when tasks of the previous upload are served at once, and the first
+deployment, when the bot waits for the first batch of the upload. The upload keeps
+writing batches until the first reply, so it competes for Redis all the time.
+
+Time to the first reply is counted from spawning the process, so it includes the start
+of the interpreter; times of importing the bot, passing the gate and asking the question
+are reported by the process itself. Medians over repeated runs are reported.
+The process stops short of main() of the bot, which needs the platform to start,
+see benchmarks/first_reply.py, so timings are lower bounds of the real start.
+A throwaway Redis server without persistence is started on a unix socket,
+so the benchmark needs no network and doesn't touch data of the bots.
+
+Run it with: python -m benchmarks.startup --repeats 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from redis import Redis
+
+from benchmarks.first_reply import BOT_MODULES
+from benchmarks.load import (
+    ANSWER_TEXT, DEFAULT_REDIS_SERVER, QUESTION_TEXT, populate_tasks, run_redis_server,
+)
+from bots.constants import TASKS_DATABASE
+from bots.readiness import count_uploaded_file, finish_upload_progress, start_upload_progress
+from bots.task_store import add_task, allocate_task_ids, bump_tasks_generation
+
+DEFAULT_TASKS = 20000
+DEFAULT_REPEATS = 5
+UPLOAD_BATCH_SIZE = 1000
+UPLOAD_FILES = 1000
+REDEPLOYMENT = 'redeployment'
+FIRST_DEPLOYMENT = 'first'
+STEPS = ('import', 'gate', 'reply')
+FIRST_REPLY = 'first_reply'
+HEADER = '{0:<10} {1:<13} {2:>9} {3:>9} {4:>9} {5:>14}'
+ROW = '{0:<10} {1:<13} {2:>9.1f} {3:>9.1f} {4:>9.1f} {5:>14.1f}'
+
+Timings = Dict[str, float]
+
+
+def upload_tasks(socket_path: str, is_stopped: threading.Event) -> None:
+    """Write batches of synthetic tasks publishing progress until the upload is stopped.
+
+    Args:
+        socket_path: path to the socket of Redis server.
+        is_stopped: event set once the first reply is received.
+    """
+    tasks_db = Redis(unix_socket_path=socket_path, db=TASKS_DATABASE)
+    start_upload_progress(tasks_db, UPLOAD_FILES)
+    pipeline = tasks_db.pipeline(transaction=False)
+    while not is_stopped.is_set():
+        for task_id in allocate_task_ids(tasks_db, UPLOAD_BATCH_SIZE):
+            add_task(
+                pipeline,
+                task_id,
+                QUESTION_TEXT.format(task_id=task_id),
+                ANSWER_TEXT.format(task_id=task_id),
+            )
+        count_uploaded_file(pipeline, UPLOAD_BATCH_SIZE)
+        pipeline.execute()
+    bump_tasks_generation(tasks_db)
+    finish_upload_progress(tasks_db, is_successful=True)
+
+
+@contextmanager
+def upload_in_background(socket_path: str) -> Iterator[None]:
+    """Run the upload of synthetic tasks in the thread while the bot is started.
+
+    Args:
+        socket_path: path to the socket of Redis server.
+
+    Yields:
+        Nothing, the upload is stopped on exit.
+    """
+    is_stopped = threading.Event()
+    upload = threading.Thread(target=upload_tasks, args=(socket_path, is_stopped))
+    upload.start()
+    try:
+        yield
+    finally:
+        is_stopped.set()
+        upload.join()
+
+
+def start_bot(bot_name: str, socket_path: str) -> Timings:
+    """Start the bot in a fresh interpreter and wait for its first reply.
+
+    Args:
+        bot_name: "telegram" or "vkontakte".
+        socket_path: path to the socket of Redis server.
+
+    Returns:
+        Milliseconds of every step of the start and of the whole start.
+
+    Raises:
+        RuntimeError: if the bot has failed to reply.
+    """
+    starting_time = time.perf_counter()
+    bot_process = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.first_reply', bot_name, socket_path],
+        capture_output=True,
+        text=True,
+    )
+    first_reply_seconds = time.perf_counter() - starting_time
+    if bot_process.returncode:
+        raise RuntimeError(f'{bot_name} bot has failed to reply:\n{bot_process.stderr}')
+    measured = json.loads(bot_process.stdout)
+    if measured['deferred_loaded']:
+        deferred_modules = ', '.join(measured['deferred_loaded'])
+        print(f'{bot_name} bot has loaded deferred modules: {deferred_modules}.')
+    timings = {step: measured[step] * 1000 for step in STEPS}
+    timings[FIRST_REPLY] = first_reply_seconds * 1000
+    return timings
+
+
+def measure_start(bot_name: str, socket_path: str, tasks: int, deployment: str) -> Timings:
+    """Prepare the database for the deployment and start the bot while tasks are uploaded.
+
+    Args:
+        bot_name: "telegram" or "vkontakte".
+        socket_path: path to the socket of Redis server.
+        tasks: amount of tasks uploaded before the redeployment.
+        deployment: "redeployment" or "first".
+
+    Returns:
+        Milliseconds of every step of the start and of the whole start.
+    """
+    if deployment == REDEPLOYMENT:
+        populate_tasks(socket_path, tasks)
+    else:
+        Redis(unix_socket_path=socket_path).flushall()
+    with upload_in_background(socket_path):
+        return start_bot(bot_name, socket_path)
+
+
+def get_median_timings(runs: List[Timings]) -> Timings:
+    """Take median of every timing over runs.
+
+    Args:
+        runs: timings of every run.
+
+    Returns:
+        Median timings.
+    """
+    return {
+        step: statistics.median(timings[step] for timings in runs)
+        for step in runs[0]
+    }
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parse arguments of the script.
+
+    Returns:
+        Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark of the cold start of the bots.')
+    parser.add_argument(
+        '--tasks', type=int, default=DEFAULT_TASKS, help='tasks uploaded before redeployment',
+    )
+    parser.add_argument(
+        '--repeats', type=int, default=DEFAULT_REPEATS, help='runs to take median of timings over',
+    )
+    parser.add_argument(
+        '--redis-server', default=DEFAULT_REDIS_SERVER, help='path to redis-server executable',
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run the benchmark as script printing median timings in milliseconds."""
+    arguments = parse_arguments()
+    print(HEADER.format('Bot', 'Deployment', 'Import', 'Gate', 'Reply', 'First reply'))
+    with run_redis_server(arguments.redis_server) as socket_path:
+        for bot_name in BOT_MODULES:
+            for deployment in (REDEPLOYMENT, FIRST_DEPLOYMENT):
+                timings = get_median_timings([
+                    measure_start(bot_name, socket_path, arguments.tasks, deployment)
+                    for _ in range(arguments.repeats)
+                ])
+                print(ROW.format(
+                    bot_name, deployment, *(timings[step] for step in STEPS), timings[FIRST_REPLY],
+                ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Module with the executor checking answers apart from threads handling messages.
+
+Fuzzy matching of long answers takes milliseconds of CPU, which would hold the worker
+thread of the telegram bot or the event loop of the vkontakte bot. Such answers are checked
+in the pool of threads or processes chosen with ANSWER_EXECUTOR environmental, while short
+answers, which are matched faster than they would be passed to the pool, are checked inline.
+The timeout bounds both waiting in the pool and matching which has started. Telegram handlers
+run on the worker pool of the dispatcher, so the answer which hasn't been taken by the pool
+in time is taken back and checked inline there: the saturated pool delays the check instead
+of rejecting the right answer. The event loop of the vkontakte bot is never used for matching
+long answers, so such answer is reported as not checked instead, and the user is asked to send
+it again. Matching which has started but hasn't finished within another timeout is left
+to the pool and reported as not checked too. Latency of matching is recorded along with
+the time the answer has waited in the pool, which shows whether the pool should be grown.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent import futures
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from bots.check_answer import is_correct_answer
+from bots.constants import (
+    ANSWER_CHECK_TIMEOUT, ANSWER_EXECUTOR, ANSWER_EXECUTOR_WORKERS, ANSWER_INLINE_LENGTH,
+    ANSWER_MATCHER,
+)
+from bots.metrics import ANSWER_CHECK_STAGE, EXECUTOR_STAGE, count_error, measure, observe
+
+logger = logging.getLogger(__name__)
+
+INLINE_EXECUTOR = 'inline'
+THREAD_EXECUTOR = 'thread'
+PROCESS_EXECUTOR = 'process'
+EXECUTOR_THREAD_PREFIX = 'answer_check'
+
+
+def check_answer_timed(
+    users_answer: str, correct_answer: str, is_normalised: bool,
+) -> Tuple[bool, float]:
+    """Check answer measuring the latency of matching where it is performed.
+
+    Args:
+        users_answer: answer received from user.
+        correct_answer: answer for the task.
+        is_normalised: whether the correct answer has been normalised already.
+
+    Returns:
+        True if answer is correct else False and seconds the matching has taken.
+    """
+    starting_time = time.perf_counter()
+    is_correct = is_correct_answer(users_answer, correct_answer, is_normalised=is_normalised)
+    return is_correct, time.perf_counter() - starting_time
+
+
+def create_executor(kind: str, workers: int) -> Optional[futures.Executor]:
+    """Create pool checking answers.
+
+    Machinery of process pools is loaded only if they are chosen.
+
+    Args:
+        kind: "inline", "thread" or "process".
+        workers: amount of threads or processes in the pool.
+
+    Returns:
+        Pool of the kind or None if answers are checked inline.
+
+    Raises:
+        ValueError: if there is no such kind of executor.
+    """
+    if kind == INLINE_EXECUTOR:
+        return None
+    if kind == THREAD_EXECUTOR:
+        return futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=EXECUTOR_THREAD_PREFIX,
+        )
+    if kind == PROCESS_EXECUTOR:
+        return futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+        )
+    available_kinds = ', '.join((INLINE_EXECUTOR, THREAD_EXECUTOR, PROCESS_EXECUTOR))
+    raise ValueError(f'Unknown answer executor {kind}, available are: {available_kinds}.')
+
+
+class AnswerExecutor(object):
+    """Class checking answers inline or in the pool with the timeout."""
+
+    def __init__(
+        self,
+        kind: str = ANSWER_EXECUTOR,
+        workers: int = ANSWER_EXECUTOR_WORKERS,
+        timeout: float = ANSWER_CHECK_TIMEOUT,
+        inline_length: int = ANSWER_INLINE_LENGTH,
+    ) -> None:
+        """Create the pool of the kind.
+
+        Args:
+            kind: "inline", "thread" or "process".
+            workers: amount of threads or processes in the pool.
+            timeout: seconds the answer could wait in the pool before it is checked inline.
+            inline_length: maximum total length of answers checked inline.
+        """
+        self.kind = kind
+        self.executor = create_executor(kind, workers)
+        self.timeout = timeout
+        self.inline_length = inline_length
+
+    def is_inline(self, users_answer: str, correct_answer: str) -> bool:
+        """Decide whether the answer is short enough to be checked inline.
+
+        Args:
+            users_answer: answer received from user.
+            correct_answer: answer for the task.
+
+        Returns:
+            True if answer should be checked inline else False.
+        """
+        answers_length = len(users_answer) + len(correct_answer)
+        return self.executor is None or answers_length <= self.inline_length
+
+    def check_inline(self, users_answer: str, correct_answer: str, is_normalised: bool) -> bool:
+        """Check answer in the current thread.
+
+        Args:
+            users_answer: answer received from user.
+            correct_answer: answer for the task.
+            is_normalised: whether the correct answer has been normalised already.
+
+        Returns:
+            True if answer is correct else False.
+        """
+        with measure(ANSWER_CHECK_STAGE, ANSWER_MATCHER):
+            return is_correct_answer(users_answer, correct_answer, is_normalised=is_normalised)
+
+    def check(
+        self, users_answer: str, correct_answer: str, is_normalised: bool = False,
+    ) -> Optional[bool]:
+        """Check answer waiting for the pool in the current thread.
+
+        Args:
+            users_answer: answer received from user.
+            correct_answer: answer for the task.
+            is_normalised: whether the correct answer has been normalised already.
+
+        Returns:
+            True if answer is correct, False if it isn't, None if it hasn't been checked in time.
+        """
+        if self.executor is None or self.is_inline(users_answer, correct_answer):
+            return self.check_inline(users_answer, correct_answer, is_normalised)
+        submitting_time = time.perf_counter()
+        future = self.executor.submit(
+            check_answer_timed, users_answer, correct_answer, is_normalised,
+        )
+        finished, _ = futures.wait({future}, timeout=self.timeout)
+        if not finished and future.cancel():
+            self._count_timeout()
+            return self.check_inline(users_answer, correct_answer, is_normalised)
+        if not finished:
+            finished, _ = futures.wait({future}, timeout=self.timeout)
+        if not finished:
+            self._count_timeout()
+            return None
+        is_correct, matching_seconds = future.result()
+        self._record(submitting_time, matching_seconds)
+        return is_correct
+
+    async def check_async(
+        self, users_answer: str, correct_answer: str, is_normalised: bool = False,
+    ) -> Optional[bool]:
+        """Check answer without blocking the event loop while it is checked in the pool.
+
+        Args:
+            users_answer: answer received from user.
+            correct_answer: answer for the task.
+            is_normalised: whether the correct answer has been normalised already.
+
+        Returns:
+            True if answer is correct, False if it isn't, None if it hasn't been checked in time.
+        """
+        if self.executor is None or self.is_inline(users_answer, correct_answer):
+            return self.check_inline(users_answer, correct_answer, is_normalised)
+        submitting_time = time.perf_counter()
+        future = self.executor.submit(
+            check_answer_timed, users_answer, correct_answer, is_normalised,
+        )
+        checking = asyncio.wrap_future(future)
+        finished, _ = await asyncio.wait({checking}, timeout=self.timeout)
+        if not (finished or future.cancel()):
+            finished, _ = await asyncio.wait({checking}, timeout=self.timeout)
+        if not finished:
+            self._count_timeout()
+            return None
+        is_correct, matching_seconds = checking.result()
+        self._record(submitting_time, matching_seconds)
+        return is_correct
+
+    def _record(self, submitting_time: float, matching_seconds: float) -> None:
+        observe(ANSWER_CHECK_STAGE, ANSWER_MATCHER, matching_seconds)
+        waiting_seconds = time.perf_counter() - submitting_time - matching_seconds
+        observe(EXECUTOR_STAGE, self.kind, max(waiting_seconds, 0))
+
+    def _count_timeout(self) -> None:
+        logger.warning(f'Answer has not been checked in the pool in {self.timeout} seconds.')
+        count_error(EXECUTOR_STAGE, self.kind)
+        observe(EXECUTOR_STAGE, self.kind, self.timeout)
+
+
+@lru_cache(maxsize=None)
+def get_answer_executor() -> AnswerExecutor:
+    """Get executor of answers shared within the process.
+
+    Returns:
+        Executor configured with environmentals.
+    """
+    return AnswerExecutor()
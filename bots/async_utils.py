@@ -0,0 +1,39 @@
+"""Module with helpers for concurrent handling of events in asyncio."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable
+
+
+class KeyedLock(object):
+    """Class with locks per key, which are dropped when nobody holds or waits for them.
+
+    Locks are acquired in the order of requests, so actions with the same key
+    are performed one by one in the order they have been started.
+    """
+
+    def __init__(self) -> None:
+        """Create keyed lock."""
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        """Hold lock for the key.
+
+        Args:
+            key: key to be locked.
+
+        Yields:
+            Nothing, lock is held inside the context.
+        """
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                self._locks.pop(key)
+                self._waiters.pop(key)
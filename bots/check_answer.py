@@ -1,13 +1,195 @@
-"""Function for checking the correctness of the answers."""
+"""Function for checking the correctness of the answers.
+
+Matcher of normalised answers is chosen with ANSWER_MATCHER environmental.
+It could be "difflib" for ratio of difflib.SequenceMatcher, "indel" for Indel
+(Levenshtein without substitutions) ratio in pure Python or "rapidfuzz" for Indel ratio
+implemented in C which requires optional rapidfuzz package. The package is imported only
+when its matcher is used, so bots using other matchers start without loading it.
+"""
 
 import re
 import string
 from difflib import SequenceMatcher
+from functools import lru_cache
+from importlib import import_module
+from importlib.util import find_spec
+from typing import Callable, Dict
+
+from bots.constants import ANSWER_MATCHER
 
 STRING_EQUALITY_RATIO = 0.7
+NORMALISED_ANSWERS_CACHE_SIZE = 4096
+COMMENT_PATTERN = re.compile(r'\s?\(.+\)|\s?\[.+]')
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+RAPIDFUZZ_SCALE = 100
+RAPIDFUZZ_PACKAGE = 'rapidfuzz'
+RAPIDFUZZ_MODULE = 'rapidfuzz.fuzz'
+
+Matcher = Callable[[str, str, float], bool]
+
+
+def normalise_answer(answer: str) -> str:
+    """Bring answer to lower case and remove punctuation symbols from it.
+
+    Args:
+        answer: text of the answer.
+
+    Returns:
+        Normalised answer.
+    """
+    return answer.lower().translate(PUNCTUATION_TABLE)
+
+
+@lru_cache(maxsize=NORMALISED_ANSWERS_CACHE_SIZE)
+def normalise_correct_answer(correct_answer: str) -> str:
+    """Remove comments in brackets [] or () from answer from the database and normalise it.
+
+    Result is cached, so repeated attempts to answer the same question don't normalise it again.
+    Cache is keyed by the answer itself rather than by task ID since IDs are reused
+    when the tasks are uploaded again.
+
+    Args:
+        correct_answer: answer from the database.
+
+    Returns:
+        Normalised answer.
+    """
+    return normalise_answer(COMMENT_PATTERN.sub('', correct_answer))
+
+
+def match_with_difflib(correct_answer: str, users_answer: str, threshold: float) -> bool:
+    """Check if ratio of difflib.SequenceMatcher reaches the threshold.
+
+    Cheap upper bounds of the ratio are checked first to reject wrong answers early.
+
+    Args:
+        correct_answer: normalised answer from the database.
+        users_answer: normalised answer received from user.
+        threshold: minimal ratio for answers to match.
+
+    Returns:
+        True if answers match else False.
+    """
+    matcher = SequenceMatcher(None, correct_answer, users_answer)
+    ratios = (matcher.real_quick_ratio, matcher.quick_ratio, matcher.ratio)
+    return all(ratio() >= threshold for ratio in ratios)
+
+
+def count_set_bits(bit_vector: int) -> int:
+    """Count set bits of the integer.
+
+    Args:
+        bit_vector: non-negative integer.
+
+    Returns:
+        Amount of set bits.
+    """
+    return bin(bit_vector).count('1')
+
+
+def get_symbols_positions(text: str) -> Dict[str, int]:
+    """Get positions of every symbol in the text as bit vectors.
+
+    Args:
+        text: text to be indexed.
+
+    Returns:
+        Bit vectors where bit is set for every position of the symbol.
+    """
+    symbols_positions: Dict[str, int] = {}
+    for position, symbol in enumerate(text):
+        symbols_positions[symbol] = symbols_positions.get(symbol, 0) | (1 << position)
+    return symbols_positions
+
+
+def match_with_indel(correct_answer: str, users_answer: str, threshold: float) -> bool:
+    """Check if Indel ratio reaches the threshold.
+
+    Indel ratio is 2 * LCS / total length, where LCS is length of the longest common subsequence.
+    LCS is calculated with bit-parallel algorithm, so each symbol of the correct answer costs
+    a few operations on integers instead of a row of the dynamic programming matrix.
+    Calculation stops as soon as the rest of the correct answer can't bring ratio to threshold.
+
+    Args:
+        correct_answer: normalised answer from the database.
+        users_answer: normalised answer received from user.
+        threshold: minimal ratio for answers to match.
+
+    Returns:
+        True if answers match else False.
+    """
+    total_length = len(correct_answer) + len(users_answer)
+    if not total_length:
+        return True
+    required_lcs = threshold * total_length / 2
+    if min(len(correct_answer), len(users_answer)) < required_lcs:
+        return False
+    symbols_positions = get_symbols_positions(users_answer)
+    full_mask = (1 << len(users_answer)) - 1
+    unmatched = full_mask
+    symbols_left = len(correct_answer)
+    for correct_symbol in correct_answer:
+        symbols_left -= 1
+        matched = unmatched & symbols_positions.get(correct_symbol, 0)
+        unmatched = ((unmatched + matched) | (unmatched - matched)) & full_mask
+        lcs = len(users_answer) - count_set_bits(unmatched)
+        if lcs + symbols_left < required_lcs:
+            return False
+    return 2 * lcs / total_length >= threshold
+
+
+def match_with_rapidfuzz(correct_answer: str, users_answer: str, threshold: float) -> bool:
+    """Check if Indel ratio calculated by rapidfuzz reaches the threshold.
+
+    Args:
+        correct_answer: normalised answer from the database.
+        users_answer: normalised answer received from user.
+        threshold: minimal ratio for answers to match.
+
+    Returns:
+        True if answers match else False.
+    """
+    score_cutoff = threshold * RAPIDFUZZ_SCALE
+    rapidfuzz = import_module(RAPIDFUZZ_MODULE)
+    score = rapidfuzz.ratio(correct_answer, users_answer, score_cutoff=score_cutoff)
+    return score >= score_cutoff
+
+
+def get_available_matchers() -> Dict[str, Matcher]:
+    """Get matchers which could be used in current environment.
+
+    Returns:
+        Matchers by their names.
+    """
+    matchers: Dict[str, Matcher] = {'difflib': match_with_difflib, 'indel': match_with_indel}
+    if find_spec(RAPIDFUZZ_PACKAGE) is not None:
+        matchers['rapidfuzz'] = match_with_rapidfuzz
+    return matchers
+
+
+def get_matcher(name: str) -> Matcher:
+    """Get matcher by its name.
+
+    Args:
+        name: name of the matcher.
+
+    Returns:
+        Matcher function.
+
+    Raises:
+        ValueError: if there is no such matcher or it could not be used in current environment.
+    """
+    available_matchers = get_available_matchers()
+    if name not in available_matchers:
+        available_names = ', '.join(available_matchers)
+        raise ValueError(f'Unknown answer matcher {name}, available are: {available_names}.')
+    return available_matchers[name]
+
+
+answer_matcher = get_matcher(ANSWER_MATCHER)
 
 
-def is_correct_answer(users_answer: str, correct_answer: str) -> bool:
+def is_correct_answer(users_answer: str, correct_answer: str, is_normalised: bool = False) -> bool:
     """Check if answer given by user is correct.
 
     Comments in brackets [] or () aren't taken into consideration when counting string match ratio.
@@ -16,16 +198,11 @@ def is_correct_answer(users_answer: str, correct_answer: str) -> bool:
     Args:
         users_answer: answer received from user.
         correct_answer: answer from the database.
+        is_normalised: whether the correct answer has been normalised already.
 
     Returns:
         True if answer is correct else False.
     """
-    commentless_answer = re.sub(r'\s?\(.+\)|\s?\[.+]', '', correct_answer)
-    filtered_correct_answer = ''.join(
-        [symbol for symbol in commentless_answer.lower() if symbol not in string.punctuation],
-    )
-    filtered_users_answer = ''.join(
-        [symbol for symbol in users_answer.lower() if symbol not in string.punctuation],
-    )
-    matching_ratio = SequenceMatcher(None, filtered_correct_answer, filtered_users_answer).ratio()
-    return matching_ratio >= STRING_EQUALITY_RATIO
+    if not is_normalised:
+        correct_answer = normalise_correct_answer(correct_answer)
+    return answer_matcher(correct_answer, normalise_answer(users_answer), STRING_EQUALITY_RATIO)
@@ -1,7 +1,16 @@
-"""Module with common constants of the project."""
+"""Module with common constants of the project.
+
+Environmentals are read once the module is imported, so the .env file is loaded here
+before any of them are read, whichever script is run.
+"""
 
 import os
 from enum import Enum
+from types import MappingProxyType
+
+from dotenv import load_dotenv
+
+load_dotenv()
 
 
 class ButtonText(Enum):
@@ -10,36 +19,97 @@ class ButtonText(Enum):
     QUESTION = 'Новый вопрос'
     GIVE_UP = 'Сдаться'
     SCORE = 'Мой счёт'
+    LEADERBOARD = 'Рейтинг'
+
 
+QUIZ_BUTTONS_HELP = f"""Нажмите "{ButtonText.QUESTION.value}" для начала викторины.
+Нажмите "{ButtonText.GIVE_UP.value}", чтобы узнать правильный ответ."""
 
-PICTURE_INDICATOR = '(pic:'
-QUESTION_REGEX = r'^Вопрос.+\n'
-ANSWER_REGEX = r'^Ответ.+\n'
+SCORE_BUTTONS_HELP = f"""Узнать счёт можно нажав "{ButtonText.SCORE.value}".
+Лучших игроков можно увидеть нажав "{ButtonText.LEADERBOARD.value}"."""
 
-GREETING_VK = f"""Приветствуем вас в нашей викторине!
-Нажмите "{ButtonText.QUESTION.value}" для начала викторины.
-Нажмите "{ButtonText.GIVE_UP.value}", чтобы узнать правильный ответ.
-Узнать счёт можно нажав "{ButtonText.SCORE.value}"."""
+BUTTONS_HELP = f'{QUIZ_BUTTONS_HELP}\n{SCORE_BUTTONS_HELP}'
+
+THEME_HELP = """/theme ТЕМА - задавать вопросы турнира (например, /theme harbr04o)
+или со словами из вопроса.
+/theme - задавать вопросы всех турниров."""
+
+GREETING_VK = f'Приветствуем вас в нашей викторине!\n{BUTTONS_HELP}\n{THEME_HELP}'
 
 GREETING_TG = 'Приветствуем вас в нашей викторине, {user}!\n{help}'
 
-HELP_TEXT = f"""Нажмите "{ButtonText.QUESTION.value}" для начала викторины.
-Нажмите "{ButtonText.GIVE_UP.value}", чтобы узнать правильный ответ.
-Узнать счёт можно нажав "{ButtonText.SCORE.value}".
+HELP_TEXT = f"""{BUTTONS_HELP}
+{THEME_HELP}
 /cancel - закончить викторину.
 /help - получить справку о функционале бота."""
 
 SCORE_TEXT = 'Правильных ответов: {successes}.\nНеугадано вопросов: {give_ups}.'
 
+LEADERBOARD_TITLE = 'Лучшие игроки:'
+LEADERBOARD_ROW = '{place}. {name} — {successes}'
+LEADERBOARD_EMPTY = 'В рейтинге пока никого нет.'
+LEADERBOARD_PLACE = 'Ваше место: {place}, правильных ответов: {successes}.'
+LEADERBOARD_NO_PLACE = 'Ответьте правильно хотя бы на один вопрос, чтобы попасть в рейтинг.'
+ANONYMOUS_PLAYER = 'Игрок'
+ANONYMOUS_PLAYERS = MappingProxyType({'tg': 'Игрок из Telegram', 'vk': 'Игрок из ВКонтакте'})
+
 CANCEL_TEXT = """Спасибо за участие в квизе! Ваш прогресс сохранён.
 Для возобновления отправьте команду /start."""
 
 NEXT = f'Для следующего вопроса нажмите "{ButtonText.QUESTION.value}".'
 RIGHT_ANSWER = f'Правильно, поздравляю! {NEXT}'
 WRONG_ANSWER = 'Ответ неверный, попробуйте ещё раз.'
+ANSWER_NOT_CHECKED = 'Не успели проверить ответ, пожалуйста, отправьте его ещё раз.'
 GIVE_UP = 'Правильный ответ:\n{answer}\n{next}'
 NO_QUESTION_STUB = f'Вопрос ещё не был задан! Пожалуйста, нажмите {ButtonText.QUESTION.value}!'
+NO_TASKS_STUB = 'Вопросы для викторины ещё не загружены, попробуйте позже.'
+
+THEME_COMMAND = 'theme'
+THEME_CHOSEN = f'Тема «{{theme}}»: вопросов найдено {{size}}. {NEXT}'
+THEME_NOT_FOUND = 'Вопросов на тему «{theme}» не нашлось, тема не изменилась.'
+THEME_RESET = f'Тема сброшена, вопросы снова задаются из всех турниров. {NEXT}'
 
 TASKS_DATABASE = 1
 USERS_DATABASE = 2
+MANIFEST_DATABASE = 3
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT') or '6379')
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS') or '100')
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT') or '5')
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT') or '1')
+REDIS_RETRIES = int(os.getenv('REDIS_RETRIES') or '6')
+REDIS_BACKOFF_BASE = float(os.getenv('REDIS_BACKOFF_BASE') or '0.005')
+REDIS_BACKOFF_CAP = float(os.getenv('REDIS_BACKOFF_CAP') or '1')
+REDIS_SENTINELS = os.getenv('REDIS_SENTINELS', '')
+REDIS_SENTINEL_SERVICE = os.getenv('REDIS_SENTINEL_SERVICE') or 'mymaster'
+ANSWER_MATCHER = os.getenv('ANSWER_MATCHER') or 'difflib'
+ANSWER_EXECUTOR = os.getenv('ANSWER_EXECUTOR') or 'thread'
+ANSWER_EXECUTOR_WORKERS = int(os.getenv('ANSWER_EXECUTOR_WORKERS') or '2')
+ANSWER_CHECK_TIMEOUT = float(os.getenv('ANSWER_CHECK_TIMEOUT') or '1')
+ANSWER_INLINE_LENGTH = int(os.getenv('ANSWER_INLINE_LENGTH') or '64')
+ANSWERS_CACHE_SIZE = int(os.getenv('ANSWERS_CACHE_SIZE') or '10000')
+ANSWERS_CACHE_TTL = float(os.getenv('ANSWERS_CACHE_TTL') or '3600')
+QUIZ_CORPUS_PATH = os.getenv('QUIZ_CORPUS_PATH', '')
+READINESS_TIMEOUT = float(os.getenv('READINESS_TIMEOUT') or '300')
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE') or '10')
+LEADERBOARD_CACHE_TTL = float(os.getenv('LEADERBOARD_CACHE_TTL') or '5')
+THEME_CACHE_TTL = int(os.getenv('THEME_CACHE_TTL') or '600')
+METRICS_LISTEN = os.getenv('METRICS_LISTEN') or '127.0.0.1'
+TELEGRAM_METRICS_PORT = int(os.getenv('TELEGRAM_METRICS_PORT') or '9101')
+VK_METRICS_PORT = int(os.getenv('VK_METRICS_PORT') or '9102')
+VK_CONCURRENT_EVENTS = int(os.getenv('VK_CONCURRENT_EVENTS') or '100')
+VK_MESSAGES_PER_SECOND = float(os.getenv('VK_MESSAGES_PER_SECOND') or '20')
+VK_WORKERS = int(os.getenv('VK_WORKERS') or '1')
+VK_WORKER_QUEUE_SIZE = int(os.getenv('VK_WORKER_QUEUE_SIZE') or '1000')
+TELEGRAM_MESSAGES_PER_SECOND = float(os.getenv('TELEGRAM_MESSAGES_PER_SECOND') or '30')
+CHAT_MESSAGES_PER_SECOND = float(os.getenv('CHAT_MESSAGES_PER_SECOND') or '1')
+CHAT_MESSAGES_BURST = int(os.getenv('CHAT_MESSAGES_BURST') or '3')
+OUTBOX_SIZE = int(os.getenv('OUTBOX_SIZE') or '10000')
+OUTBOX_SENDERS = int(os.getenv('OUTBOX_SENDERS') or '8')
+OUTBOX_RETRIES = int(os.getenv('OUTBOX_RETRIES') or '5')
+TELEGRAM_WORKERS = int(os.getenv('TELEGRAM_WORKERS') or '4')
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')
+TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', '')
+TELEGRAM_WEBHOOK_LISTEN = os.getenv('TELEGRAM_WEBHOOK_LISTEN') or '127.0.0.1'
+TELEGRAM_WEBHOOK_PORT = int(os.getenv('TELEGRAM_WEBHOOK_PORT') or '8080')
+TELEGRAM_PERSISTENCE_FLUSH_INTERVAL = float(os.getenv('TELEGRAM_PERSISTENCE_FLUSH_INTERVAL') or '1')
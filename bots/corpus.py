@@ -0,0 +1,349 @@
+"""Module with precompiled binary corpus of quiz tasks.
+
+The corpus is built from the quiz files once, so they don't have to be parsed on every deploy.
+It is a single file made of the header, the table of UTF-8 strings and arrays of integers:
+offsets of strings in the table, numbers of tasks and records of the source files.
+Every task has the fixed amount of strings, including the pre-normalised answer, so the string
+of the task is found by its ID without any lookups. The file is memory-mapped on opening
+and strings are decoded only when they are requested. The header pins the version of the format
+and the checksum of the rest of the file; the checksum is verified on opening, so the whole file
+is read once then, which also warms the page cache for the first questions.
+The checksum tags questions asked from the corpus, so they are not checked against tasks
+of another build. Integers are little-endian.
+"""
+
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from bots.check_answer import normalise_correct_answer
+from bots.constants import QUIZ_CORPUS_PATH
+from bots.manifest import FileRecord
+from bots.quiz_parser import ParsedFile
+from bots.task_store import TaskText
+
+CORPUS_MAGIC = b'QUIZCORP'
+CORPUS_VERSION = 2
+CORPUS_HEADER = struct.Struct('<8sHHIIIQ')
+CORPUS_ENCODING = 'utf-8'
+OFFSET_TYPE = 'Q'
+NUMBER_TYPE = 'q'
+ARRAY_ALIGNMENT = 8
+TASK_STRINGS = 6
+FILE_STRINGS = 2
+FILE_NUMBERS = 5
+FILE_RECORD_NUMBERS = 3
+QUESTION_STRING = 0
+ANSWER_STRING = 1
+NORMALISED_ANSWER_STRING = 2
+COMMENT_STRING = 3
+SOURCE_STRING = 4
+AUTHOR_STRING = 5
+
+
+class CorpusError(ValueError):
+    """Error raised when the file is not a corpus of the supported version or is damaged."""
+
+
+class CorpusHeader(NamedTuple):
+    """Class with fields of the corpus header."""
+
+    magic: bytes
+    version: int
+    flags: int
+    files_count: int
+    tasks_count: int
+    checksum: int
+    strings_size: int
+
+
+class CorpusFile(NamedTuple):
+    """Class with record of quiz file compiled into the corpus and the range of its tasks."""
+
+    file_name: str
+    file_record: FileRecord
+    first_task: int
+    tasks_count: int
+
+
+def get_padding(size: int) -> bytes:
+    """Get zero bytes aligning arrays placed after the block of the given size.
+
+    Args:
+        size: size of the block in bytes.
+
+    Returns:
+        Padding bytes.
+    """
+    return bytes(-size % ARRAY_ALIGNMENT)
+
+
+class CorpusWriter(object):
+    """Class writing corpus file while parsed files are coming.
+
+    Strings of tasks are written right away, so only integers are kept in memory.
+    """
+
+    def __init__(self, corpus_file: IO[bytes]) -> None:
+        """Init writer reserving place for the header.
+
+        Args:
+            corpus_file: corpus file opened for binary writing.
+        """
+        self.corpus_file = corpus_file
+        self.corpus_file.write(bytes(CORPUS_HEADER.size))
+        self.checksum = 0
+        self.offsets = array(OFFSET_TYPE, [0])
+        self.task_numbers = array(NUMBER_TYPE)
+        self.file_numbers = array(NUMBER_TYPE)
+        self.file_strings: List[str] = []
+
+    def write_bytes(self, raw_bytes: bytes) -> None:
+        """Write bytes after the header updating the checksum.
+
+        Args:
+            raw_bytes: bytes to be written.
+        """
+        self.corpus_file.write(raw_bytes)
+        self.checksum = zlib.crc32(raw_bytes, self.checksum)
+
+    def write_string(self, text: str) -> None:
+        """Append string to the table.
+
+        Args:
+            text: text of the string.
+        """
+        raw_text = text.encode(CORPUS_ENCODING)
+        self.write_bytes(raw_text)
+        self.offsets.append(self.offsets[-1] + len(raw_text))
+
+    def add_file(self, parsed_file: ParsedFile) -> None:
+        """Write tasks of the parsed file.
+
+        Args:
+            parsed_file: parsed quiz file.
+        """
+        first_task = len(self.task_numbers)
+        for task in parsed_file.tasks:
+            self.write_string(task.question)
+            self.write_string(task.answer)
+            self.write_string(normalise_correct_answer(task.answer))
+            self.write_string(task.comment)
+            self.write_string(task.source)
+            self.write_string(task.author)
+            self.task_numbers.append(task.number)
+        file_record = parsed_file.file_record
+        self.file_numbers.extend(
+            (
+                file_record.size,
+                file_record.mtime,
+                file_record.format_version,
+                first_task,
+                len(parsed_file.tasks),
+            ),
+        )
+        self.file_strings.extend((parsed_file.file_name, file_record.digest))
+
+    def finish(self) -> int:
+        """Write strings of files, arrays of integers and the header.
+
+        Returns:
+            Amount of tasks written.
+        """
+        for file_string in self.file_strings:
+            self.write_string(file_string)
+        strings_size = self.offsets[-1]
+        self.write_bytes(get_padding(strings_size))
+        for numbers in (self.offsets, self.task_numbers, self.file_numbers):
+            self.write_bytes(numbers.tobytes())
+        tasks_count = len(self.task_numbers)
+        self.corpus_file.seek(0)
+        corpus_header = CorpusHeader(
+            magic=CORPUS_MAGIC,
+            version=CORPUS_VERSION,
+            flags=0,
+            files_count=len(self.file_strings) // FILE_STRINGS,
+            tasks_count=tasks_count,
+            checksum=self.checksum,
+            strings_size=strings_size,
+        )
+        self.corpus_file.write(CORPUS_HEADER.pack(*corpus_header))
+        return tasks_count
+
+
+def write_corpus(corpus_path: str, parsed_files: Iterable[ParsedFile]) -> int:
+    """Build corpus file from parsed quiz files.
+
+    The corpus is written to the temporary file first, so the previous corpus
+    is replaced only when the new one is complete.
+
+    Args:
+        corpus_path: path to the corpus file.
+        parsed_files: parsed quiz files.
+
+    Returns:
+        Amount of tasks written.
+    """
+    temporary_path = f'{corpus_path}.tmp'
+    with open(temporary_path, 'wb') as corpus_file:
+        corpus_writer = CorpusWriter(corpus_file)
+        for parsed_file in parsed_files:
+            corpus_writer.add_file(parsed_file)
+        tasks_count = corpus_writer.finish()
+    os.replace(temporary_path, corpus_path)
+    return tasks_count
+
+
+def locate_arrays(corpus_header: CorpusHeader) -> Tuple[int, int, int]:
+    """Find where arrays of integers start in the corpus file.
+
+    Args:
+        corpus_header: header of the corpus.
+
+    Returns:
+        Positions of offsets of strings, numbers of tasks and records of files.
+    """
+    strings_size = corpus_header.strings_size
+    offsets_start = CORPUS_HEADER.size + strings_size + len(get_padding(strings_size))
+    strings_count = (
+        corpus_header.tasks_count * TASK_STRINGS + corpus_header.files_count * FILE_STRINGS
+    )
+    numbers_start = offsets_start + (strings_count + 1) * struct.calcsize(OFFSET_TYPE)
+    files_start = numbers_start + corpus_header.tasks_count * struct.calcsize(NUMBER_TYPE)
+    return offsets_start, numbers_start, files_start
+
+
+class QuizCorpus(object):
+    """Class with memory-mapped corpus of quiz tasks.
+
+    IDs of tasks are their positions in the corpus.
+    """
+
+    def __init__(self, corpus_path: str) -> None:
+        """Map the corpus file to memory and check its header.
+
+        Args:
+            corpus_path: path to the corpus file.
+
+        Raises:
+            CorpusError: if the file is not a corpus of the supported version or is damaged.
+        """
+        with open(corpus_path, 'rb') as corpus_file:
+            self.buffer = mmap.mmap(corpus_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.buffer)
+        if len(self.view) < CORPUS_HEADER.size:
+            self.close()
+            raise CorpusError(f'{corpus_path} is too short to be a corpus.')
+        corpus_header = CorpusHeader(*CORPUS_HEADER.unpack_from(self.view))
+        if corpus_header.magic != CORPUS_MAGIC or corpus_header.version != CORPUS_VERSION:
+            self.close()
+            raise CorpusError(f'{corpus_path} is not a corpus of version {CORPUS_VERSION}.')
+        if zlib.crc32(self.view[CORPUS_HEADER.size:]) != corpus_header.checksum:
+            self.close()
+            raise CorpusError(f'Checksum of {corpus_path} does not match, it is damaged.')
+        self.checksum = corpus_header.checksum
+        offsets_start, numbers_start, files_start = locate_arrays(corpus_header)
+        self.offsets = self.view[offsets_start:numbers_start].cast(OFFSET_TYPE)
+        self.task_numbers = self.view[numbers_start:files_start].cast(NUMBER_TYPE)
+        self.file_numbers = self.view[files_start:].cast(NUMBER_TYPE)
+
+    def __len__(self) -> int:
+        """Count tasks in the corpus.
+
+        Returns:
+            Amount of tasks.
+        """
+        return len(self.task_numbers)
+
+    def close(self) -> None:
+        """Release views of the corpus and unmap the file."""
+        for attribute in ('offsets', 'task_numbers', 'file_numbers', 'view'):
+            if (corpus_view := getattr(self, attribute, None)) is not None:
+                corpus_view.release()
+        self.buffer.close()
+
+    def get_string(self, string_index: int) -> str:
+        """Decode string from the table.
+
+        Args:
+            string_index: index of the string.
+
+        Returns:
+            Text of the string.
+        """
+        string_start = CORPUS_HEADER.size + self.offsets[string_index]
+        string_end = CORPUS_HEADER.size + self.offsets[string_index + 1]
+        return str(self.view[string_start:string_end], CORPUS_ENCODING)
+
+    def get_task_string(self, task_id: int, task_string: int) -> Optional[str]:
+        """Decode string of the task, like its question or answer normalised at build time.
+
+        Args:
+            task_id: ID of the task.
+            task_string: index of the string among strings of the task, e.g. QUESTION_STRING.
+
+        Returns:
+            Text of the string or None if there is no such task in the corpus.
+        """
+        if task_id < 0 or task_id >= len(self):
+            return None
+        return self.get_string(task_id * TASK_STRINGS + task_string)
+
+    def iterate_files(self) -> Iterator[CorpusFile]:
+        """Iterate over quiz files compiled into the corpus.
+
+        Yields:
+            Records of files along with ranges of their tasks.
+        """
+        file_strings_start = len(self) * TASK_STRINGS
+        for file_index in range(len(self.file_numbers) // FILE_NUMBERS):
+            numbers_start = file_index * FILE_NUMBERS
+            tasks_start = numbers_start + FILE_RECORD_NUMBERS
+            size, mtime, format_version = self.file_numbers[numbers_start:tasks_start]
+            first_task, tasks_count = self.file_numbers[tasks_start:numbers_start + FILE_NUMBERS]
+            string_index = file_strings_start + file_index * FILE_STRINGS
+            yield CorpusFile(
+                file_name=self.get_string(string_index),
+                file_record=FileRecord(
+                    size=size,
+                    mtime=mtime,
+                    digest=self.get_string(string_index + 1),
+                    format_version=format_version,
+                ),
+                first_task=first_task,
+                tasks_count=tasks_count,
+            )
+
+    def get_task_texts(self, corpus_file: CorpusFile) -> List[TaskText]:
+        """Decode questions and answers of tasks of the quiz file to be uploaded to Redis.
+
+        Other strings of tasks are not decoded.
+
+        Args:
+            corpus_file: record of the file in the corpus.
+
+        Returns:
+            Texts of tasks of the file in the order of their IDs.
+        """
+        last_task = corpus_file.first_task + corpus_file.tasks_count
+        return [
+            TaskText(
+                question=self.get_string(task_id * TASK_STRINGS + QUESTION_STRING),
+                answer=self.get_string(task_id * TASK_STRINGS + ANSWER_STRING),
+            )
+            for task_id in range(corpus_file.first_task, last_task)
+        ]
+
+
+def open_configured_corpus() -> Optional[QuizCorpus]:
+    """Open the corpus bots should serve tasks from if it is configured.
+
+    Returns:
+        Corpus from QUIZ_CORPUS_PATH or None if tasks are served from Redis.
+    """
+    if not QUIZ_CORPUS_PATH:
+        return None
+    return QuizCorpus(QUIZ_CORPUS_PATH)
@@ -0,0 +1,162 @@
+"""Module with the leaderboard shared by users of both bots.
+
+Users are ranked by their successes in the sorted set of the users database, which is updated
+by the same script that counts the success, so the rank of the user and the top of the leaderboard
+are read in O(log N) without scanning users. Users who had answered right before
+the leaderboard appeared are added to it once by the upload script, users still saved
+as JSON strings are added once they request the leaderboard.
+The rendered top of the leaderboard is cached by every bot process for a short time,
+so only the place of the user is read while the cached top is fresh.
+"""
+
+import time
+from itertools import islice
+from typing import Any, List, Optional
+
+from redis import Redis
+
+from bots.constants import (
+    ANONYMOUS_PLAYER, ANONYMOUS_PLAYERS, LEADERBOARD_CACHE_TTL, LEADERBOARD_EMPTY,
+    LEADERBOARD_NO_PLACE, LEADERBOARD_PLACE, LEADERBOARD_ROW, LEADERBOARD_SIZE, LEADERBOARD_TITLE,
+)
+
+LEADERBOARD_KEY = 'leaderboard'
+LEADERBOARD_BACKFILLED_KEY = 'leaderboard:backfilled'
+USERS_KEYS_PATTERN = 'user_*'
+SUCCESS_FIELD = 'success'
+BACKFILL_BATCH_SIZE = 1000
+USER_KEY_SEPARATOR = '_'
+LEADER_FIELDS = 3
+
+
+def get_player_name(user_key: str, name: Optional[str]) -> str:
+    """Get name of the user shown in the leaderboard.
+
+    Args:
+        user_key: key of the user in users database, like user_tg_1.
+        name: name saved by the bot if it is known.
+
+    Returns:
+        Name of the user or title of anonymous player of his platform.
+    """
+    if name:
+        return name
+    platform = user_key.split(USER_KEY_SEPARATOR)[1]
+    return ANONYMOUS_PLAYERS.get(platform, ANONYMOUS_PLAYER)
+
+
+def render_leaders(leaders: List[Optional[str]]) -> str:
+    """Render top of the leaderboard.
+
+    Args:
+        leaders: keys, names and successes of the best users one after another.
+
+    Returns:
+        Text with the best users and their successes.
+    """
+    if not leaders:
+        return LEADERBOARD_EMPTY
+    rows = [LEADERBOARD_TITLE]
+    for index in range(0, len(leaders), LEADER_FIELDS):
+        user_key, name, successes = leaders[index:index + LEADER_FIELDS]
+        rows.append(LEADERBOARD_ROW.format(
+            place=index // LEADER_FIELDS + 1,
+            name=get_player_name(str(user_key), name),
+            successes=int(successes or 0),
+        ))
+    return '\n'.join(rows)
+
+
+def render_place(successes: int, rank: int) -> str:
+    """Render place of the user in the leaderboard.
+
+    Args:
+        successes: successes of the user.
+        rank: zero-based rank of the user or -1 if he isn't ranked.
+
+    Returns:
+        Text with the place of the user.
+    """
+    if rank < 0:
+        return LEADERBOARD_NO_PLACE
+    return LEADERBOARD_PLACE.format(place=rank + 1, successes=successes)
+
+
+def backfill_leaderboard(users_db: Redis) -> int:
+    """Add users who had answered right before the leaderboard appeared to it.
+
+    It is done once for the users database: the flag is set once all users are added.
+    Successes are added with GT, so users whose successes are counted by bots meanwhile
+    don't lose their place.
+
+    Args:
+        users_db: connector to users database decoding responses.
+
+    Returns:
+        Amount of users added or zero if the leaderboard has been backfilled before.
+    """
+    if users_db.exists(LEADERBOARD_BACKFILLED_KEY):
+        return 0
+    backfilled = 0
+    user_keys = users_db.scan_iter(
+        match=USERS_KEYS_PATTERN, _type='hash', count=BACKFILL_BATCH_SIZE,
+    )
+    while (users_batch := list(islice(user_keys, BACKFILL_BATCH_SIZE))):
+        pipeline = users_db.pipeline(transaction=False)
+        for user_key in users_batch:
+            pipeline.hget(user_key, SUCCESS_FIELD)
+        leaders = {
+            leader_key: int(successes)
+            for leader_key, successes in zip(users_batch, pipeline.execute())
+            if int(successes or 0) > 0
+        }
+        if leaders:
+            users_db.zadd(LEADERBOARD_KEY, leaders, gt=True)
+        backfilled += len(leaders)
+    users_db.set(LEADERBOARD_BACKFILLED_KEY, 1)
+    return backfilled
+
+
+class LeaderboardPage(object):
+    """Class with rendered top of the leaderboard kept for a short time.
+
+    Concurrent handlers could render the page twice once it expires, which is harmless.
+    The empty page isn't kept, so the first users appear in the leaderboard at once.
+    """
+
+    def __init__(self, size: int = LEADERBOARD_SIZE, ttl: float = LEADERBOARD_CACHE_TTL) -> None:
+        """Create empty page.
+
+        Args:
+            size: amount of the best users shown.
+            ttl: seconds the rendered page is kept for.
+        """
+        self.size = size
+        self.ttl = ttl
+        self.text = ''
+        self.expires_at = float('-inf')
+
+    def get_size_to_read(self) -> int:
+        """Get amount of the best users to be read from Redis.
+
+        Returns:
+            Size of the page or zero if the rendered page is still fresh.
+        """
+        return 0 if time.monotonic() < self.expires_at else self.size
+
+    def render(self, leaderboard: List[Any]) -> str:
+        """Render the leaderboard for the user, rendering the top again if it has been read.
+
+        Args:
+            leaderboard: successes and rank of the user and the best users if they have been read.
+
+        Returns:
+            Text with the best users and place of the user.
+        """
+        successes, rank, leaders = leaderboard
+        if leaders is not None:
+            self.text = render_leaders(leaders)
+            if leaders:
+                self.expires_at = time.monotonic() + self.ttl
+        place = render_place(int(successes), int(rank))
+        return f'{self.text}\n\n{place}'
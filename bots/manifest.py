@@ -0,0 +1,165 @@
+"""Module with manifest of quiz files which have been uploaded to Redis.
+
+Every record keeps the version of the format tasks were parsed and stored in,
+so all files are uploaded again once the parser or the layout of tasks is changed.
+Before tasks of the file are written, its record is saved as pending with IDs
+of both old and new tasks, so the file is uploaded again if the upload crashes
+and no ID is left without the file it belongs to.
+"""
+
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from redis import Redis
+from redis.client import Pipeline
+
+MANIFEST_KEY = 'quiz_manifest'
+FILE_TASKS_KEY = 'quiz_manifest:tasks:{file_name}'
+RECORD_SEPARATOR = ':'
+DIGEST_ALGORITHM = 'sha256'
+TASKS_FORMAT_VERSION = 2
+LEGACY_FORMAT_VERSION = 0
+PENDING_FORMAT_VERSION = -1
+
+
+class FileRecord(NamedTuple):
+    """Class with state of quiz file at the moment of its uploading."""
+
+    size: int
+    mtime: int
+    digest: str = ''
+    format_version: int = TASKS_FORMAT_VERSION
+
+    def is_modified(self, saved_record: Optional['FileRecord']) -> bool:
+        """Check if file could have been modified since the saved record was made.
+
+        Only size, modification time and format version are compared, so file is not read.
+
+        Args:
+            saved_record: record from the manifest if there is one.
+
+        Returns:
+            True if file is new, its size or modification time differ
+            or it was uploaded in another format else False.
+        """
+        if saved_record is None:
+            return True
+        return (self.size, self.mtime, self.format_version) != (
+            saved_record.size, saved_record.mtime, saved_record.format_version,
+        )
+
+    def is_content_changed(self, saved_record: Optional['FileRecord']) -> bool:
+        """Check if content of the file differs from the content it had when the record was saved.
+
+        Args:
+            saved_record: record from the manifest if there is one.
+
+        Returns:
+            True if file is new, its content hash differs or it was uploaded in another format
+            else False.
+        """
+        if saved_record is None:
+            return True
+        return (self.digest, self.format_version) != (
+            saved_record.digest, saved_record.format_version,
+        )
+
+
+def mark_pending(file_record: FileRecord) -> FileRecord:
+    """Make record of the file which tasks are being written.
+
+    Args:
+        file_record: record of the file.
+
+    Returns:
+        Record which is always modified compared to the state of the file.
+    """
+    size, mtime, digest, _ = file_record
+    return FileRecord(size, mtime, digest, PENDING_FORMAT_VERSION)
+
+
+def stat_quiz_file(path_to_file: str) -> FileRecord:
+    """Make record of quiz file without calculating its content hash.
+
+    Args:
+        path_to_file: path to file with quiz content.
+
+    Returns:
+        Record with size and modification time of the file.
+    """
+    file_stat = os.stat(path_to_file)
+    return FileRecord(size=file_stat.st_size, mtime=file_stat.st_mtime_ns)
+
+
+def load_manifest(manifest_db: Redis) -> Dict[str, FileRecord]:
+    """Load records of all uploaded files.
+
+    Lists of tasks are not loaded so checking an unchanged corpus stays cheap.
+    Records saved before format versions appeared are loaded with the legacy version.
+
+    Args:
+        manifest_db: connector to manifest database.
+
+    Returns:
+        Records of uploaded files by their names.
+    """
+    manifest = {}
+    for file_name, raw_record in manifest_db.hgetall(MANIFEST_KEY).items():
+        size, mtime, digest, *format_version = raw_record.split(RECORD_SEPARATOR)
+        file_record = FileRecord(
+            size=int(size),
+            mtime=int(mtime),
+            digest=digest,
+            format_version=int(next(iter(format_version), LEGACY_FORMAT_VERSION)),
+        )
+        manifest[file_name] = file_record
+    return manifest
+
+
+def get_file_task_ids(manifest_db: Redis, file_name: str) -> List[int]:
+    """Get IDs of tasks which were uploaded from the file.
+
+    Args:
+        manifest_db: connector to manifest database.
+        file_name: name of quiz file.
+
+    Returns:
+        Sorted IDs of uploaded tasks.
+    """
+    task_ids = manifest_db.smembers(FILE_TASKS_KEY.format(file_name=file_name))
+    return sorted(int(task_id) for task_id in task_ids)
+
+
+def save_file_record(
+    pipeline: Pipeline,
+    file_name: str,
+    file_record: FileRecord,
+    task_ids: Optional[Iterable[int]] = None,
+) -> None:
+    """Queue saving of the file record and, optionally, of IDs of tasks uploaded from the file.
+
+    Args:
+        pipeline: pipeline of manifest database.
+        file_name: name of quiz file.
+        file_record: record of the file.
+        task_ids: IDs of tasks uploaded from the file; None if they haven't changed.
+    """
+    raw_record = RECORD_SEPARATOR.join(str(field) for field in file_record)
+    pipeline.hset(MANIFEST_KEY, file_name, raw_record)
+    if task_ids is None:
+        return
+    tasks_key = FILE_TASKS_KEY.format(file_name=file_name)
+    pipeline.delete(tasks_key)
+    if task_ids_to_save := list(task_ids):
+        pipeline.sadd(tasks_key, *task_ids_to_save)
+
+
+def remove_file_record(pipeline: Pipeline, file_name: str) -> None:
+    """Queue removal of the file record and of IDs of its tasks.
+
+    Args:
+        pipeline: pipeline of manifest database.
+        file_name: name of quiz file.
+    """
+    pipeline.hdel(MANIFEST_KEY, file_name)
+    pipeline.delete(FILE_TASKS_KEY.format(file_name=file_name))
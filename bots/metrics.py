@@ -0,0 +1,192 @@
+"""Module with metrics of the bots exposed in Prometheus format.
+
+Latencies of handlers, Redis operations, checking of answers and waiting of them
+in the executor, waiting of replies in the outbox and sending of them are recorded
+to the single histogram labelled by the stage and the name of the operation,
+so p99 of any of them is found with a single query. Errors of operations
+are counted with the same labels, outcomes of questions are counted separately.
+Counters and the size of the in-process cache of answers are read from the cache
+every time metrics are scraped. Every bot process serves its metrics over HTTP on its
+own local port; the reader of the sharded vkontakte bot reports depths of queues
+of its workers too.
+"""
+
+import time
+from contextlib import contextmanager
+from functools import partial, wraps
+from typing import Any, Awaitable, Callable, Iterator, TypeVar, cast
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from bots.constants import METRICS_LISTEN
+from bots.task_cache import AnswersCache
+
+HANDLER_STAGE = 'handler'
+REDIS_STAGE = 'redis'
+ANSWER_CHECK_STAGE = 'answer_check'
+REPLY_STAGE = 'reply'
+OUTBOX_STAGE = 'outbox'
+EXECUTOR_STAGE = 'executor'
+CORRECT_OUTCOME = 'correct'
+WRONG_OUTCOME = 'wrong'
+GIVE_UP_OUTCOME = 'give_up'
+CACHE_EVENTS = ('hits', 'misses', 'evictions', 'invalidations')
+CACHE_SIZE = 'size'
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+OPERATION_SECONDS = Histogram(
+    'quiz_operation_seconds',
+    'Latency of operations of the bot.',
+    ['stage', 'name'],
+    buckets=LATENCY_BUCKETS,
+)
+OPERATION_ERRORS = Counter(
+    'quiz_operation_errors', 'Errors raised by operations of the bot.', ['stage', 'name'],
+)
+QUIZ_OUTCOMES = Counter('quiz_outcomes', 'Outcomes of questions asked to users.', ['outcome'])
+WORKER_QUEUE_DEPTH = Gauge(
+    'quiz_worker_queue_depth', 'Events waiting in the queue of the worker process.', ['worker'],
+)
+ANSWERS_CACHE_EVENTS = Gauge(
+    'quiz_answers_cache_events',
+    'Events of the cache of answers counted since the start of the process.',
+    ['event'],
+)
+ANSWERS_CACHE_SIZE = Gauge('quiz_answers_cache_size', 'Answers kept in the cache of answers.')
+
+HandlerType = TypeVar('HandlerType', bound=Callable[..., Any])
+AsyncHandlerType = TypeVar('AsyncHandlerType', bound=Callable[..., Awaitable[Any]])
+
+
+@contextmanager
+def measure(stage: str, name: str) -> Iterator[None]:
+    """Record latency of the operation and count its error if it is raised.
+
+    Args:
+        stage: stage of handling the message, like REDIS_STAGE.
+        name: name of the operation.
+
+    Yields:
+        Nothing, the operation is run inside.
+
+    Raises:
+        Exception: error of the operation is raised again once it is counted.
+    """
+    starting_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        count_error(stage, name)
+        raise
+    finally:
+        observe(stage, name, time.perf_counter() - starting_time)
+
+
+def observe(stage: str, name: str, seconds: float) -> None:
+    """Record latency of the operation measured elsewhere.
+
+    Args:
+        stage: stage of handling the message, like OUTBOX_STAGE.
+        name: name of the operation.
+        seconds: latency of the operation.
+    """
+    OPERATION_SECONDS.labels(stage=stage, name=name).observe(seconds)
+
+
+def count_error(stage: str, name: str) -> None:
+    """Count error of the operation which hasn't raised it.
+
+    Args:
+        stage: stage of handling the message, like EXECUTOR_STAGE.
+        name: name of the operation.
+    """
+    OPERATION_ERRORS.labels(stage=stage, name=name).inc()
+
+
+def count_outcome(outcome: str) -> None:
+    """Count outcome of the question asked to the user.
+
+    Args:
+        outcome: outcome of the question, like CORRECT_OUTCOME.
+    """
+    QUIZ_OUTCOMES.labels(outcome=outcome).inc()
+
+
+def set_queue_depth(worker: str, depth: int) -> None:
+    """Record amount of events waiting in the queue of the worker process.
+
+    Args:
+        worker: name of the worker.
+        depth: amount of events in its queue.
+    """
+    WORKER_QUEUE_DEPTH.labels(worker=worker).set(depth)
+
+
+def read_cache_stat(answers_cache: AnswersCache, stat: str) -> int:
+    """Read the counter of the cache of answers.
+
+    Args:
+        answers_cache: cache of answers of the quiz engine.
+        stat: name of the counter, like "hits" or "size".
+
+    Returns:
+        Current value of the counter.
+    """
+    return getattr(answers_cache.stats(), stat)
+
+
+def watch_answers_cache(answers_cache: AnswersCache) -> None:
+    """Report counters of the cache of answers every time metrics are scraped.
+
+    Args:
+        answers_cache: cache of answers of the quiz engine.
+    """
+    for event in CACHE_EVENTS:
+        ANSWERS_CACHE_EVENTS.labels(event=event).set_function(
+            partial(read_cache_stat, answers_cache, event),
+        )
+    ANSWERS_CACHE_SIZE.set_function(partial(read_cache_stat, answers_cache, CACHE_SIZE))
+
+
+def measure_handler(callback: HandlerType) -> HandlerType:
+    """Decorate synchronous handler, so its latency is recorded under its name.
+
+    Args:
+        callback: handler of the bot.
+
+    Returns:
+        Measured handler.
+    """
+    @wraps(callback)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with measure(HANDLER_STAGE, callback.__name__):
+            return callback(*args, **kwargs)
+    return cast(HandlerType, wrapper)
+
+
+def measure_async_handler(callback: AsyncHandlerType) -> AsyncHandlerType:
+    """Decorate asynchronous handler, so its latency is recorded under its name.
+
+    Args:
+        callback: handler of the bot.
+
+    Returns:
+        Measured handler.
+    """
+    @wraps(callback)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with measure(HANDLER_STAGE, callback.__name__):
+            return await callback(*args, **kwargs)
+    return cast(AsyncHandlerType, wrapper)
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve metrics over HTTP in the background thread.
+
+    Args:
+        port: port of the server; metrics are not served if it is zero.
+    """
+    if port:
+        start_http_server(port, addr=METRICS_LISTEN)
@@ -0,0 +1,426 @@
+"""Module with outboxes delivering replies of the bots apart from handling of messages.
+
+Handlers only put replies to the bounded outbox and return, while senders deliver them
+in the background paced by token buckets: the bucket of the platform bounds the rate
+of all messages of the bot and the bucket of every chat bounds the rate of messages
+to a single chat, allowing a short burst. Replies are distributed among senders by chats,
+so replies to the same chat are delivered in the order they have been put. Every sender
+takes replies from its queue as they come and keeps them in the heap by the time the bucket
+of their chat allows them to be sent, so a chat waiting for its bucket doesn't hold replies
+to other chats of the sender; up to its share of OUTBOX_SIZE replies are kept in the heap.
+The slot of the platform is reserved once the reply is due. If the platform asks
+to slow down, all senders pause for the requested time and the message is sent again;
+other errors drop the message once they are logged.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from bots.constants import OUTBOX_RETRIES, OUTBOX_SENDERS, OUTBOX_SIZE
+from bots.metrics import OUTBOX_STAGE, REPLY_STAGE, measure, observe
+
+logger = logging.getLogger(__name__)
+
+MIN_PRUNED_BUCKETS = 1024
+
+RetryPolicy = Callable[[Exception, int], Optional[float]]
+QueuedMessage = Optional[Tuple['OutgoingMessage', float]]
+
+
+class TokenBucket(object):
+    """Class reserving slots for actions so they don't exceed the rate apart from a short burst.
+
+    The bucket is kept as the time the next action would be allowed at if the bucket was empty,
+    so no timers are needed to refill it.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """Create full token bucket.
+
+        Args:
+            rate: maximum amount of actions per second in the long run.
+            burst: amount of actions allowed at once when the bucket is full.
+        """
+        self._interval = 1 / rate
+        self._tolerance = (burst - 1) * self._interval
+        self._next_slot = float('-inf')
+
+    def reserve(self, now: float) -> float:
+        """Reserve slot for the action.
+
+        Args:
+            now: time the action is wanted at.
+
+        Returns:
+            Delay in seconds the action has to wait for before it is performed.
+        """
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + self._interval
+        return max(slot - self._tolerance - now, 0)
+
+    def pause(self, now: float, seconds: float) -> None:
+        """Forbid actions for the given time.
+
+        Args:
+            now: current time.
+            seconds: duration of the pause.
+        """
+        self._next_slot = max(self._next_slot, now + seconds + self._tolerance)
+
+    def is_full(self, now: float) -> bool:
+        """Check whether the bucket has refilled, so it is the same as a new one.
+
+        Args:
+            now: current time.
+
+        Returns:
+            True if all tokens are available else False.
+        """
+        return self._next_slot <= now
+
+
+class Pacer(object):
+    """Class pacing messages of the bot by the bucket of the platform and buckets of chats.
+
+    Buckets are shared by all senders, so they are guarded by the lock.
+    Refilled buckets of chats are dropped once there are too many of them.
+    """
+
+    def __init__(self, rate: float, chat_rate: float, chat_burst: int) -> None:
+        """Create pacer.
+
+        Args:
+            rate: maximum amount of messages of the bot per second.
+            chat_rate: maximum amount of messages to a single chat per second.
+            chat_burst: amount of messages sent to the chat at once.
+        """
+        self._bucket = TokenBucket(rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._pruning_size = MIN_PRUNED_BUCKETS
+        self._lock = threading.Lock()
+
+    def reserve_chat(self, chat_id: int, now: float) -> float:
+        """Reserve slot for the message in the bucket of the chat.
+
+        Args:
+            chat_id: ID of the chat.
+            now: current time.
+
+        Returns:
+            Delay in seconds the message has to wait for before its slot of the bot is reserved.
+        """
+        with self._lock:
+            chat_bucket = self._chat_buckets.get(chat_id)
+            if chat_bucket is None:
+                self._prune(now)
+                chat_bucket = TokenBucket(self._chat_rate, self._chat_burst)
+                self._chat_buckets[chat_id] = chat_bucket
+            return chat_bucket.reserve(now)
+
+    def reserve(self, now: float) -> float:
+        """Reserve slot for the message in the bucket of the bot.
+
+        Args:
+            now: current time.
+
+        Returns:
+            Delay in seconds the message has to wait for before it is sent.
+        """
+        with self._lock:
+            return self._bucket.reserve(now)
+
+    def pause(self, now: float, seconds: float) -> None:
+        """Forbid sending of all messages for the given time.
+
+        Args:
+            now: current time.
+            seconds: duration of the pause.
+        """
+        with self._lock:
+            self._bucket.pause(now, seconds)
+
+    def _prune(self, now: float) -> None:
+        if len(self._chat_buckets) < self._pruning_size:
+            return
+        self._chat_buckets = {
+            chat_id: chat_bucket
+            for chat_id, chat_bucket in self._chat_buckets.items()
+            if not chat_bucket.is_full(now)
+        }
+        self._pruning_size = max(MIN_PRUNED_BUCKETS, 2 * len(self._chat_buckets))
+
+
+class OutgoingMessage(NamedTuple):
+    """Class with the message waiting in the outbox."""
+
+    chat_id: int
+    fields: Dict[str, Any]
+
+
+class ScheduledMessage(NamedTuple):
+    """Class with the message kept by the sender until its chat could be sent to.
+
+    Messages are ordered by the time they are due at and then by the order they were scheduled.
+    """
+
+    sending_time: float
+    sequence: int
+    message: OutgoingMessage
+    putting_time: float
+
+
+def get_waiting_seconds(scheduled: List[ScheduledMessage], now: float) -> Optional[float]:
+    """Get time left until the first scheduled message is due.
+
+    Args:
+        scheduled: heap of scheduled messages.
+        now: current time.
+
+    Returns:
+        Seconds until the first message is due, 0 if it is due already, None if there are none.
+    """
+    if not scheduled:
+        return None
+    return max(scheduled[0].sending_time - now, 0)
+
+
+def get_shard(chat_id: int, shards: int) -> int:
+    """Get index of the sender delivering messages to the chat.
+
+    Args:
+        chat_id: ID of the chat.
+        shards: amount of senders.
+
+    Returns:
+        Index of the sender.
+    """
+    return chat_id % shards
+
+
+class BaseOutbox(object):
+    """Class with pacing and retrying shared by synchronous and asynchronous outboxes."""
+
+    def __init__(self, pacer: Pacer, get_retry_after: RetryPolicy, name: str) -> None:
+        """Create outbox.
+
+        Args:
+            pacer: pacer of messages of the bot.
+            get_retry_after: gets pause before sending again after the error or None to drop it.
+            name: name of the sending method recorded to metrics.
+        """
+        self.pacer = pacer
+        self.get_retry_after = get_retry_after
+        self.name = name
+        self.shard_size = max(OUTBOX_SIZE // OUTBOX_SENDERS, 1)
+        self._sequence = itertools.count()
+
+    def schedule(self, scheduled: List[ScheduledMessage], queued_message: QueuedMessage) -> None:
+        """Reserve slot of the chat for the message and push it to the heap of the sender.
+
+        Args:
+            scheduled: heap of scheduled messages of the sender.
+            queued_message: message taken from the queue of the sender along with time it was put.
+        """
+        if queued_message is None:
+            return
+        message, putting_time = queued_message
+        now = time.monotonic()
+        heapq.heappush(scheduled, ScheduledMessage(
+            sending_time=now + self.pacer.reserve_chat(message.chat_id, now),
+            sequence=next(self._sequence),
+            message=message,
+            putting_time=putting_time,
+        ))
+
+    def should_retry(self, message: OutgoingMessage, error: Exception, attempt: int) -> bool:
+        """Decide whether the message should be sent again, pausing all senders if so.
+
+        Args:
+            message: message failed to be sent.
+            error: error of sending.
+            attempt: number of the failed attempt starting from one.
+
+        Returns:
+            True if the message should be sent again else False.
+        """
+        retry_after = self.get_retry_after(error, attempt)
+        if retry_after is None or attempt > OUTBOX_RETRIES:
+            logger.error(f'Failed to send message to chat {message.chat_id}.', exc_info=error)
+            return False
+        logger.warning(f'{error}\nSending is paused for {retry_after:.3f} seconds.')
+        self.pacer.pause(time.monotonic(), retry_after)
+        return True
+
+
+class Outbox(BaseOutbox):
+    """Class delivering messages of the synchronous bot by sender threads."""
+
+    def __init__(
+        self,
+        send: Callable[[OutgoingMessage], Any],
+        pacer: Pacer,
+        get_retry_after: RetryPolicy,
+        name: str,
+    ) -> None:
+        """Create outbox, senders are started separately.
+
+        Args:
+            send: sends the message to the platform.
+            pacer: pacer of messages of the bot.
+            get_retry_after: gets pause before sending again after the error or None to drop it.
+            name: name of the sending method recorded to metrics.
+        """
+        super().__init__(pacer, get_retry_after, name)
+        self.send = send
+        self._queues: List['queue.Queue[QueuedMessage]'] = [
+            queue.Queue(maxsize=self.shard_size) for _ in range(OUTBOX_SENDERS)
+        ]
+        self._senders: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Start sender threads."""
+        for messages in self._queues:
+            sender = threading.Thread(target=self._deliver_messages, args=(messages,), daemon=True)
+            sender.start()
+            self._senders.append(sender)
+
+    def put(self, message: OutgoingMessage) -> None:
+        """Put the message to the outbox waiting for free space if it is full.
+
+        Args:
+            message: message to be sent.
+        """
+        shard = get_shard(message.chat_id, len(self._queues))
+        self._queues[shard].put((message, time.monotonic()))
+
+    def close(self) -> None:
+        """Deliver messages put to the outbox and stop sender threads."""
+        for messages in self._queues:
+            messages.put(None)
+        for sender in self._senders:
+            sender.join()
+        self._senders.clear()
+
+    def _deliver_messages(self, messages: 'queue.Queue[QueuedMessage]') -> None:
+        scheduled: List[ScheduledMessage] = []
+        is_open = True
+        while is_open or scheduled:
+            waiting_seconds = get_waiting_seconds(scheduled, time.monotonic())
+            if is_open and waiting_seconds != 0 and len(scheduled) < self.shard_size:
+                try:
+                    queued_message = messages.get(timeout=waiting_seconds)
+                except queue.Empty:
+                    continue
+                is_open = queued_message is not None
+                self.schedule(scheduled, queued_message)
+                continue
+            time.sleep(waiting_seconds or 0)
+            self._deliver(heapq.heappop(scheduled))
+
+    def _deliver(self, scheduled_message: ScheduledMessage) -> None:
+        time.sleep(self.pacer.reserve(time.monotonic()))
+        observe(OUTBOX_STAGE, self.name, time.monotonic() - scheduled_message.putting_time)
+        for attempt in itertools.count(1):
+            try:
+                with measure(REPLY_STAGE, self.name):
+                    self.send(scheduled_message.message)
+            except Exception as exc:
+                if self.should_retry(scheduled_message.message, exc, attempt):
+                    time.sleep(self.pacer.reserve(time.monotonic()))
+                    continue
+            return
+
+
+class AsyncOutbox(BaseOutbox):
+    """Class delivering messages of the asynchronous bot by sender tasks."""
+
+    def __init__(
+        self,
+        send: Callable[[OutgoingMessage], Awaitable[Any]],
+        pacer: Pacer,
+        get_retry_after: RetryPolicy,
+        name: str,
+    ) -> None:
+        """Create outbox, senders are started when it is entered within the event loop.
+
+        Args:
+            send: sends the message to the platform.
+            pacer: pacer of messages of the bot.
+            get_retry_after: gets pause before sending again after the error or None to drop it.
+            name: name of the sending method recorded to metrics.
+        """
+        super().__init__(pacer, get_retry_after, name)
+        self.send = send
+        self._queues: List['asyncio.Queue[QueuedMessage]'] = []
+        self._senders: List[asyncio.Task] = []
+
+    async def __aenter__(self) -> 'AsyncOutbox':
+        """Start sender tasks in the running event loop.
+
+        Returns:
+            Started outbox.
+        """
+        self._queues = [asyncio.Queue(maxsize=self.shard_size) for _ in range(OUTBOX_SENDERS)]
+        self._senders = [
+            asyncio.create_task(self._deliver_messages(messages)) for messages in self._queues
+        ]
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        """Deliver messages put to the outbox and stop sender tasks.
+
+        Args:
+            exc_info: error raised inside the context if any.
+        """
+        for messages in self._queues:
+            await messages.put(None)
+        await asyncio.gather(*self._senders)
+        self._senders.clear()
+
+    async def put(self, message: OutgoingMessage) -> None:
+        """Put the message to the outbox waiting for free space if it is full.
+
+        Args:
+            message: message to be sent.
+        """
+        shard = get_shard(message.chat_id, len(self._queues))
+        await self._queues[shard].put((message, time.monotonic()))
+
+    async def _deliver_messages(self, messages: 'asyncio.Queue[QueuedMessage]') -> None:
+        scheduled: List[ScheduledMessage] = []
+        getting: Optional['asyncio.Task[QueuedMessage]'] = None
+        is_open = True
+        while is_open or scheduled:
+            waiting_seconds = get_waiting_seconds(scheduled, time.monotonic())
+            if is_open and waiting_seconds != 0 and len(scheduled) < self.shard_size:
+                if getting is None:
+                    getting = asyncio.create_task(messages.get())
+                await asyncio.wait({getting}, timeout=waiting_seconds)
+                if getting.done():
+                    is_open = getting.result() is not None
+                    self.schedule(scheduled, getting.result())
+                    getting = None
+                continue
+            await asyncio.sleep(waiting_seconds or 0)
+            await self._deliver(heapq.heappop(scheduled))
+
+    async def _deliver(self, scheduled_message: ScheduledMessage) -> None:
+        await asyncio.sleep(self.pacer.reserve(time.monotonic()))
+        observe(OUTBOX_STAGE, self.name, time.monotonic() - scheduled_message.putting_time)
+        for attempt in itertools.count(1):
+            try:
+                with measure(REPLY_STAGE, self.name):
+                    await self.send(scheduled_message.message)
+            except Exception as exc:
+                if self.should_retry(scheduled_message.message, exc, attempt):
+                    await asyncio.sleep(self.pacer.reserve(time.monotonic()))
+                    continue
+            return
@@ -0,0 +1,814 @@
+"""Module with platform-agnostic logic of the quiz.
+
+Users are stored as hashes with counters of successes and give ups, ID of the asked
+question and the name shown in the leaderboard if it is known. Every change of the user
+is a single atomic Lua script run on the users database, so no update of the user could be lost
+when his messages are handled concurrently. Tasks are read by separate scripts
+of the tasks database, so no script switches databases and all keys are passed in KEYS,
+see bots/quiz_scripts.py. Records saved as JSON strings by previous versions are converted
+to hashes by any users script when the user is met, so no downtime is needed for migration;
+the question asked by its text then is dropped.
+The asked question is saved along with the source of tasks it was drawn from: the tasks
+database or the build of the corpus. IDs of tasks differ between sources, so the question
+asked from another source is dropped by any script once the bot is switched to a new source.
+
+Every operation of the quiz is written once, as a generator of calls: scripts to be run
+and answers to be checked. Keys and arguments of scripts are built there, and results of calls
+are sent back into the generator. The synchronous and the asynchronous engines only run
+the calls with scripts registered with their connectors and the answer executor.
+
+The question is saved to the user before it is read from the tasks database, so asking takes
+two round trips; the next question is asked if the task has been deleted meanwhile.
+The asked question keeps the generation of tasks the bot knew when it was asked, and its answer
+is kept in the in-process cache under the same generation, so the attempt takes one round trip
+for the wrong answer and two for the right one: the success is committed only if the question
+is still the one which was checked. Giving up is committed the same way. If the answer is
+missing in the cache or the question was asked in another generation, it is read from the tasks
+database. The amount of tasks and their generation are refreshed by every read of the task.
+
+Questions are asked to every user without repeats until all of them have been asked.
+IDs of tasks are walked in the order of pseudo-random permutation: 4-round Feistel network
+keyed by the seed of the user over the range of IDs rounded up to a power of 4.
+IDs out of the allocated range are skipped, which takes less than 4 steps on average.
+The user keeps only the seed, the position in the permutation and the size of the range;
+new seed is picked once the whole permutation is passed or the range is grown.
+
+The user could choose the theme: questions are drawn then at random from the index
+of the tournament or of the words in questions kept by the upload script, or from the range
+of the tournament in the corpus. The theme is saved as keys of the indexes, and the question
+is picked from the intersection of the indexes of all words. The intersection is stored
+in the tasks database for the generation of tasks the bot knows, with a TTL, so it is computed
+once and questions are drawn from it in O(1) afterwards; picking on a theme
+doesn't track asked questions.
+
+Users are ranked by their successes in the leaderboard, which is updated by the script
+committing the success; the top of the leaderboard is cached for a short time.
+
+If the engine is given the corpus, questions and answers are read from the memory-mapped
+corpus instead of the tasks database, and IDs of tasks are their positions in the corpus.
+Answers are checked against the answers normalised when the corpus was built.
+Long answers are checked in the pool of the answer executor, so checking doesn't hold
+the thread or the event loop handling messages.
+
+Latencies of scripts and of checking answers are recorded to metrics along with outcomes
+of questions: right and wrong answers and give ups.
+"""
+
+import random
+from typing import Any, Generator, List, Mapping, NamedTuple, Optional, Tuple, TypeVar, Union
+
+from redis.commands.core import AsyncScript, Script
+
+from bots.answer_executor import get_answer_executor
+from bots.constants import (
+    ANSWER_NOT_CHECKED, ANSWERS_CACHE_SIZE, ANSWERS_CACHE_TTL, GIVE_UP, NEXT, NO_QUESTION_STUB,
+    NO_TASKS_STUB, RIGHT_ANSWER, SCORE_TEXT, THEME_CACHE_TTL, WRONG_ANSWER,
+)
+from bots.corpus import ANSWER_STRING, NORMALISED_ANSWER_STRING, QUESTION_STRING, QuizCorpus
+from bots.leaderboard import LEADERBOARD_KEY, LeaderboardPage
+from bots.metrics import (
+    CORRECT_OUTCOME, GIVE_UP_OUTCOME, REDIS_STAGE, WRONG_OUTCOME, count_outcome, measure,
+)
+from bots.quiz_scripts import DrawnTask
+from bots.task_cache import AnswersCache
+from bots.task_index import (
+    get_corpus_theme_size, get_corpus_themes, get_theme_draw_keys, get_theme_keys, render_theme,
+)
+from bots.task_store import (
+    ANSWER_FIELD, QUESTION_FIELD, RANDOM_TASK_ATTEMPTS, TASKS_COUNTER_KEY, TASKS_GENERATION_KEY,
+    get_bucket_key,
+)
+
+USER_KEY = 'user_{platform}_{user_id}'
+RANDOM_SEED_LIMIT = 2147483648
+REDIS_TASKS_SOURCE = ''
+CORPUS_TASKS_SOURCE = 'corpus:{checksum}'
+UNKNOWN_GENERATION = -1
+
+ReturnType = TypeVar('ReturnType')
+
+
+class ScriptCall(NamedTuple):
+    """Class with the script of the quiz to be run."""
+
+    script_name: str
+    keys: List[str]
+    args: List[Any]
+
+
+class CheckCall(NamedTuple):
+    """Class with the answer of the user to be checked."""
+
+    users_answer: str
+    checked_answer: str
+    is_normalised: bool
+
+
+class TasksState(NamedTuple):
+    """Class with amount of tasks and their generation as they were read last time."""
+
+    tasks_count: int
+    generation: int
+
+
+QuizCall = Union[ScriptCall, CheckCall]
+QuizSteps = Generator[QuizCall, Any, ReturnType]
+
+
+class Reply(NamedTuple):
+    """Class with reply of the quiz to the user."""
+
+    text: str
+    is_question_open: bool
+
+
+def make_success_reply(is_committed: bool) -> Reply:
+    """Make reply to the right answer of the user.
+
+    Args:
+        is_committed: whether success was counted for the user.
+
+    Returns:
+        Congratulation or stub message if the question was closed while answer was checked.
+    """
+    if not is_committed:
+        return Reply(text=NO_QUESTION_STUB, is_question_open=False)
+    count_outcome(CORRECT_OUTCOME)
+    return Reply(text=RIGHT_ANSWER, is_question_open=False)
+
+
+def make_give_up_reply(right_answer: Optional[str]) -> Reply:
+    """Make reply to the user who gives up.
+
+    Args:
+        right_answer: answer for the question asked to the user if any.
+
+    Returns:
+        Answer for asked question or stub message if there haven't been any questions yet.
+    """
+    if right_answer is None:
+        return Reply(text=NO_QUESTION_STUB, is_question_open=False)
+    count_outcome(GIVE_UP_OUTCOME)
+    return Reply(text=GIVE_UP.format(answer=right_answer, next=NEXT), is_question_open=False)
+
+
+def make_score_reply(user_fields: List[Optional[str]]) -> Reply:
+    """Make reply with score of the user: successes and give ups.
+
+    Args:
+        user_fields: saved successes, give ups and last asked question of the user.
+
+    Returns:
+        Text message with score for user.
+    """
+    successes, give_ups, asked_question = user_fields
+    score = SCORE_TEXT.format(successes=successes or 0, give_ups=give_ups or 0)
+    return Reply(text=score, is_question_open=asked_question is not None)
+
+
+class BaseQuizEngine(object):
+    """Class with operations of the quiz common for all kinds of Redis connectors."""
+
+    def __init__(self, platform: str, corpus: Optional[QuizCorpus] = None) -> None:
+        """Init quiz engine.
+
+        Args:
+            platform: short name of the platform used in keys of its users.
+            corpus: corpus to serve tasks from instead of tasks database.
+        """
+        self.platform = platform
+        self.answers_cache = AnswersCache(max_size=ANSWERS_CACHE_SIZE, ttl=ANSWERS_CACHE_TTL)
+        self.corpus = corpus
+        self.tasks_state = TasksState(
+            tasks_count=len(corpus) if corpus is not None else 0, generation=UNKNOWN_GENERATION,
+        )
+        self.corpus_themes = get_corpus_themes(corpus.iterate_files()) if corpus is not None else {}
+        self.leaderboard_page = LeaderboardPage()
+
+    def get_user_key(self, user_id: int) -> str:
+        """Get key of the user in users database.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Key of the user.
+        """
+        return USER_KEY.format(platform=self.platform, user_id=user_id)
+
+    def call_users_script(self, script_name: str, user_key: str, *script_args: Any) -> ScriptCall:
+        """Make call of the users script passing the source of tasks before its arguments.
+
+        Args:
+            script_name: name of the script.
+            user_key: key of the user in users database.
+            script_args: arguments of the script.
+
+        Returns:
+            Call of the script.
+        """
+        if self.corpus is None:
+            tasks_source = REDIS_TASKS_SOURCE
+        else:
+            tasks_source = CORPUS_TASKS_SOURCE.format(checksum=self.corpus.checksum)
+        return ScriptCall(
+            script_name=script_name,
+            keys=[user_key, LEADERBOARD_KEY],
+            args=[tasks_source, *script_args],
+        )
+
+    def call_new_question(self, user_key: str, is_theme_skipped: bool) -> ScriptCall:
+        """Make call of the script asking the next question of the user.
+
+        Args:
+            user_key: key of the user in users database.
+            is_theme_skipped: whether the theme of the user is ignored.
+
+        Returns:
+            Call of the script.
+        """
+        return self.call_users_script(
+            'new_question',
+            user_key,
+            random.randrange(RANDOM_SEED_LIMIT),
+            self.tasks_state.tasks_count,
+            self.tasks_state.generation,
+            int(self.corpus is not None),
+            int(is_theme_skipped),
+        )
+
+    def register_user_steps(self, user_id: int, name: str) -> QuizSteps[bool]:
+        """Create record of the user in the database if he is a newcomer.
+
+        Args:
+            user_id: id of the user on the platform.
+            name: name of the user shown in the leaderboard if it is known.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            True if user is a newcomer else False.
+        """
+        is_newcomer = yield self.call_users_script('register', self.get_user_key(user_id), name)
+        return bool(is_newcomer)
+
+    def ask_question_steps(self, user_id: int) -> QuizSteps[Reply]:
+        """Pick random question and save it as last asked question for user.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Reply with the question or stub message if there are no tasks.
+        """
+        user_key = self.get_user_key(user_id)
+        yield from self.refresh_tasks_state()
+        asked_task = yield self.call_new_question(user_key, is_theme_skipped=False)
+        if isinstance(asked_task, str):
+            asked_task = yield from self.ask_theme_question(user_key, asked_task)
+        for _ in range(RANDOM_TASK_ATTEMPTS):
+            if asked_task is None:
+                break
+            question = yield from self.read_task(asked_task, QUESTION_STRING)
+            if question is not None:
+                return Reply(text=question, is_question_open=True)
+            asked_task = yield self.call_new_question(user_key, is_theme_skipped=True)
+        return Reply(text=NO_TASKS_STUB, is_question_open=False)
+
+    def refresh_tasks_state(self) -> QuizSteps[None]:
+        """Read amount of tasks and their generation if they haven't been read yet.
+
+        Yields:
+            Calls of the operation.
+        """
+        if self.corpus is None and self.tasks_state.generation == UNKNOWN_GENERATION:
+            self.tasks_state = TasksState(*(yield ScriptCall(
+                script_name='read_tasks_state',
+                keys=[TASKS_COUNTER_KEY, TASKS_GENERATION_KEY],
+                args=[],
+            )))
+
+    def ask_theme_question(self, user_key: str, theme: str) -> QuizSteps[Optional[int]]:
+        """Draw question on the theme of the user from the indexes and save it as asked.
+
+        Args:
+            user_key: key of the user in users database.
+            theme: keys of indexes of the theme joined by spaces.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            ID of the asked task, the question off the theme is asked if the theme is empty now.
+        """
+        if (drawn_task := (yield from self.draw_theme_task([theme]))) is None:
+            return (yield self.call_new_question(user_key, is_theme_skipped=True))
+        yield self.call_users_script(
+            'ask', user_key, drawn_task.task_id, self.tasks_state.generation,
+        )
+        return drawn_task.task_id
+
+    def draw_theme_task(self, candidate_themes: List[str]) -> QuizSteps[Optional[DrawnTask]]:
+        """Draw random task on the first candidate theme having tasks.
+
+        Only the last candidate could be the theme of several words. If the intersection
+        of its indexes hasn't been stored for the current generation yet, it is stored
+        by the script run on the master of the tasks database.
+
+        Args:
+            candidate_themes: themes as keys of their indexes joined by spaces.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Index of the theme among candidates, amount of its tasks and ID of the drawn task,
+            or None if all the themes are empty.
+        """
+        yield from self.refresh_tasks_state()
+        themes_keys = [
+            get_theme_draw_keys(candidate_theme, self.tasks_state.generation)
+            for candidate_theme in candidate_themes
+        ]
+        drawn_task = yield ScriptCall(
+            script_name='draw_theme_task',
+            keys=[theme_keys[0] for theme_keys in themes_keys],
+            args=[],
+        )
+        if drawn_task or len(themes_keys[-1]) == 1:
+            return DrawnTask(*drawn_task) if drawn_task else None
+        cached_theme = yield ScriptCall(
+            script_name='cache_theme', keys=themes_keys[-1], args=[THEME_CACHE_TTL],
+        )
+        return DrawnTask(len(candidate_themes) - 1, *cached_theme) if cached_theme else None
+
+    def read_task(self, task_id: int, task_string: int) -> QuizSteps[Optional[str]]:
+        """Read question or answer of the task from the corpus or the tasks database.
+
+        The answer read from the tasks database is cached, so it is not read
+        once the user answers the question.
+
+        Args:
+            task_id: ID of the task.
+            task_string: QUESTION_STRING or ANSWER_STRING.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Text of the question or the answer or None if the task doesn't exist.
+        """
+        if self.corpus is not None:
+            return self.corpus.get_task_string(task_id, task_string)
+        question, answer, *tasks_state = yield ScriptCall(
+            script_name='read_task',
+            keys=[get_bucket_key(task_id), TASKS_COUNTER_KEY, TASKS_GENERATION_KEY],
+            args=[QUESTION_FIELD.format(task_id=task_id), ANSWER_FIELD.format(task_id=task_id)],
+        )
+        self.tasks_state = TasksState(*tasks_state)
+        if question is None or answer is None:
+            return None
+        self.answers_cache.put(task_id, answer, self.tasks_state.generation)
+        return question if task_string == QUESTION_STRING else answer
+
+    def read_answer(self, task_id: int, generation: int) -> QuizSteps[Optional[str]]:
+        """Get answer for the asked task from the cache or read it.
+
+        Args:
+            task_id: ID of the task.
+            generation: generation of tasks the question was asked in.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Answer or None if task doesn't exist.
+        """
+        if self.corpus is None and generation == self.tasks_state.generation:
+            cached_answer = self.answers_cache.get(task_id, generation)
+            if cached_answer is not None:
+                return cached_answer
+        return (yield from self.read_task(task_id, ANSWER_STRING))
+
+    def get_checked_answer(self, task_id: int, correct_answer: str) -> Tuple[str, bool]:
+        """Get answer the answer of the user is checked against.
+
+        Args:
+            task_id: ID of the task.
+            correct_answer: answer for the task.
+
+        Returns:
+            Answer normalised in the corpus if possible else the answer itself
+            and whether it is normalised.
+        """
+        if self.corpus is not None:
+            normalised_answer = self.corpus.get_task_string(task_id, NORMALISED_ANSWER_STRING)
+            if normalised_answer is not None:
+                return normalised_answer, True
+        return correct_answer, False
+
+    def attempt_steps(self, user_id: int, users_answer: str) -> QuizSteps[Reply]:
+        """Check user's answer and increase success counter if he is correct.
+
+        Args:
+            user_id: id of the user on the platform.
+            users_answer: answer received from user.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Reply whether user was correct or not.
+        """
+        user_key = self.get_user_key(user_id)
+        if not (asked_task := (yield self.call_users_script('fetch_task_id', user_key))):
+            return Reply(text=NO_QUESTION_STUB, is_question_open=False)
+        task_id, generation = asked_task
+        if (correct_answer := (yield from self.read_answer(task_id, generation))) is None:
+            return Reply(text=NO_QUESTION_STUB, is_question_open=False)
+        checked_answer = self.get_checked_answer(task_id, correct_answer)
+        if (is_correct := (yield CheckCall(users_answer, *checked_answer))) is None:
+            return Reply(text=ANSWER_NOT_CHECKED, is_question_open=True)
+        if not is_correct:
+            count_outcome(WRONG_OUTCOME)
+            return Reply(text=WRONG_ANSWER, is_question_open=True)
+        is_committed = yield self.call_users_script('commit_success', user_key, task_id)
+        return make_success_reply(bool(is_committed))
+
+    def give_up_steps(self, user_id: int) -> QuizSteps[Reply]:
+        """Close asked question and increase give up counter.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Reply with answer for the asked question.
+        """
+        user_key = self.get_user_key(user_id)
+        if not (asked_task := (yield self.call_users_script('fetch_task_id', user_key))):
+            return make_give_up_reply(None)
+        task_id, generation = asked_task
+        right_answer = yield from self.read_answer(task_id, generation)
+        if right_answer is not None:
+            is_closed = yield self.call_users_script('give_up', user_key, task_id)
+            right_answer = right_answer if is_closed else None
+        return make_give_up_reply(right_answer)
+
+    def get_score_steps(self, user_id: int) -> QuizSteps[Reply]:
+        """Get user's score.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Reply with score of the user.
+        """
+        return make_score_reply((yield self.call_users_script('score', self.get_user_key(user_id))))
+
+    def set_theme_steps(self, user_id: int, theme: str) -> QuizSteps[Reply]:
+        """Choose theme of questions asked to the user.
+
+        Args:
+            user_id: id of the user on the platform.
+            theme: name of the tournament or word of questions, empty string resets the theme.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Reply whether the theme has been changed.
+        """
+        theme_size, chosen_theme = 0, ''
+        if theme.strip():
+            theme_size, chosen_theme = yield from self.find_theme(theme)
+        if theme_size >= 0:
+            yield self.call_users_script('set_theme', self.get_user_key(user_id), chosen_theme)
+        return Reply(text=render_theme(theme.strip(), theme_size), is_question_open=False)
+
+    def find_theme(self, theme: str) -> QuizSteps[Tuple[int, str]]:
+        """Find the first theme with tasks among the tournament and the words typed by the user.
+
+        Args:
+            theme: theme typed by the user.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Amount of tasks on the theme and the theme saved to the user, -1 if none is found.
+        """
+        candidate_themes = get_theme_keys(theme)
+        if self.corpus is not None:
+            for file_theme in candidate_themes:
+                corpus_theme = self.corpus_themes.get(file_theme, '')
+                if corpus_theme and get_corpus_theme_size(corpus_theme) > 0:
+                    return get_corpus_theme_size(corpus_theme), corpus_theme
+            return -1, ''
+        if (drawn_task := (yield from self.draw_theme_task(candidate_themes))) is None:
+            return -1, ''
+        return drawn_task.theme_size, candidate_themes[drawn_task.theme_index]
+
+    def get_leaderboard_steps(self, user_id: int) -> QuizSteps[Reply]:
+        """Get the best users of both platforms and place of the user among them.
+
+        Names of the best users are read only when the top is read.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Yields:
+            Calls of the operation.
+
+        Returns:
+            Reply with the leaderboard.
+        """
+        page_size = self.leaderboard_page.get_size_to_read()
+        leaderboard = yield self.call_users_script(
+            'leaderboard', self.get_user_key(user_id), page_size,
+        )
+        successes, rank, leaders = leaderboard
+        if leaders:
+            leader_keys, leader_successes = leaders[::2], leaders[1::2]
+            names = yield ScriptCall(script_name='read_names', keys=leader_keys, args=[])
+            leaders = [
+                leader_field
+                for leader in zip(leader_keys, names, leader_successes)
+                for leader_field in leader
+            ]
+        return Reply(
+            text=self.leaderboard_page.render([successes, rank, leaders]), is_question_open=False,
+        )
+
+
+class QuizEngine(BaseQuizEngine):
+    """Quiz engine for synchronous connectors to Redis."""
+
+    def __init__(
+        self,
+        scripts: Mapping[str, Script],
+        platform: str,
+        corpus: Optional[QuizCorpus] = None,
+    ) -> None:
+        """Init quiz engine.
+
+        Args:
+            scripts: scripts of the quiz registered with connectors to its databases.
+            platform: short name of the platform used in keys of its users.
+            corpus: corpus to serve tasks from instead of tasks database.
+        """
+        super().__init__(platform=platform, corpus=corpus)
+        self.scripts = scripts
+
+    def run(self, steps: QuizSteps[ReturnType]) -> ReturnType:
+        """Run calls of the operation one by one.
+
+        Args:
+            steps: generator of calls of the operation.
+
+        Returns:
+            Result of the operation.
+        """
+        call_result = None
+        while True:
+            try:
+                quiz_call = steps.send(call_result)
+            except StopIteration as stop:
+                return stop.value
+            call_result = self.call(quiz_call)
+
+    def call(self, quiz_call: QuizCall) -> Any:
+        """Run the script or check the answer.
+
+        Args:
+            quiz_call: call of the operation.
+
+        Returns:
+            Result of the script or whether the answer is correct.
+        """
+        if isinstance(quiz_call, CheckCall):
+            return get_answer_executor().check(*quiz_call)
+        with measure(REDIS_STAGE, quiz_call.script_name):
+            return self.scripts[quiz_call.script_name](keys=quiz_call.keys, args=quiz_call.args)
+
+    def register_user(self, user_id: int, name: str = '') -> bool:
+        """Create record of the user in the database if he is a newcomer.
+
+        Args:
+            user_id: id of the user on the platform.
+            name: name of the user shown in the leaderboard if it is known.
+
+        Returns:
+            True if user is a newcomer else False.
+        """
+        return self.run(self.register_user_steps(user_id, name))
+
+    def ask_question(self, user_id: int) -> Reply:
+        """Pick random question and save it as last asked question for user.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Reply with the question.
+        """
+        return self.run(self.ask_question_steps(user_id))
+
+    def attempt(self, user_id: int, users_answer: str) -> Reply:
+        """Check user's answer and increase success counter if he is correct.
+
+        Args:
+            user_id: id of the user on the platform.
+            users_answer: answer received from user.
+
+        Returns:
+            Reply whether user was correct or not.
+        """
+        return self.run(self.attempt_steps(user_id, users_answer))
+
+    def give_up(self, user_id: int) -> Reply:
+        """Close asked question and increase give up counter.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Reply with answer for the asked question.
+        """
+        return self.run(self.give_up_steps(user_id))
+
+    def get_score(self, user_id: int) -> Reply:
+        """Get user's score.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Reply with score of the user.
+        """
+        return self.run(self.get_score_steps(user_id))
+
+    def set_theme(self, user_id: int, theme: str) -> Reply:
+        """Choose theme of questions asked to the user.
+
+        Args:
+            user_id: id of the user on the platform.
+            theme: name of the tournament or word of questions, empty string resets the theme.
+
+        Returns:
+            Reply whether the theme has been changed.
+        """
+        return self.run(self.set_theme_steps(user_id, theme))
+
+    def get_leaderboard(self, user_id: int) -> Reply:
+        """Get the best users of both platforms and place of the user among them.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Reply with the leaderboard.
+        """
+        return self.run(self.get_leaderboard_steps(user_id))
+
+
+class AsyncQuizEngine(BaseQuizEngine):
+    """Quiz engine for asynchronous connectors to Redis."""
+
+    def __init__(
+        self,
+        scripts: Mapping[str, AsyncScript],
+        platform: str,
+        corpus: Optional[QuizCorpus] = None,
+    ) -> None:
+        """Init quiz engine.
+
+        Args:
+            scripts: scripts of the quiz registered with asynchronous connectors to its databases.
+            platform: short name of the platform used in keys of its users.
+            corpus: corpus to serve tasks from instead of tasks database.
+        """
+        super().__init__(platform=platform, corpus=corpus)
+        self.scripts = scripts
+
+    async def run(self, steps: QuizSteps[ReturnType]) -> ReturnType:
+        """Run calls of the operation one by one.
+
+        Args:
+            steps: generator of calls of the operation.
+
+        Returns:
+            Result of the operation.
+        """
+        call_result = None
+        while True:
+            try:
+                quiz_call = steps.send(call_result)
+            except StopIteration as stop:
+                return stop.value
+            call_result = await self.call(quiz_call)
+
+    async def call(self, quiz_call: QuizCall) -> Any:
+        """Run the script or check the answer.
+
+        Args:
+            quiz_call: call of the operation.
+
+        Returns:
+            Result of the script or whether the answer is correct.
+        """
+        if isinstance(quiz_call, CheckCall):
+            return await get_answer_executor().check_async(*quiz_call)
+        with measure(REDIS_STAGE, quiz_call.script_name):
+            return await self.scripts[quiz_call.script_name](
+                keys=quiz_call.keys, args=quiz_call.args,
+            )
+
+    async def register_user(self, user_id: int, name: str = '') -> bool:
+        """Create record of the user in the database if he is a newcomer.
+
+        Args:
+            user_id: id of the user on the platform.
+            name: name of the user shown in the leaderboard if it is known.
+
+        Returns:
+            True if user is a newcomer else False.
+        """
+        return await self.run(self.register_user_steps(user_id, name))
+
+    async def ask_question(self, user_id: int) -> Reply:
+        """Pick random question and save it as last asked question for user.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Reply with the question.
+        """
+        return await self.run(self.ask_question_steps(user_id))
+
+    async def attempt(self, user_id: int, users_answer: str) -> Reply:
+        """Check user's answer and increase success counter if he is correct.
+
+        Args:
+            user_id: id of the user on the platform.
+            users_answer: answer received from user.
+
+        Returns:
+            Reply whether user was correct or not.
+        """
+        return await self.run(self.attempt_steps(user_id, users_answer))
+
+    async def give_up(self, user_id: int) -> Reply:
+        """Close asked question and increase give up counter.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Reply with answer for the asked question.
+        """
+        return await self.run(self.give_up_steps(user_id))
+
+    async def get_score(self, user_id: int) -> Reply:
+        """Get user's score.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Reply with score of the user.
+        """
+        return await self.run(self.get_score_steps(user_id))
+
+    async def set_theme(self, user_id: int, theme: str) -> Reply:
+        """Choose theme of questions asked to the user.
+
+        Args:
+            user_id: id of the user on the platform.
+            theme: name of the tournament or word of questions, empty string resets the theme.
+
+        Returns:
+            Reply whether the theme has been changed.
+        """
+        return await self.run(self.set_theme_steps(user_id, theme))
+
+    async def get_leaderboard(self, user_id: int) -> Reply:
+        """Get the best users of both platforms and place of the user among them.
+
+        Args:
+            user_id: id of the user on the platform.
+
+        Returns:
+            Reply with the leaderboard.
+        """
+        return await self.run(self.get_leaderboard_steps(user_id))
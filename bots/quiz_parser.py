@@ -0,0 +1,299 @@
+"""Module for parsing quiz fixture files.
+
+Files are read by chunks and parsed in a single pass: a precompiled pattern
+finds blocks separated by empty lines whose first line names the field of the task
+they hold. Fields are collected into the task until
+the next question starts, so a malformed block spoils only its own task.
+"""
+
+import hashlib
+import re
+from functools import partial
+from os.path import join
+from types import MappingProxyType
+from typing import IO, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from bots.manifest import DIGEST_ALGORITHM, FileRecord, stat_quiz_file
+
+QUIZ_FILE_ENCODING = 'KOI8-R'
+PICTURE_INDICATOR = '(pic:'
+FIELD_HEADER_PATTERN = re.compile(
+    r'\n\n(Вопрос|Ответ|Комментарий|Источник|Автор|Чемпионат|Тур)([^:\n]*):[ \t]*([^\n]*)',
+)
+NUMBER_PATTERN = re.compile(r'\d+')
+BLOCK_SEPARATOR = '\n\n'
+CHUNK_SIZE = 65536
+QUESTION_FIELD = 'question'
+ANSWER_FIELD = 'answer'
+SECTION_FIELD = 'section'
+FIELD_NAMES = MappingProxyType({
+    'Чемпионат': SECTION_FIELD,
+    'Тур': SECTION_FIELD,
+    'Вопрос': QUESTION_FIELD,
+    'Ответ': ANSWER_FIELD,
+    'Комментарий': 'comment',
+    'Источник': 'source',
+    'Автор': 'author',
+})
+
+
+class QuizTask(NamedTuple):
+    """Class with task parsed from quiz file."""
+
+    question: str
+    answer: str
+    comment: str
+    source: str
+    author: str
+    file_name: str
+    number: int
+
+
+class MalformedBlock(NamedTuple):
+    """Class with block of quiz file which could not be parsed into task."""
+
+    file_name: str
+    line_number: int
+    reason: str
+
+
+class ParsedFile(NamedTuple):
+    """Class with tasks parsed from quiz file along with record of the file."""
+
+    file_name: str
+    file_record: FileRecord
+    tasks: List[QuizTask]
+    malformed_blocks: List[MalformedBlock]
+
+
+class Block(NamedTuple):
+    """Class with field of quiz task or section of quiz file found in text between empty lines."""
+
+    line_number: int
+    field: str
+    label: str
+    text: str
+
+
+def iterate_blocks(chunks: Iterable[str]) -> Iterator[Block]:
+    """Find blocks with fields in text of quiz file, blocks are separated by empty lines.
+
+    Text may come in chunks of any size, only the last unfinished block is kept in memory.
+    Blocks which are not fields, like headers of the file, are skipped.
+
+    Args:
+        chunks: consecutive pieces of text of quiz file, like its lines.
+
+    Yields:
+        Blocks along with number of their first line.
+    """
+    pending_text = ''
+    line_number = 1
+    for chunk in chunks:
+        pending_text += chunk
+        if (boundary := pending_text.rfind(BLOCK_SEPARATOR)) < 0:
+            continue
+        complete_text = pending_text[:boundary]
+        pending_text = pending_text[boundary + len(BLOCK_SEPARATOR):]
+        yield from find_field_blocks(complete_text, line_number)
+        line_number += complete_text.count('\n') + len(BLOCK_SEPARATOR)
+    yield from find_field_blocks(pending_text, line_number)
+
+
+def find_field_blocks(text: str, line_number: int) -> Iterator[Block]:
+    """Find blocks with fields in text made of complete blocks.
+
+    Args:
+        text: text of complete blocks.
+        line_number: number of the first line of the text.
+
+    Yields:
+        Blocks along with number of their first line.
+    """
+    separated_text = BLOCK_SEPARATOR + text
+    line_number -= len(BLOCK_SEPARATOR)
+    counted_position = 0
+    for header_match in FIELD_HEADER_PATTERN.finditer(separated_text):
+        header_position = header_match.start()
+        line_number += separated_text.count('\n', counted_position, header_position)
+        counted_position = header_position
+        field_name, label, inline_text = header_match.groups()
+        body_end = separated_text.find(BLOCK_SEPARATOR, header_match.end())
+        if body_end < 0:
+            body_end = len(separated_text)
+        body = separated_text[header_match.end() + 1:body_end]
+        yield Block(
+            line_number=line_number + len(BLOCK_SEPARATOR),
+            field=FIELD_NAMES[field_name],
+            label=label,
+            text=body or inline_text,
+        )
+
+
+class QuizFileParser(object):
+    """Class parsing quiz file into tasks and collecting its malformed blocks.
+
+    Questions and answers with pictures are skipped as bots can't show them.
+    """
+
+    def __init__(self, file_name: str) -> None:
+        """Init parser of the file.
+
+        Args:
+            file_name: name of quiz file.
+        """
+        self.file_name = file_name
+        self.malformed_blocks: List[MalformedBlock] = []
+        self.fields: Dict[str, str] = {}
+        self.task_line = 0
+        self.task_number = 0
+        self.questions_count = 0
+
+    def parse(self, chunks: Iterable[str]) -> Iterator[QuizTask]:
+        """Parse text of quiz file into tasks.
+
+        Args:
+            chunks: consecutive pieces of text of quiz file, like its lines.
+
+        Yields:
+            Parsed tasks.
+        """
+        for block in iterate_blocks(chunks):
+            if (finished_task := self.feed_block(block)) is not None:
+                yield finished_task
+        if (last_task := self.finish_task()) is not None:
+            yield last_task
+
+    def feed_block(self, block: Block) -> Optional[QuizTask]:
+        """Add field from the block to the current task.
+
+        Fields describing the whole file or tour outside of tasks are ignored.
+
+        Args:
+            block: block of quiz file.
+
+        Returns:
+            Previous task if the block starts a new question or tour else None.
+        """
+        field = block.field
+        if field == SECTION_FIELD:
+            return self.finish_task()
+        if field == QUESTION_FIELD:
+            finished_task = self.finish_task()
+            self.start_task(block)
+            return finished_task
+        if self.fields.get(field) is not None:
+            self.report(block.line_number, f'repeated {field}')
+        elif self.fields:
+            self.fields[field] = block.text
+        elif field == ANSWER_FIELD:
+            self.report(block.line_number, 'answer without question')
+        return None
+
+    def start_task(self, block: Block) -> None:
+        """Start collecting fields of the new task.
+
+        Args:
+            block: block of quiz file with the question.
+        """
+        self.questions_count += 1
+        number_match = NUMBER_PATTERN.search(block.label)
+        self.task_number = int(number_match.group()) if number_match else self.questions_count
+        self.task_line = block.line_number
+        self.fields = {QUESTION_FIELD: block.text}
+
+    def finish_task(self) -> Optional[QuizTask]:
+        """Make task from the collected fields.
+
+        Returns:
+            Task or None if there is no complete task without pictures.
+        """
+        task_fields = self.fields
+        self.fields = {}
+        if not task_fields:
+            return None
+        question = task_fields[QUESTION_FIELD]
+        answer = task_fields.get(ANSWER_FIELD, '')
+        if not (question and answer):
+            self.report(self.task_line, 'question without answer')
+            return None
+        if PICTURE_INDICATOR in question or PICTURE_INDICATOR in answer:
+            return None
+        return QuizTask(
+            question=question,
+            answer=answer,
+            comment=task_fields.get('comment', ''),
+            source=task_fields.get('source', ''),
+            author=task_fields.get('author', ''),
+            file_name=self.file_name,
+            number=self.task_number,
+        )
+
+    def report(self, line_number: int, reason: str) -> None:
+        """Remember malformed block.
+
+        Args:
+            line_number: number of the first line of the block.
+            reason: what is wrong with the block.
+        """
+        self.malformed_blocks.append(
+            MalformedBlock(file_name=self.file_name, line_number=line_number, reason=reason),
+        )
+
+
+def decode_chunks(quiz_file: IO[bytes], content_digest: 'hashlib._Hash') -> Iterator[str]:
+    """Read quiz file by chunks updating digest of its content on the way.
+
+    The encoding is single-byte, so chunks are decoded independently.
+
+    Args:
+        quiz_file: quiz file opened in binary mode.
+        content_digest: digest of the file content.
+
+    Yields:
+        Decoded chunks of the file.
+    """
+    while (raw_chunk := quiz_file.read(CHUNK_SIZE)):
+        content_digest.update(raw_chunk)
+        yield raw_chunk.decode(QUIZ_FILE_ENCODING)
+
+
+def parse_quiz_file(path_to_file: str) -> Iterator[QuizTask]:
+    """Parse quiz file into tasks reading it by chunks.
+
+    Args:
+        path_to_file: path to file with quiz content.
+
+    Yields:
+        Parsed tasks.
+    """
+    parser = QuizFileParser(file_name=path_to_file)
+    with open(path_to_file, encoding=QUIZ_FILE_ENCODING) as quiz_file:
+        yield from parser.parse(iter(partial(quiz_file.read, CHUNK_SIZE), ''))
+
+
+def parse_quiz_tasks(quiz_folder: str, file_name: str) -> ParsedFile:
+    """Parse quiz file and hash its content so it could be done in worker process.
+
+    Args:
+        quiz_folder: path to folder with quiz tasks.
+        file_name: name of quiz file.
+
+    Returns:
+        Parsed tasks and malformed blocks along with record of the file.
+    """
+    path_to_file = join(quiz_folder, file_name)
+    file_stat = stat_quiz_file(path_to_file)
+    parser = QuizFileParser(file_name=file_name)
+    content_digest = hashlib.new(DIGEST_ALGORITHM)
+    with open(path_to_file, 'rb') as quiz_file:
+        tasks = list(parser.parse(decode_chunks(quiz_file, content_digest)))
+    file_record = FileRecord(
+        size=file_stat.size, mtime=file_stat.mtime, digest=content_digest.hexdigest(),
+    )
+    return ParsedFile(
+        file_name=file_name,
+        file_record=file_record,
+        tasks=tasks,
+        malformed_blocks=parser.malformed_blocks,
+    )
@@ -0,0 +1,289 @@
+"""Module with Lua scripts of the quiz.
+
+Scripts of the users database change the record of a single user, scripts of the tasks database
+only read tasks and indexes, so they could be run on a replica. The only script writing
+to the tasks database stores the intersection of indexes of the theme of several words,
+so it is run on the master. No script switches databases, and every key a script touches
+is passed in KEYS: keys of users scripts are the key of the user and the key of the leaderboard,
+keys of tasks scripts are built by the quiz engine.
+
+Every users script starts with the common header. It converts the record saved as JSON string
+by previous versions to the hash and drops the question asked from another source of tasks,
+as IDs of tasks differ between sources. The source is the first argument of every users script,
+arguments of the script itself follow it.
+"""
+
+from types import MappingProxyType
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+Connector = Union[Redis, AsyncRedis]
+
+USER_SCRIPT_HEADER = """
+local user_key, leaderboard_key = KEYS[1], KEYS[2]
+local tasks_source = ARGV[1]
+
+if redis.call('TYPE', user_key).ok == 'string' then
+    local user = cjson.decode(redis.call('GET', user_key))
+    redis.call('DEL', user_key)
+    redis.call('HSET', user_key, 'success', user.success or 0, 'give_up', user.give_up or 0)
+    local last_task_id = tonumber(user.last_asked_question)
+    if last_task_id then
+        redis.call('HSET', user_key, 'last_asked_question', last_task_id)
+    end
+end
+
+local asked_task_id, asked_source = unpack(redis.call(
+    'HMGET', user_key, 'last_asked_question', 'asked_source'
+))
+if asked_task_id and (asked_source or '') ~= tasks_source then
+    redis.call('HDEL', user_key, 'last_asked_question', 'asked_source', 'asked_generation')
+end
+
+local function ask(task_id, generation)
+    redis.call(
+        'HSET', user_key, 'last_asked_question', task_id, 'asked_source', tasks_source,
+        'asked_generation', generation
+    )
+end
+"""
+
+REGISTER_SCRIPT_BODY = """
+local is_newcomer = redis.call('EXISTS', user_key) == 0
+if is_newcomer then
+    redis.call('HSET', user_key, 'success', 0, 'give_up', 0)
+end
+if ARGV[2] ~= '' then
+    redis.call('HSET', user_key, 'name', ARGV[2])
+end
+return is_newcomer and 1 or 0
+"""
+
+NEW_QUESTION_SCRIPT_BODY = """
+local seeds_count = 65536
+
+local function mix(value, round_key)
+    local mixed = (value * 40503 + round_key) % seeds_count
+    return math.floor(mixed * mixed / 256)
+end
+
+local function permute(index, half_bits, seed)
+    local half_size = 2 ^ half_bits
+    local left, right = math.floor(index / half_size), index % half_size
+    for round = 1, 4 do
+        local round_key = (seed * (2 * round + 1) + round * 7919) % seeds_count
+        left, right = right, bit.bxor(left, mix(right, round_key) % half_size)
+    end
+    return left * half_size + right
+end
+
+math.randomseed(tonumber(ARGV[2]))
+local tasks_count, generation = tonumber(ARGV[3]), ARGV[4]
+local is_corpus, is_theme_skipped = ARGV[5] == '1', ARGV[6] == '1'
+local theme = not is_theme_skipped and redis.call('HGET', user_key, 'theme')
+if theme then
+    local first_task, theme_size = string.match(theme, '^range:([0-9]+):([0-9]+)$')
+    if theme_size and is_corpus then
+        local task_id = math.random(tonumber(first_task), first_task + theme_size - 1)
+        ask(task_id, generation)
+        return task_id
+    elseif not (theme_size or is_corpus) then
+        return theme
+    end
+end
+
+if tasks_count == 0 then
+    return false
+end
+local half_bits = 1
+while 4 ^ half_bits < tasks_count do
+    half_bits = half_bits + 1
+end
+local range_size = 4 ^ half_bits
+local seed, cursor, sample_bits = unpack(redis.call(
+    'HMGET', user_key, 'sample_seed', 'sample_cursor', 'sample_bits'
+))
+seed, cursor = tonumber(seed), tonumber(cursor)
+if not (seed and cursor) or tonumber(sample_bits) ~= half_bits then
+    seed, cursor = math.random(0, seeds_count - 1), 0
+end
+for _ = 1, 2 * range_size do
+    if cursor >= range_size then
+        seed, cursor = math.random(0, seeds_count - 1), 0
+    end
+    local task_id = permute(cursor, half_bits, seed)
+    cursor = cursor + 1
+    if task_id < tasks_count then
+        ask(task_id, generation)
+        redis.call(
+            'HSET', user_key, 'sample_seed', seed, 'sample_cursor', cursor, 'sample_bits', half_bits
+        )
+        return task_id
+    end
+end
+return false
+"""
+
+ASK_SCRIPT_BODY = """
+ask(ARGV[2], ARGV[3])
+return 1
+"""
+
+FETCH_TASK_ID_SCRIPT_BODY = """
+local task_id, generation = unpack(redis.call(
+    'HMGET', user_key, 'last_asked_question', 'asked_generation'
+))
+if not task_id then
+    return false
+end
+return {tonumber(task_id), tonumber(generation or -1)}
+"""
+
+COMMIT_SUCCESS_SCRIPT_BODY = """
+if redis.call('HGET', user_key, 'last_asked_question') ~= ARGV[2] then
+    return 0
+end
+local successes = redis.call('HINCRBY', user_key, 'success', 1)
+redis.call('ZADD', leaderboard_key, successes, user_key)
+redis.call('HDEL', user_key, 'last_asked_question')
+return 1
+"""
+
+GIVE_UP_SCRIPT_BODY = """
+if redis.call('HGET', user_key, 'last_asked_question') ~= ARGV[2] then
+    return 0
+end
+redis.call('HINCRBY', user_key, 'give_up', 1)
+redis.call('HDEL', user_key, 'last_asked_question')
+return 1
+"""
+
+SCORE_SCRIPT_BODY = """
+return redis.call('HMGET', user_key, 'success', 'give_up', 'last_asked_question')
+"""
+
+LEADERBOARD_SCRIPT_BODY = """
+local successes = tonumber(redis.call('HGET', user_key, 'success') or 0)
+if successes > 0 then
+    redis.call('ZADD', leaderboard_key, successes, user_key)
+end
+local rank = redis.call('ZREVRANK', leaderboard_key, user_key) or -1
+local leaders = false
+local page_size = tonumber(ARGV[2])
+if page_size > 0 then
+    leaders = redis.call('ZREVRANGE', leaderboard_key, 0, page_size - 1, 'WITHSCORES')
+end
+return {successes, rank, leaders}
+"""
+
+SET_THEME_SCRIPT_BODY = """
+if ARGV[2] == '' then
+    redis.call('HDEL', user_key, 'theme')
+else
+    redis.call('HSET', user_key, 'theme', ARGV[2])
+end
+return 1
+"""
+
+READ_NAMES_SCRIPT = """
+local names = {unpack(KEYS)}
+for index, leader_key in ipairs(KEYS) do
+    names[index] = redis.call('HGET', leader_key, 'name') or ''
+end
+return names
+"""
+
+READ_TASK_SCRIPT = """
+local question, answer = unpack(redis.call('HMGET', KEYS[1], ARGV[1], ARGV[2]))
+local tasks_count, generation = unpack(redis.call('MGET', KEYS[2], KEYS[3]))
+return {question, answer, tonumber(tasks_count or 0), tonumber(generation or 0)}
+"""
+
+READ_TASKS_STATE_SCRIPT = """
+local tasks_count, generation = unpack(redis.call('MGET', KEYS[1], KEYS[2]))
+return {tonumber(tasks_count or 0), tonumber(generation or 0)}
+"""
+
+DRAW_THEME_TASK_SCRIPT = """
+for index, theme_key in ipairs(KEYS) do
+    local theme_size = redis.call('SCARD', theme_key)
+    if theme_size > 0 then
+        return {index - 1, theme_size, tonumber(redis.call('SRANDMEMBER', theme_key))}
+    end
+end
+return false
+"""
+
+CACHE_THEME_SCRIPT = """
+local theme_size = redis.call('SINTERSTORE', KEYS[1], unpack(KEYS, 2))
+if theme_size == 0 then
+    return false
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return {theme_size, tonumber(redis.call('SRANDMEMBER', KEYS[1]))}
+"""
+
+USERS_SCRIPTS = MappingProxyType({
+    **{
+        script_name: ''.join((USER_SCRIPT_HEADER, script_body))
+        for script_name, script_body in (
+            ('register', REGISTER_SCRIPT_BODY),
+            ('new_question', NEW_QUESTION_SCRIPT_BODY),
+            ('ask', ASK_SCRIPT_BODY),
+            ('fetch_task_id', FETCH_TASK_ID_SCRIPT_BODY),
+            ('commit_success', COMMIT_SUCCESS_SCRIPT_BODY),
+            ('give_up', GIVE_UP_SCRIPT_BODY),
+            ('score', SCORE_SCRIPT_BODY),
+            ('leaderboard', LEADERBOARD_SCRIPT_BODY),
+            ('set_theme', SET_THEME_SCRIPT_BODY),
+        )
+    },
+    'read_names': READ_NAMES_SCRIPT,
+})
+
+TASKS_SCRIPTS = MappingProxyType({
+    'read_task': READ_TASK_SCRIPT,
+    'read_tasks_state': READ_TASKS_STATE_SCRIPT,
+    'draw_theme_task': DRAW_THEME_TASK_SCRIPT,
+})
+
+THEMES_SCRIPTS = MappingProxyType({
+    'cache_theme': CACHE_THEME_SCRIPT,
+})
+
+
+class DrawnTask(NamedTuple):
+    """Class with the task drawn by the script on the first theme having tasks."""
+
+    theme_index: int
+    theme_size: int
+    task_id: int
+
+
+def register_quiz_scripts(
+    users_db: Connector, tasks_db: Connector, themes_db: Optional[Connector] = None,
+) -> Dict[str, Any]:
+    """Register scripts of the quiz with connectors to their databases.
+
+    Connectors could be synchronous or asynchronous, but all of the same kind.
+
+    Args:
+        users_db: connector to users database.
+        tasks_db: connector to tasks database, which could be read-only.
+        themes_db: writable connector to tasks database storing themes; tasks_db by default.
+
+    Returns:
+        Registered scripts by their names.
+    """
+    scripts_connectors = (
+        (USERS_SCRIPTS, users_db),
+        (TASKS_SCRIPTS, tasks_db),
+        (THEMES_SCRIPTS, tasks_db if themes_db is None else themes_db),
+    )
+    return {
+        script_name: connector.register_script(script)
+        for scripts, connector in scripts_connectors
+        for script_name, script in scripts.items()
+    }
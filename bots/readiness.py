@@ -0,0 +1,133 @@
+"""Module with progress of the upload of quiz tasks and readiness of bots to serve them.
+
+The upload runs in the background while bots serve tasks already stored in Redis,
+so it publishes its progress to the hash in the tasks database: the state of the upload,
+amounts of files and tasks uploaded and the ready flag, which is set once all tasks are written.
+Run as script, it waits until bots have tasks to serve before they are started: it returns
+at once when tasks of the previous upload or the corpus are there, so only the first
+deployment waits for the first batch of tasks of the upload or for the upload to end.
+The wait is limited with READINESS_TIMEOUT environmental, bots are started afterwards anyway.
+"""
+
+import logging
+import os
+import time
+
+from redis import Redis, RedisError
+from redis.client import Pipeline
+
+from bots.constants import QUIZ_CORPUS_PATH, READINESS_TIMEOUT, TASKS_DATABASE
+from bots.storage import connect
+from bots.task_store import TASKS_GENERATION_KEY
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PROGRESS_KEY = 'upload:progress'
+UPLOADING_STATE = 'uploading'
+READY_STATE = 'ready'
+FAILED_STATE = 'failed'
+FINISHED_STATES = frozenset((READY_STATE, FAILED_STATE))
+READINESS_POLL_INTERVAL = 0.5
+
+
+def start_upload_progress(tasks_db: Redis, files_count: int) -> None:
+    """Publish the start of the upload resetting the ready flag.
+
+    Args:
+        tasks_db: connector to tasks database.
+        files_count: amount of files to be uploaded.
+    """
+    tasks_db.hset(UPLOAD_PROGRESS_KEY, mapping={
+        'state': UPLOADING_STATE,
+        'ready': 0,
+        'files_total': files_count,
+        'files_done': 0,
+        'tasks_written': 0,
+        'updated_at': int(time.time()),
+    })
+
+
+def count_uploaded_file(pipeline: Pipeline, tasks_count: int) -> None:
+    """Queue counting of the file uploaded, so progress is published with its tasks.
+
+    Args:
+        pipeline: pipeline of tasks database.
+        tasks_count: amount of tasks written for the file.
+    """
+    pipeline.hincrby(UPLOAD_PROGRESS_KEY, 'files_done', 1)
+    pipeline.hincrby(UPLOAD_PROGRESS_KEY, 'tasks_written', tasks_count)
+    pipeline.hset(UPLOAD_PROGRESS_KEY, 'updated_at', int(time.time()))
+
+
+def finish_upload_progress(tasks_db: Redis, is_successful: bool) -> None:
+    """Publish the end of the upload setting the ready flag if it has succeeded.
+
+    Args:
+        tasks_db: connector to tasks database.
+        is_successful: whether all tasks have been written.
+    """
+    tasks_db.hset(UPLOAD_PROGRESS_KEY, mapping={
+        'state': READY_STATE if is_successful else FAILED_STATE,
+        'ready': int(is_successful),
+        'updated_at': int(time.time()),
+    })
+
+
+def has_tasks_to_serve(tasks_db: Redis) -> bool:
+    """Check whether bots could serve tasks or there is nothing to wait for.
+
+    Tasks are there once any upload has finished, which bumps their generation,
+    or the running upload has written its first batch. IDs allocated by the first upload
+    aren't enough, as tasks could be not written yet.
+
+    Args:
+        tasks_db: connector to tasks database decoding responses.
+
+    Returns:
+        True if the corpus or uploaded tasks are there or the upload has ended else False.
+    """
+    if QUIZ_CORPUS_PATH and os.path.exists(QUIZ_CORPUS_PATH):
+        return True
+    if int(tasks_db.get(TASKS_GENERATION_KEY) or 0) > 0:
+        return True
+    state, tasks_written = tasks_db.hmget(UPLOAD_PROGRESS_KEY, 'state', 'tasks_written')
+    return state in FINISHED_STATES or int(tasks_written or 0) > 0
+
+
+def wait_for_tasks(tasks_db: Redis, timeout: float) -> bool:
+    """Wait until bots have tasks to serve while Redis could be unavailable yet.
+
+    Args:
+        tasks_db: connector to tasks database decoding responses.
+        timeout: seconds to wait for.
+
+    Returns:
+        True if bots have tasks to serve else False if the time is over.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if has_tasks_to_serve(tasks_db):
+                return True
+        except RedisError as exc:
+            logger.warning(f'Redis is not available yet: {exc}')
+        time.sleep(READINESS_POLL_INTERVAL)
+    return False
+
+
+def main() -> None:
+    """Run waiting as script, bots are started afterwards in any case."""
+    logging.basicConfig(
+        format='READINESS %(asctime)s %(levelname)s: %(message)s',
+        level=logging.INFO,
+    )
+    starting_time = time.monotonic()
+    if wait_for_tasks(connect(TASKS_DATABASE, decode_responses=True), READINESS_TIMEOUT):
+        waiting_time = time.monotonic() - starting_time
+        logger.info(f'Bots have tasks to serve after {waiting_time:.3f} seconds.')
+    else:
+        logger.warning(f'No tasks to serve in {READINESS_TIMEOUT} seconds, bots are started.')
+
+
+if __name__ == '__main__':
+    main()
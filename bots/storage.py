@@ -0,0 +1,133 @@
+"""Module with connectors to Redis shared by the bots and the upload script.
+
+Every connector has its own blocking pool of connections with socket timeouts, so
+a burst of handlers waits for a free connection for a while instead of failing at once.
+Commands failed on connection errors or timeouts are retried on a fresh connection after
+exponential backoff with jitter, which starts from milliseconds, so a dropped connection
+is replaced without the handler noticing it. If Sentinel is configured, the master
+is discovered through it on every reconnect, so failovers are followed; read-only
+connectors to the tasks database are routed to replicas then and fall back
+to the master if there are none.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from redis import BlockingConnectionPool, ConnectionError, Redis, TimeoutError
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.asyncio.sentinel import Sentinel as AsyncSentinel
+from redis.backoff import EqualJitterBackoff
+from redis.retry import Retry
+from redis.sentinel import Sentinel
+
+from bots.constants import (
+    REDIS_BACKOFF_BASE, REDIS_BACKOFF_CAP, REDIS_CONNECT_TIMEOUT, REDIS_HOST,
+    REDIS_MAX_CONNECTIONS, REDIS_PORT, REDIS_RETRIES, REDIS_SENTINEL_SERVICE, REDIS_SENTINELS,
+    REDIS_SOCKET_TIMEOUT,
+)
+
+HEALTH_CHECK_INTERVAL = 30
+BLOCKING_POOL_TIMEOUT = 5
+SENTINEL_SEPARATOR = ','
+SENTINEL_PORT_SEPARATOR = ':'
+RETRIED_ERRORS = (ConnectionError, TimeoutError)
+
+
+def parse_sentinels(sentinels: str) -> List[Tuple[str, int]]:
+    """Parse addresses of Sentinel instances.
+
+    Args:
+        sentinels: addresses like "host:port" separated by commas.
+
+    Returns:
+        Hosts and ports of Sentinel instances.
+    """
+    addresses = []
+    for address in filter(None, sentinels.split(SENTINEL_SEPARATOR)):
+        host, _, port = address.strip().rpartition(SENTINEL_PORT_SEPARATOR)
+        addresses.append((host, int(port)))
+    return addresses
+
+
+def get_connection_options(database: int, decode_responses: bool) -> Dict[str, Any]:
+    """Get options of connections common for all kinds of connectors.
+
+    Args:
+        database: number of Redis database.
+        decode_responses: whether responses should be decoded to strings.
+
+    Returns:
+        Options of connections.
+    """
+    return {
+        'db': database,
+        'decode_responses': decode_responses,
+        'socket_timeout': REDIS_SOCKET_TIMEOUT,
+        'socket_connect_timeout': REDIS_CONNECT_TIMEOUT,
+        'socket_keepalive': True,
+        'health_check_interval': HEALTH_CHECK_INTERVAL,
+        'retry_on_error': list(RETRIED_ERRORS),
+        'max_connections': REDIS_MAX_CONNECTIONS,
+    }
+
+
+def get_backoff() -> EqualJitterBackoff:
+    """Get backoff between retries of failed commands.
+
+    Returns:
+        Exponential backoff with jitter.
+    """
+    return EqualJitterBackoff(cap=REDIS_BACKOFF_CAP, base=REDIS_BACKOFF_BASE)
+
+
+@lru_cache(maxsize=None)
+def connect(database: int, decode_responses: bool = False, is_read_only: bool = False) -> Redis:
+    """Get synchronous connector to the database shared within the process.
+
+    Args:
+        database: number of Redis database.
+        decode_responses: whether responses should be decoded to strings.
+        is_read_only: whether commands are only reading, so they could be sent to replicas.
+
+    Returns:
+        Connector to the database.
+    """
+    connection_options = get_connection_options(database, decode_responses)
+    connection_options['retry'] = Retry(get_backoff(), REDIS_RETRIES)
+    if sentinels := parse_sentinels(REDIS_SENTINELS):
+        sentinel = Sentinel(sentinels, socket_timeout=REDIS_CONNECT_TIMEOUT)
+        if is_read_only:
+            return sentinel.slave_for(REDIS_SENTINEL_SERVICE, **connection_options)
+        return sentinel.master_for(REDIS_SENTINEL_SERVICE, **connection_options)
+    return Redis(connection_pool=BlockingConnectionPool(
+        host=REDIS_HOST, port=REDIS_PORT, timeout=BLOCKING_POOL_TIMEOUT, **connection_options,
+    ))
+
+
+def connect_async(
+    database: int, decode_responses: bool = False, is_read_only: bool = False,
+) -> AsyncRedis:
+    """Create asynchronous connector to the database.
+
+    Connectors are not shared as their connections are bound to the event loop.
+
+    Args:
+        database: number of Redis database.
+        decode_responses: whether responses should be decoded to strings.
+        is_read_only: whether commands are only reading, so they could be sent to replicas.
+
+    Returns:
+        Connector to the database.
+    """
+    connection_options = get_connection_options(database, decode_responses)
+    connection_options['retry'] = AsyncRetry(get_backoff(), REDIS_RETRIES)
+    if sentinels := parse_sentinels(REDIS_SENTINELS):
+        sentinel = AsyncSentinel(sentinels, socket_timeout=REDIS_CONNECT_TIMEOUT)
+        if is_read_only:
+            return sentinel.slave_for(REDIS_SENTINEL_SERVICE, **connection_options)
+        return sentinel.master_for(REDIS_SENTINEL_SERVICE, **connection_options)
+    return AsyncRedis(connection_pool=AsyncBlockingConnectionPool(
+        host=REDIS_HOST, port=REDIS_PORT, timeout=BLOCKING_POOL_TIMEOUT, **connection_options,
+    ))
@@ -0,0 +1,124 @@
+"""Module with in-process cache of answers for quiz tasks.
+
+Tasks are changed only by the upload script, which bumps the generation of tasks
+every time it changes them. Answers are cached together with the generation they
+belong to, and the whole cache is dropped once another generation is met.
+"""
+
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import NamedTuple, Optional
+
+
+class CacheStats(NamedTuple):
+    """Class with counters of the cache usage."""
+
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    size: int
+
+
+class CachedAnswer(NamedTuple):
+    """Class with cached answer and the moment it expires at."""
+
+    answer: str
+    expires_at: float
+
+
+class AnswersCache(object):
+    """Size-bounded LRU cache of answers with expiring entries.
+
+    Both expired and least recently used answers are counted as evictions.
+    The cache is safe to be used from several threads.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        """Init empty cache.
+
+        Args:
+            max_size: maximum amount of cached answers.
+            ttl: seconds every answer is kept in cache for.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation: Optional[int] = None
+        self.entries: 'OrderedDict[int, CachedAnswer]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters: 'Counter[str]' = Counter()
+
+    def get(self, task_id: int, generation: int) -> Optional[str]:
+        """Get cached answer for the task.
+
+        Args:
+            task_id: ID of the task.
+            generation: current generation of tasks.
+
+        Returns:
+            Answer or None if it is not cached.
+        """
+        with self.lock:
+            self.sync_generation(generation)
+            cached_answer = self.entries.get(task_id)
+            if cached_answer is not None and cached_answer.expires_at <= time.monotonic():
+                self.entries.pop(task_id)
+                self.counters['evictions'] += 1
+                cached_answer = None
+            if cached_answer is None:
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(task_id)
+            self.counters['hits'] += 1
+            return cached_answer.answer
+
+    def put(self, task_id: int, answer: str, generation: int) -> None:
+        """Cache answer for the task evicting the least recently used answers if cache is full.
+
+        Args:
+            task_id: ID of the task.
+            answer: text of the answer.
+            generation: generation of tasks the answer belongs to.
+        """
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.sync_generation(generation)
+            self.entries[task_id] = CachedAnswer(
+                answer=answer, expires_at=time.monotonic() + self.ttl,
+            )
+            self.entries.move_to_end(task_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def sync_generation(self, generation: int) -> None:
+        """Drop all cached answers if generation of tasks has changed.
+
+        Must be called with the lock held.
+
+        Args:
+            generation: current generation of tasks.
+        """
+        if generation == self.generation:
+            return
+        if self.generation is not None:
+            self.counters['invalidations'] += 1
+        self.entries.clear()
+        self.generation = generation
+
+    def stats(self) -> CacheStats:
+        """Get counters of the cache usage.
+
+        Returns:
+            Hits, misses, evictions, invalidations and current size of the cache.
+        """
+        with self.lock:
+            return CacheStats(
+                hits=self.counters['hits'],
+                misses=self.counters['misses'],
+                evictions=self.counters['evictions'],
+                invalidations=self.counters['invalidations'],
+                size=len(self.entries),
+            )
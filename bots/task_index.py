@@ -0,0 +1,244 @@
+"""Module with inverted indexes of quiz tasks used to ask questions on a theme.
+
+The upload keeps sets of IDs of tasks in the tasks database: one per quiz file, named
+after the tournament, and one per stem of the words of the questions. Words are cut to their
+first letters, so forms of the word share the set and the amount of keys is several times smaller
+than with a set per word form. The theme of several words is the intersection
+of their sets. IDs of tasks of every file are kept by the stems of their words too,
+so tasks of the changed or deleted file are removed only from the sets that hold them
+with a single script call, without reading the old questions. Files indexed before
+are removed by the stems of their questions read back from the tasks database.
+The random task on a theme of a single word is drawn from the set with SRANDMEMBER
+in O(1), so tasks are never scanned. The intersection for the theme of several words is stored
+by the bot with SINTERSTORE under the key holding the generation of tasks and expires
+after a while, so it is computed once per generation and then drawn from in O(1) as well.
+
+Tasks served from the corpus are indexed by the ranges of their files in it,
+so only tournaments could be chosen as themes then.
+"""
+
+import os
+import re
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterable, List, Set
+
+from redis import Redis
+from redis.client import Pipeline
+
+from bots.constants import THEME_CHOSEN, THEME_NOT_FOUND, THEME_RESET
+from bots.corpus import CorpusFile
+from bots.task_store import QUESTION_FIELD, TaskText, get_bucket_key
+
+FILE_INDEX_KEY = 'index:file:{theme}'
+WORD_INDEX_KEY = 'index:word:{theme}'
+THEME_CACHE_KEY = 'index:theme:{generation}:{theme}'
+FILE_POSTINGS_KEY = 'index:file_postings:{file_name}'
+LEGACY_FILE_WORDS_KEY = 'index:file_words:{file_name}'
+POSTINGS_SEPARATOR = ' '
+STEM_SEPARATOR = ':'
+IDS_SEPARATOR = ','
+UNINDEX_SCRIPT = """
+for index, word_key in ipairs(KEYS) do
+    for task_id in string.gmatch(ARGV[index], '[^,]+') do
+        redis.call('SREM', word_key, task_id)
+    end
+end
+"""
+CORPUS_RANGE_THEME = 'range:{first_task}:{tasks_count}'
+CORPUS_RANGE_SEPARATOR = ':'
+WORD_PATTERN = re.compile(r'[^\W\d_]{5,}')
+WORD_STEM_LENGTH = 6
+THEME_KEYS_SEPARATOR = ' '
+
+
+def get_file_theme(file_name: str) -> str:
+    """Get theme of tasks of the quiz file, which is the name of the tournament.
+
+    Args:
+        file_name: name of quiz file, like harbr04o.txt.
+
+    Returns:
+        Theme of the file, like harbr04o.
+    """
+    return os.path.splitext(file_name)[0].lower()
+
+
+def get_words(text: str) -> Set[str]:
+    """Get stems of words of the text tasks are indexed by.
+
+    Short words are skipped as they are mostly prepositions and pronouns.
+
+    Args:
+        text: text of the question or the theme typed by the user.
+
+    Returns:
+        Lowercase words of the text cut to WORD_STEM_LENGTH letters.
+    """
+    return {
+        word[:WORD_STEM_LENGTH]
+        for word in WORD_PATTERN.findall(text.lower().replace('ё', 'е'))
+    }
+
+
+def get_theme_keys(theme: str) -> List[str]:
+    """Get keys of indexes which could hold tasks on the theme typed by the user.
+
+    Args:
+        theme: name of the tournament or the word.
+
+    Returns:
+        Key of the tournament index followed by keys of indexes of all the words
+        joined by spaces, if there are any words.
+    """
+    theme_keys = [FILE_INDEX_KEY.format(theme=get_file_theme(theme.strip()))]
+    if words := sorted(get_words(theme)):
+        theme_keys.append(THEME_KEYS_SEPARATOR.join(
+            WORD_INDEX_KEY.format(theme=word) for word in words
+        ))
+    return theme_keys
+
+
+def get_theme_draw_keys(theme: str, generation: int) -> List[str]:
+    """Get key of the set tasks on the theme are drawn from and keys of indexes it is made of.
+
+    Args:
+        theme: keys of indexes of the theme joined by spaces.
+        generation: generation of tasks the intersection of indexes is stored for.
+
+    Returns:
+        Key of the index if the theme has a single one, else key of their stored intersection
+        followed by keys of the indexes.
+    """
+    theme_keys = theme.split(THEME_KEYS_SEPARATOR)
+    if len(theme_keys) == 1:
+        return theme_keys
+    return [THEME_CACHE_KEY.format(generation=generation, theme=theme), *theme_keys]
+
+
+def index_file_tasks(
+    pipeline: Pipeline, file_name: str, task_ids: List[int], tasks: Iterable[TaskText],
+) -> None:
+    """Queue adding tasks of the file to the indexes.
+
+    Args:
+        pipeline: pipeline of tasks database.
+        file_name: name of quiz file.
+        task_ids: IDs of the tasks.
+        tasks: tasks of the file in the order of their IDs.
+    """
+    if not task_ids:
+        return
+    pipeline.sadd(FILE_INDEX_KEY.format(theme=get_file_theme(file_name)), *task_ids)
+    word_task_ids: DefaultDict[str, List[int]] = defaultdict(list)
+    for task_id, task in zip(task_ids, tasks):
+        for word in get_words(task.question):
+            word_task_ids[word].append(task_id)
+    for indexed_word, ids_with_word in word_task_ids.items():
+        pipeline.sadd(WORD_INDEX_KEY.format(theme=indexed_word), *ids_with_word)
+    if word_task_ids:
+        pipeline.set(FILE_POSTINGS_KEY.format(file_name=file_name), POSTINGS_SEPARATOR.join(
+            STEM_SEPARATOR.join((stem, IDS_SEPARATOR.join(map(str, stem_task_ids))))
+            for stem, stem_task_ids in word_task_ids.items()
+        ))
+
+
+def read_file_postings(tasks_db: Redis, file_name: str, task_ids: List[int]) -> Dict[str, str]:
+    """Read IDs of tasks uploaded from the file before by the stems of their words.
+
+    Args:
+        tasks_db: connector to tasks database not decoding responses.
+        file_name: name of quiz file.
+        task_ids: IDs of tasks uploaded from the file before.
+
+    Returns:
+        IDs of tasks joined by IDS_SEPARATOR by stems of words of their questions.
+    """
+    raw_postings = tasks_db.get(FILE_POSTINGS_KEY.format(file_name=file_name))
+    if raw_postings or not task_ids:
+        return dict(
+            posting.split(STEM_SEPARATOR)
+            for posting in (raw_postings or b'').decode().split(POSTINGS_SEPARATOR)
+            if posting
+        )
+    pipeline = tasks_db.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipeline.hget(get_bucket_key(task_id), QUESTION_FIELD.format(task_id=task_id))
+    postings: DefaultDict[str, List[str]] = defaultdict(list)
+    for saved_id, question in zip(task_ids, pipeline.execute()):
+        for word in get_words((question or b'').decode()):
+            postings[word].append(str(saved_id))
+    return {stem: IDS_SEPARATOR.join(stem_ids) for stem, stem_ids in postings.items()}
+
+
+def unindex_file_tasks(
+    tasks_db: Redis, pipeline: Pipeline, file_name: str, task_ids: List[int],
+) -> None:
+    """Queue removing tasks uploaded from the file before from the indexes.
+
+    Every task is removed only from the sets of the stems of its own words,
+    with a single script call per file.
+
+    Args:
+        tasks_db: connector to tasks database not decoding responses.
+        pipeline: pipeline of tasks database.
+        file_name: name of quiz file.
+        task_ids: IDs of tasks uploaded from the file before.
+    """
+    if postings := read_file_postings(tasks_db, file_name, task_ids):
+        tasks_db.register_script(UNINDEX_SCRIPT)(
+            keys=[WORD_INDEX_KEY.format(theme=word) for word in postings],
+            args=list(postings.values()),
+            client=pipeline,
+        )
+    pipeline.delete(
+        FILE_INDEX_KEY.format(theme=get_file_theme(file_name)),
+        FILE_POSTINGS_KEY.format(file_name=file_name),
+        LEGACY_FILE_WORDS_KEY.format(file_name=file_name),
+    )
+
+
+def get_corpus_themes(corpus_files: Iterable[CorpusFile]) -> Dict[str, str]:
+    """Get ranges of tournaments in the corpus by keys of their indexes.
+
+    Args:
+        corpus_files: records of files compiled into the corpus.
+
+    Returns:
+        Themes of ranges of tasks by keys of indexes of the files.
+    """
+    corpus_themes = {}
+    for corpus_file in corpus_files:
+        file_index_key = FILE_INDEX_KEY.format(theme=get_file_theme(corpus_file.file_name))
+        corpus_themes[file_index_key] = CORPUS_RANGE_THEME.format(
+            first_task=corpus_file.first_task, tasks_count=corpus_file.tasks_count,
+        )
+    return corpus_themes
+
+
+def get_corpus_theme_size(corpus_theme: str) -> int:
+    """Get amount of tasks of the tournament in the corpus.
+
+    Args:
+        corpus_theme: range of tasks of the tournament, like range:0:42.
+
+    Returns:
+        Amount of tasks in the range.
+    """
+    return int(corpus_theme.rsplit(CORPUS_RANGE_SEPARATOR, 1)[1])
+
+
+def render_theme(theme: str, theme_size: int) -> str:
+    """Render reply to the choice of the theme.
+
+    Args:
+        theme: theme typed by the user.
+        theme_size: amount of tasks on the chosen theme, 0 if it is reset or -1 if none found.
+
+    Returns:
+        Text whether the theme has been changed.
+    """
+    if theme_size == 0:
+        return THEME_RESET
+    if theme_size < 0:
+        return THEME_NOT_FOUND.format(theme=theme)
+    return THEME_CHOSEN.format(theme=theme, size=theme_size)
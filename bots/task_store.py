@@ -0,0 +1,157 @@
+"""Module with layout of quiz tasks in Redis.
+
+Every task gets a dense integer ID. Questions and answers are packed into hashes
+grouped into buckets of BUCKET_SIZE tasks, so the keyspace stays small.
+IDs of deleted tasks are kept in a set and reused when new tasks are added.
+"""
+
+import json
+from typing import Iterable, List, NamedTuple
+
+from redis import Redis
+from redis.client import Pipeline
+
+BUCKET_SIZE = 64
+BUCKET_KEY = 'tasks:{bucket}'
+QUESTION_FIELD = 'q:{task_id}'
+ANSWER_FIELD = 'a:{task_id}'
+TASKS_COUNTER_KEY = 'tasks:counter'
+FREE_IDS_KEY = 'tasks:free'
+TASKS_GENERATION_KEY = 'tasks:generation'
+RANDOM_TASK_ATTEMPTS = 10
+USERS_KEYS_PATTERN = 'user_*'
+LAST_ASKED_QUESTION_FIELD = 'last_asked_question'
+
+
+class TaskText(NamedTuple):
+    """Class with texts of the task saved to the tasks database."""
+
+    question: str
+    answer: str
+
+
+def get_bucket_key(task_id: int) -> str:
+    """Get key of the hash where the task is stored.
+
+    Args:
+        task_id: ID of the task.
+
+    Returns:
+        Key of the bucket.
+    """
+    return BUCKET_KEY.format(bucket=task_id // BUCKET_SIZE)
+
+
+def add_task(pipeline: Pipeline, task_id: int, question: str, answer: str) -> None:
+    """Queue saving of the task.
+
+    Args:
+        pipeline: pipeline of tasks database.
+        task_id: ID of the task.
+        question: text of the question.
+        answer: text of the answer.
+    """
+    pipeline.hset(
+        get_bucket_key(task_id),
+        mapping={
+            QUESTION_FIELD.format(task_id=task_id): question,
+            ANSWER_FIELD.format(task_id=task_id): answer,
+        },
+    )
+
+
+def release_task_ids(pipeline: Pipeline, task_ids: Iterable[int]) -> None:
+    """Queue deletion of the tasks so their IDs could be reused.
+
+    Args:
+        pipeline: pipeline of tasks database.
+        task_ids: IDs of tasks to be deleted.
+    """
+    released_ids = list(task_ids)
+    for task_id in released_ids:
+        pipeline.hdel(
+            get_bucket_key(task_id),
+            QUESTION_FIELD.format(task_id=task_id),
+            ANSWER_FIELD.format(task_id=task_id),
+        )
+    if released_ids:
+        pipeline.sadd(FREE_IDS_KEY, *released_ids)
+
+
+def allocate_task_ids(tasks_db: Redis, amount: int) -> List[int]:
+    """Allocate IDs for new tasks reusing IDs of deleted tasks first.
+
+    Allocation is atomic, so it is safe for concurrent writers.
+
+    Args:
+        tasks_db: connector to tasks database.
+        amount: amount of IDs needed.
+
+    Returns:
+        Allocated IDs.
+    """
+    if amount <= 0:
+        return []
+    task_ids = [int(task_id) for task_id in tasks_db.spop(FREE_IDS_KEY, amount) or []]
+    if missing := amount - len(task_ids):
+        tasks_counter = tasks_db.incrby(TASKS_COUNTER_KEY, missing)
+        task_ids.extend(range(tasks_counter - missing, tasks_counter))
+    return task_ids
+
+
+def bump_tasks_generation(tasks_db: Redis) -> int:
+    """Mark that tasks have been changed, so answers cached by bots are dropped.
+
+    Args:
+        tasks_db: connector to tasks database.
+
+    Returns:
+        New generation of tasks.
+    """
+    return tasks_db.incr(TASKS_GENERATION_KEY)
+
+
+def is_legacy_layout(tasks_db: Redis) -> bool:
+    """Check if tasks database has layout with question texts as keys.
+
+    Args:
+        tasks_db: connector to tasks database.
+
+    Returns:
+        True if database holds tasks in legacy layout else False.
+    """
+    return not tasks_db.exists(TASKS_COUNTER_KEY) and tasks_db.dbsize() > 0
+
+
+def migrate_legacy_layout(tasks_db: Redis, users_db: Redis, manifest_db: Redis) -> bool:
+    """Drop tasks stored in legacy layout so they could be uploaded from quiz files again.
+
+    Scores of users are kept, but questions which were asked to them are forgotten
+    since the legacy records refer to the question texts. Records of users saved
+    as JSON strings are converted to hashes at the same time.
+
+    Args:
+        tasks_db: connector to tasks database.
+        users_db: connector to users database.
+        manifest_db: connector to manifest database.
+
+    Returns:
+        True if tasks database had legacy layout else False.
+    """
+    if not is_legacy_layout(tasks_db):
+        return False
+    tasks_db.flushdb()
+    manifest_db.flushdb()
+    users_pipeline = users_db.pipeline(transaction=False)
+    for user_id in users_db.scan_iter(match=USERS_KEYS_PATTERN, _type='string'):
+        if not (raw_user_data := users_db.get(user_id)):
+            continue
+        saved_user_data = json.loads(raw_user_data)
+        users_pipeline.delete(user_id)
+        users_pipeline.hset(user_id, mapping={
+            'success': saved_user_data['success'], 'give_up': saved_user_data['give_up'],
+        })
+    for user_key in users_db.scan_iter(match=USERS_KEYS_PATTERN, _type='hash'):
+        users_pipeline.hdel(user_key, LAST_ASKED_QUESTION_FIELD)
+    users_pipeline.execute()
+    return True
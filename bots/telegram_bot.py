@@ -1,28 +1,132 @@
-"""Module for telegram implementation of quiz bot."""
+"""Module for telegram implementation of quiz bot.
+
+Handlers are run on TELEGRAM_WORKERS threads of the dispatcher, so updates are handled
+concurrently; scripts of the quiz are atomic, so concurrent updates of the same user are safe.
+Messages of the user received while his previous message is handled are handled
+in the waiting state of the conversation, which accepts any of its messages.
+Handlers put replies to the outbox, which sends them in the background paced
+by the limits of Telegram, so slow or throttled sending doesn't hold workers.
+"""
 
-import json
 import logging
 import os
-from typing import Optional
+from functools import partial
+from typing import Any, Callable, Optional
 
-from dotenv import load_dotenv
-from redis import Redis
-from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram import Bot, Message, ReplyKeyboardMarkup, ReplyKeyboardRemove, ReplyMarkup, Update
+from telegram.error import RetryAfter
 from telegram.ext import (
     CallbackContext, CommandHandler, ConversationHandler, Filters, MessageHandler, Updater,
 )
 
-from bots.check_answer import is_correct_answer
 from bots.constants import (
-    CANCEL_TEXT, GIVE_UP, GREETING_TG, HELP_TEXT, NEXT, REDIS_HOST, RIGHT_ANSWER, SCORE_TEXT,
-    TASKS_DATABASE, USERS_DATABASE, WRONG_ANSWER, ButtonText,
+    CANCEL_TEXT, CHAT_MESSAGES_BURST, CHAT_MESSAGES_PER_SECOND, GREETING_TG, HELP_TEXT,
+    TASKS_DATABASE, TELEGRAM_MESSAGES_PER_SECOND, TELEGRAM_METRICS_PORT,
+    TELEGRAM_PERSISTENCE_FLUSH_INTERVAL, TELEGRAM_WEBHOOK_LISTEN, TELEGRAM_WEBHOOK_PATH,
+    TELEGRAM_WEBHOOK_PORT, TELEGRAM_WEBHOOK_URL, TELEGRAM_WORKERS, THEME_COMMAND, USERS_DATABASE,
+    ButtonText,
 )
+from bots.corpus import open_configured_corpus
+from bots.metrics import measure_handler, start_metrics_server, watch_answers_cache
+from bots.outbox import Outbox, OutgoingMessage, Pacer
+from bots.quiz_engine import QuizEngine, Reply
+from bots.quiz_scripts import register_quiz_scripts
+from bots.storage import connect
+from bots.telegram_persistence import RedisPersistence
 
 logger = logging.getLogger(__name__)
 
 CHOOSING, CHECK_ANSWER = range(2)
+PLATFORM = 'tg'
+QUIZ_KEY = 'quiz'
+OUTBOX_KEY = 'outbox'
+SEND_METHOD = 'send_message'
+MAIN_KEYBOARD = ReplyKeyboardMarkup([
+    [ButtonText.QUESTION.value, ButtonText.GIVE_UP.value],
+    [ButtonText.SCORE.value, ButtonText.LEADERBOARD.value],
+])
+REMOVED_KEYBOARD = ReplyKeyboardRemove()
+
+
+def get_conversation_state(reply: Reply) -> int:
+    """Get state of the conversation after the reply of the quiz.
+
+    Args:
+        reply: reply of the quiz to the user.
+
+    Returns:
+        Conversation state of checking user's answer if question is open else of command choosing.
+    """
+    return CHECK_ANSWER if reply.is_question_open else CHOOSING
+
+
+def send_message(bot: Bot, message: OutgoingMessage) -> None:
+    """Send the message from the outbox to Telegram.
+
+    Args:
+        bot: Telegram bot.
+        message: message from the outbox.
+    """
+    bot.send_message(chat_id=message.chat_id, **message.fields)
+
+
+def get_retry_after(error: Exception, attempt: int) -> Optional[float]:
+    """Get pause requested by Telegram before sending again.
+
+    Args:
+        error: error of sending.
+        attempt: number of the failed attempt.
+
+    Returns:
+        Pause in seconds if flood control is exceeded else None.
+    """
+    return error.retry_after if isinstance(error, RetryAfter) else None
+
+
+def start_outbox(bot: Bot) -> Outbox:
+    """Start outbox sending messages of the bot within limits of Telegram.
+
+    Args:
+        bot: Telegram bot.
+
+    Returns:
+        Outbox with running senders.
+    """
+    outbox = Outbox(
+        send=partial(send_message, bot),
+        pacer=Pacer(
+            rate=TELEGRAM_MESSAGES_PER_SECOND,
+            chat_rate=CHAT_MESSAGES_PER_SECOND,
+            chat_burst=CHAT_MESSAGES_BURST,
+        ),
+        get_retry_after=get_retry_after,
+        name=SEND_METHOD,
+    )
+    outbox.start()
+    return outbox
+
+
+def send_reply(
+    context: CallbackContext,
+    incoming_message: Message,
+    text: str,
+    reply_markup: Optional[ReplyMarkup] = None,
+) -> None:
+    """Put reply to the message of the user to the outbox.
+
+    Args:
+        context: context of the handler with the outbox.
+        incoming_message: message of the user.
+        text: text of the reply.
+        reply_markup: keyboard sent along with the reply if any.
+    """
+    context.bot_data[OUTBOX_KEY].put(OutgoingMessage(
+        chat_id=incoming_message.chat_id,
+        fields={'text': text, 'reply_markup': reply_markup},
+    ))
 
 
+@measure_handler
 def start(update: Update, context: CallbackContext) -> Optional[int]:
     """Handle /start command.
 
@@ -37,24 +141,18 @@ def start(update: Update, context: CallbackContext) -> Optional[int]:
     """
     if not ((incoming_message := update.message) and (user := update.effective_user)):
         return None
-    keyboard_menu = [
-        [ButtonText.QUESTION.value, ButtonText.GIVE_UP.value], [ButtonText.SCORE.value],
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard_menu)
-    incoming_message.reply_text(
+    send_reply(
+        context,
+        incoming_message,
         text=GREETING_TG.format(user=user.first_name, help=HELP_TEXT),
-        reply_markup=reply_markup,
+        reply_markup=MAIN_KEYBOARD,
     )
-    users_db = context.bot_data['users']
-    user_id_db = f'user_tg_{user.id}'
-    if not users_db.get(user_id_db):
-        users_db.set(
-            user_id_db, json.dumps({'last_asked_question': None, 'success': 0, 'give_up': 0}),
-        )
+    context.bot_data[QUIZ_KEY].register_user(user.id, name=user.first_name)
     logger.info(f'User {user.id} entered the quiz.')
     return CHOOSING
 
 
+@measure_handler
 def help_user(update: Update, context: CallbackContext) -> None:
     """Send information with bot functions when the command /help is issued.
 
@@ -64,9 +162,10 @@ def help_user(update: Update, context: CallbackContext) -> None:
     """
     if not (incoming_message := update.message):
         return
-    incoming_message.reply_text(text=HELP_TEXT)
+    send_reply(context, incoming_message, text=HELP_TEXT)
 
 
+@measure_handler
 def handle_score_request(update: Update, context: CallbackContext) -> None:
     """Send user information about his successful attempts and give ups.
 
@@ -76,14 +175,41 @@ def handle_score_request(update: Update, context: CallbackContext) -> None:
     """
     if not ((incoming_message := update.message) and (user := update.effective_user)):
         return
-    users_db = context.bot_data['users']
-    user_id_db = f'user_tg_{user.id}'
-    saved_user_data = json.loads(users_db.get(user_id_db))
-    successes = saved_user_data['success']
-    give_ups = saved_user_data['give_up']
-    incoming_message.reply_text(text=SCORE_TEXT.format(successes=successes, give_ups=give_ups))
+    reply = context.bot_data[QUIZ_KEY].get_score(user.id)
+    send_reply(context, incoming_message, text=reply.text)
+
+
+@measure_handler
+def handle_leaderboard_request(update: Update, context: CallbackContext) -> None:
+    """Send user the best players of both platforms and his place among them.
+
+    Args:
+        update: incoming update object.
+        context: indicates that this is a callback function.
+    """
+    if not ((incoming_message := update.message) and (user := update.effective_user)):
+        return
+    reply = context.bot_data[QUIZ_KEY].get_leaderboard(user.id)
+    send_reply(context, incoming_message, text=reply.text)
 
 
+@measure_handler
+def handle_theme_request(update: Update, context: CallbackContext) -> None:
+    """Choose theme of questions typed after the command or reset it.
+
+    Args:
+        update: incoming update object.
+        context: indicates that this is a callback function.
+    """
+    incoming_message, user = update.message, update.effective_user
+    if incoming_message is None or user is None:
+        return
+    theme = ' '.join(context.args or [])
+    reply = context.bot_data[QUIZ_KEY].set_theme(user.id, theme)
+    send_reply(context, incoming_message, text=reply.text)
+
+
+@measure_handler
 def handle_new_question_request(update: Update, context: CallbackContext) -> Optional[int]:
     """Send user a question.
 
@@ -96,17 +222,12 @@ def handle_new_question_request(update: Update, context: CallbackContext) -> Opt
     """
     if not ((incoming_message := update.message) and (user := update.effective_user)):
         return None
-    tasks_db = context.bot_data['tasks']
-    random_question = tasks_db.randomkey()
-    user_id_db = f'user_tg_{user.id}'
-    users_db = context.bot_data['users']
-    saved_user_data = json.loads(users_db.get(user_id_db))
-    saved_user_data['last_asked_question'] = random_question
-    users_db.set(user_id_db, json.dumps(saved_user_data))
-    incoming_message.reply_text(random_question)
-    return CHECK_ANSWER
+    reply = context.bot_data[QUIZ_KEY].ask_question(user.id)
+    send_reply(context, incoming_message, text=reply.text)
+    return get_conversation_state(reply)
 
 
+@measure_handler
 def handle_solution_attempt(update: Update, context: CallbackContext) -> Optional[int]:
     """Check user's answer.
 
@@ -119,24 +240,14 @@ def handle_solution_attempt(update: Update, context: CallbackContext) -> Optiona
     """
     if not ((incoming_message := update.message) and (user := update.effective_user)):
         return None
-    user_id_db = f'user_tg_{user.id}'
-    users_db = context.bot_data['users']
-    saved_user_data = json.loads(users_db.get(user_id_db))
-    asked_question = saved_user_data['last_asked_question']
-    tasks_db = context.bot_data['tasks']
-    correct_answer = tasks_db.get(asked_question)
-    users_answer = update.message.text
-    if not users_answer:
+    if not (users_answer := incoming_message.text):
         return None
-    if is_correct_answer(users_answer=users_answer, correct_answer=correct_answer):
-        saved_user_data['success'] += 1
-        users_db.set(user_id_db, json.dumps(saved_user_data))
-        incoming_message.reply_text(RIGHT_ANSWER)
-        return CHOOSING
-    incoming_message.reply_text(WRONG_ANSWER)
-    return CHECK_ANSWER
+    reply = context.bot_data[QUIZ_KEY].attempt(user.id, users_answer)
+    send_reply(context, incoming_message, text=reply.text)
+    return get_conversation_state(reply)
 
 
+@measure_handler
 def handle_give_up_request(update: Update, context: CallbackContext) -> Optional[int]:
     """Send user right answer whe he gives up.
 
@@ -145,22 +256,16 @@ def handle_give_up_request(update: Update, context: CallbackContext) -> Optional
         context: indicates that this is a callback function.
 
     Returns:
-        Conversation state of checking user's answer.
+        Conversation state of command choosing.
     """
     if not ((incoming_message := update.message) and (user := update.effective_user)):
         return None
-    user_id_db = f'user_tg_{user.id}'
-    users_db = context.bot_data['users']
-    saved_user_data = json.loads(users_db.get(user_id_db))
-    saved_user_data['give_up'] += 1
-    users_db.set(user_id_db, json.dumps(saved_user_data))
-    tasks_db = context.bot_data['tasks']
-    asked_question = saved_user_data['last_asked_question']
-    right_answer = tasks_db.get(asked_question)
-    incoming_message.reply_text(GIVE_UP.format(answer=right_answer, next=NEXT))
-    return CHOOSING
+    reply = context.bot_data[QUIZ_KEY].give_up(user.id)
+    send_reply(context, incoming_message, text=reply.text)
+    return get_conversation_state(reply)
 
 
+@measure_handler
 def cancel(update: Update, context: CallbackContext) -> Optional[int]:
     """Cancel and end the conversation.
 
@@ -173,11 +278,24 @@ def cancel(update: Update, context: CallbackContext) -> Optional[int]:
     """
     if not ((incoming_message := update.message) and (user := update.effective_user)):
         return None
-    incoming_message.reply_text(text=CANCEL_TEXT, reply_markup=ReplyKeyboardRemove())
+    send_reply(context, incoming_message, text=CANCEL_TEXT, reply_markup=REMOVED_KEYBOARD)
     logger.info(f'User {user.id} left the quiz.')
     return ConversationHandler.END
 
 
+def make_button_handler(button: ButtonText, callback: Callable[..., Any]) -> MessageHandler:
+    """Make handler of the keyboard button.
+
+    Args:
+        button: button of the keyboard.
+        callback: handler of the button.
+
+    Returns:
+        Handler of the messages with the text of the button.
+    """
+    return MessageHandler(Filters.regex(f'^{button.value}$'), callback)
+
+
 def error_handler(update: object, context: CallbackContext) -> None:
     """Log the error happened during bot running.
 
@@ -188,48 +306,83 @@ def error_handler(update: object, context: CallbackContext) -> None:
     logger.error(msg='Exception while handling an update:', exc_info=context.error)
 
 
-def main() -> None:
-    """Run the bot as script."""
-    logging.basicConfig(
-        format='TELEGRAM_BOT %(asctime)s %(levelname)s: %(message)s',
-        level=logging.INFO,
-    )
-    load_dotenv()
-    telegram_token = os.getenv('TELEGRAM_TOKEN')
-    updater = Updater(telegram_token)
-    dispatcher = updater.dispatcher
-    tasks_connector = Redis(host=REDIS_HOST, db=TASKS_DATABASE, decode_responses=True)
-    users_connector = Redis(host=REDIS_HOST, db=USERS_DATABASE, decode_responses=True)
-    dispatcher.bot_data = {'tasks': tasks_connector, 'users': users_connector}
-    conversation_handler = ConversationHandler(
+def create_conversation_handler() -> ConversationHandler:
+    """Create handler of the quiz conversation run on workers of the dispatcher.
+
+    Returns:
+        Persistent conversation handler.
+    """
+    answer_handlers = [
+        make_button_handler(ButtonText.QUESTION, handle_new_question_request),
+        make_button_handler(ButtonText.SCORE, handle_score_request),
+        make_button_handler(ButtonText.LEADERBOARD, handle_leaderboard_request),
+        make_button_handler(ButtonText.GIVE_UP, handle_give_up_request),
+        CommandHandler(THEME_COMMAND, handle_theme_request),
+        CommandHandler('help', help_user),
+        MessageHandler(Filters.text ^ Filters.command, handle_solution_attempt),
+    ]
+    return ConversationHandler(
         entry_points=[CommandHandler('start', start)],
         states={
             CHOOSING: [
-                MessageHandler(
-                    Filters.regex(f'^{ButtonText.QUESTION.value}$'), handle_new_question_request,
-                ),
-                MessageHandler(Filters.regex(f'^{ButtonText.SCORE.value}$'), handle_score_request),
-                CommandHandler('help', help_user),
-            ],
-            CHECK_ANSWER: [
-                MessageHandler(
-                    Filters.regex(f'^{ButtonText.QUESTION.value}$'), handle_new_question_request,
-                ),
-                MessageHandler(Filters.regex(f'^{ButtonText.SCORE.value}$'), handle_score_request),
-                MessageHandler(
-                    Filters.regex(f'^{ButtonText.GIVE_UP.value}$'), handle_give_up_request,
-                ),
+                make_button_handler(ButtonText.QUESTION, handle_new_question_request),
+                make_button_handler(ButtonText.SCORE, handle_score_request),
+                make_button_handler(ButtonText.LEADERBOARD, handle_leaderboard_request),
+                CommandHandler(THEME_COMMAND, handle_theme_request),
                 CommandHandler('help', help_user),
-                MessageHandler(Filters.text ^ Filters.command, handle_solution_attempt),
             ],
+            CHECK_ANSWER: answer_handlers,
+            ConversationHandler.WAITING: answer_handlers,
         },
         fallbacks=[CommandHandler('cancel', cancel)],
+        name=QUIZ_KEY,
+        persistent=True,
+        run_async=True,
     )
-    dispatcher.add_handler(conversation_handler)
+
+
+def main() -> None:
+    """Run the bot as script."""
+    logging.basicConfig(
+        format='TELEGRAM_BOT %(asctime)s %(levelname)s: %(message)s',
+        level=logging.INFO,
+    )
+    telegram_token = os.getenv('TELEGRAM_TOKEN', '')
+    users_connector = connect(USERS_DATABASE, decode_responses=True)
+    persistence = RedisPersistence(redis_db=users_connector)
+    updater = Updater(telegram_token, workers=TELEGRAM_WORKERS, persistence=persistence)
+    updater.job_queue.run_repeating(
+        persistence.flush_job, interval=TELEGRAM_PERSISTENCE_FLUSH_INTERVAL,
+    )
+    dispatcher = updater.dispatcher
+    quiz = QuizEngine(
+        scripts=register_quiz_scripts(
+            users_db=users_connector,
+            tasks_db=connect(TASKS_DATABASE, decode_responses=True, is_read_only=True),
+            themes_db=connect(TASKS_DATABASE, decode_responses=True),
+        ),
+        platform=PLATFORM,
+        corpus=open_configured_corpus(),
+    )
+    watch_answers_cache(quiz.answers_cache)
+    outbox = start_outbox(updater.bot)
+    dispatcher.bot_data = {QUIZ_KEY: quiz, OUTBOX_KEY: outbox}
+    dispatcher.add_handler(create_conversation_handler())
     dispatcher.add_error_handler(error_handler)
-    updater.start_polling()
+    if TELEGRAM_WEBHOOK_URL:
+        url_path = TELEGRAM_WEBHOOK_PATH or telegram_token
+        updater.start_webhook(
+            listen=TELEGRAM_WEBHOOK_LISTEN,
+            port=TELEGRAM_WEBHOOK_PORT,
+            url_path=url_path,
+            webhook_url=f'{TELEGRAM_WEBHOOK_URL.rstrip("/")}/{url_path}',
+        )
+    else:
+        updater.start_polling()
+    start_metrics_server(TELEGRAM_METRICS_PORT)
     logger.info('Bot started.')
     updater.idle()
+    outbox.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,386 @@
+"""Module with Redis persistence of telegram conversations.
+
+States of conversations are kept in Redis instead of the memory of the process,
+so restarts don't drop users out of their conversations and several replicas
+of the bot could serve the same users. Every state is loaded from Redis only when
+its conversation gets an update, so start of the bot doesn't depend on amount of users.
+Changed states are buffered and written with a single pipeline on every flush.
+
+Handlers are run on the pool of workers, so the conversation handler keeps the state
+returned by the running handler as the promise along with the previous state.
+Promises can't be written to Redis, so they are kept in the memory of the process,
+and the state the handler returns is buffered once it finishes, while the previous state
+stays in Redis for other replicas meanwhile.
+"""
+
+import json
+import threading
+from collections import defaultdict
+from functools import partial
+from typing import Any, DefaultDict, Dict, Iterator, MutableMapping, Optional, Tuple, cast
+
+from redis import Redis, RedisError
+from redis.client import Pipeline
+from telegram.ext import BasePersistence, CallbackContext, ConversationHandler
+from telegram.ext.utils.promise import Promise
+from telegram.ext.utils.types import ConversationDict
+
+from bots.metrics import REDIS_STAGE, measure
+
+CONVERSATIONS_KEY = 'tg_conversations:{name}'
+CONVERSATION_KEY_SEPARATOR = ':'
+
+ConversationKey = Tuple[int, ...]
+RunningState = Tuple[object, Promise]
+
+
+def encode_conversation_key(conversation_key: ConversationKey) -> str:
+    """Encode key of the conversation into field of Redis hash.
+
+    Args:
+        conversation_key: IDs of the chat and the user.
+
+    Returns:
+        Field of the conversation.
+    """
+    return CONVERSATION_KEY_SEPARATOR.join(str(key_part) for key_part in conversation_key)
+
+
+def decode_conversation_key(conversation_field: str) -> ConversationKey:
+    """Decode key of the conversation from field of Redis hash.
+
+    Args:
+        conversation_field: field of the conversation.
+
+    Returns:
+        IDs of the chat and the user.
+    """
+    return tuple(int(key_part) for key_part in conversation_field.split(CONVERSATION_KEY_SEPARATOR))
+
+
+def is_running_state(state: object) -> bool:
+    """Check whether the state is kept while its handler is running.
+
+    Args:
+        state: state of the conversation.
+
+    Returns:
+        True if it is the previous state along with the promise of the handler else False.
+    """
+    if not isinstance(state, tuple) or len(state) != 2:
+        return False
+    return isinstance(state[1], Promise)
+
+
+def settle_state(state: object) -> object:
+    """Get the state which the conversation has once running handlers before it finish.
+
+    Handlers which have not finished yet or have failed keep their previous states.
+
+    Args:
+        state: state of the conversation, which could be of running handlers one after another.
+
+    Returns:
+        State of the conversation without promises.
+    """
+    while is_running_state(state):
+        previous_state, promise = cast(RunningState, state)
+        is_finished = promise.done.is_set() and promise.exception is None
+        handler_state = promise.result() if is_finished else None
+        state = previous_state if handler_state is None else handler_state
+    return state
+
+
+class RedisConversations(MutableMapping[ConversationKey, object]):
+    """Class with states of conversations stored in Redis hash.
+
+    Changed states are kept in the buffer until they are flushed. Other states
+    are read from Redis every time, so states changed by other replicas are seen
+    once they are flushed there. States must be JSON serializable, except for states
+    of running handlers, which are kept in memory until handlers finish.
+    """
+
+    def __init__(self, redis_db: Redis, name: str) -> None:
+        """Init mapping of conversations.
+
+        Args:
+            redis_db: connector to database where conversations are stored.
+            name: name of the conversation handler.
+        """
+        self.redis_db = redis_db
+        self.key = CONVERSATIONS_KEY.format(name=name)
+        self.pending_states: Dict[str, Optional[str]] = {}
+        self.running_states: Dict[str, RunningState] = {}
+        self.pending_lock = threading.Lock()
+
+    def __getitem__(self, conversation_key: ConversationKey) -> object:
+        """Get state of the conversation.
+
+        Args:
+            conversation_key: IDs of the chat and the user.
+
+        Returns:
+            State of the conversation.
+
+        Raises:
+            KeyError: if conversation is not found.
+        """
+        with self.pending_lock:
+            running_state = self.running_states.get(encode_conversation_key(conversation_key))
+        if running_state is not None:
+            return running_state
+        if (raw_state := self.load_raw_state(conversation_key)) is None:
+            raise KeyError(conversation_key)
+        return json.loads(raw_state)
+
+    def __setitem__(self, conversation_key: ConversationKey, state: object) -> None:
+        """Save state of the conversation to the buffer or keep it while its handler runs.
+
+        Args:
+            conversation_key: IDs of the chat and the user.
+            state: new state of the conversation.
+        """
+        conversation_field = encode_conversation_key(conversation_key)
+        if is_running_state(state):
+            self.keep_running_state(conversation_field, cast(RunningState, state))
+            return
+        with self.pending_lock:
+            self.running_states.pop(conversation_field, None)
+            self.pending_states[conversation_field] = json.dumps(state)
+
+    def __delitem__(self, conversation_key: ConversationKey) -> None:
+        """Mark ended conversation for deletion.
+
+        Args:
+            conversation_key: IDs of the chat and the user.
+
+        Raises:
+            KeyError: if conversation is not found.
+        """
+        conversation_field = encode_conversation_key(conversation_key)
+        with self.pending_lock:
+            running_state = self.running_states.pop(conversation_field, None)
+        if running_state is None and self.load_raw_state(conversation_key) is None:
+            raise KeyError(conversation_key)
+        with self.pending_lock:
+            self.pending_states[conversation_field] = None
+
+    def __iter__(self) -> Iterator[ConversationKey]:
+        """Iterate over flushed conversations.
+
+        Yields:
+            IDs of the chat and the user of every conversation.
+        """
+        yield from (
+            decode_conversation_key(conversation_field)
+            for conversation_field, _ in self.redis_db.hscan_iter(self.key)
+        )
+
+    def __len__(self) -> int:
+        """Count flushed conversations.
+
+        Returns:
+            Amount of conversations.
+        """
+        return self.redis_db.hlen(self.key)
+
+    def keep_running_state(self, conversation_field: str, running_state: RunningState) -> None:
+        """Keep the state of the running handler until it finishes.
+
+        Args:
+            conversation_field: field of the conversation.
+            running_state: previous state along with the promise of the handler.
+        """
+        with self.pending_lock:
+            self.running_states[conversation_field] = running_state
+        running_state[1].add_done_callback(
+            partial(self.finish_running_state, conversation_field, running_state),
+        )
+
+    def finish_running_state(
+        self, conversation_field: str, running_state: RunningState, handler_state: object,
+    ) -> None:
+        """Buffer the state returned by the handler once it finishes.
+
+        The previous state is kept if the handler returns nothing, and the conversation
+        is ended if there is no state at all, as the conversation handler does.
+        The previous state is settled first, as it could be of the handler which has been
+        running when the finished one started.
+        Nothing is buffered if the conversation has changed since the handler started.
+
+        Args:
+            conversation_field: field of the conversation.
+            running_state: previous state along with the promise of the handler.
+            handler_state: state returned by the handler.
+        """
+        new_state = settle_state(running_state[0]) if handler_state is None else handler_state
+        is_ended = new_state is None or new_state == ConversationHandler.END
+        with self.pending_lock:
+            if self.running_states.get(conversation_field) is not running_state:
+                return
+            self.running_states.pop(conversation_field)
+            self.pending_states[conversation_field] = None if is_ended else json.dumps(new_state)
+
+    def load_raw_state(self, conversation_key: ConversationKey) -> Optional[str]:
+        """Load state of the conversation from the buffer or from Redis.
+
+        Args:
+            conversation_key: IDs of the chat and the user.
+
+        Returns:
+            State of the conversation in JSON format or None if conversation is not found.
+        """
+        conversation_field = encode_conversation_key(conversation_key)
+        with self.pending_lock:
+            is_pending = conversation_field in self.pending_states
+            pending_state = self.pending_states.get(conversation_field)
+        if is_pending:
+            return pending_state
+        with measure(REDIS_STAGE, 'load_conversation_state'):
+            return self.redis_db.hget(self.key, conversation_field)
+
+    def queue_pending_states(self, pipeline: Pipeline) -> Dict[str, Optional[str]]:
+        """Queue writing of buffered states and clear the buffer.
+
+        Args:
+            pipeline: pipeline of database where conversations are stored.
+
+        Returns:
+            Queued states, so they could be buffered again if writing fails.
+        """
+        with self.pending_lock:
+            pending_states = self.pending_states
+            self.pending_states = {}
+        for conversation_field, raw_state in pending_states.items():
+            if raw_state is None:
+                pipeline.hdel(self.key, conversation_field)
+            else:
+                pipeline.hset(self.key, conversation_field, raw_state)
+        return pending_states
+
+    def restore_pending_states(self, pending_states: Dict[str, Optional[str]]) -> None:
+        """Put states which failed to be written back to the buffer.
+
+        States changed since the failed flush are kept.
+
+        Args:
+            pending_states: states which failed to be written.
+        """
+        with self.pending_lock:
+            self.pending_states = {**pending_states, **self.pending_states}
+
+
+class RedisPersistence(BasePersistence):
+    """Persistence which keeps only states of conversations in Redis.
+
+    Data of users, chats and bot is not persisted as the quiz keeps its data itself.
+    Buffered states should be flushed periodically with flush_job.
+    """
+
+    def __init__(self, redis_db: Redis) -> None:
+        """Init persistence.
+
+        Args:
+            redis_db: connector to database where conversations are stored.
+        """
+        super().__init__(store_user_data=False, store_chat_data=False, store_bot_data=False)
+        self.redis_db = redis_db
+        self.conversation_mappings: Dict[str, RedisConversations] = {}
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        """Get mapping of conversations backed by Redis.
+
+        Args:
+            name: name of the conversation handler.
+
+        Returns:
+            Conversations of the handler.
+        """
+        conversations = RedisConversations(redis_db=self.redis_db, name=name)
+        self.conversation_mappings[name] = conversations
+        return conversations  # type: ignore
+
+    def flush(self) -> None:
+        """Write buffered states of all conversations with a single pipeline.
+
+        Raises:
+            RedisError: if states failed to be written, they are kept in the buffer then.
+        """
+        pipeline = self.redis_db.pipeline(transaction=False)
+        queued_states = {
+            name: conversations.queue_pending_states(pipeline)
+            for name, conversations in self.conversation_mappings.items()
+        }
+        try:
+            with measure(REDIS_STAGE, 'flush_conversation_states'):
+                pipeline.execute()
+        except RedisError:
+            for name, pending_states in queued_states.items():
+                self.conversation_mappings[name].restore_pending_states(pending_states)
+            raise
+
+    def flush_job(self, context: CallbackContext) -> None:
+        """Flush buffered states as repeating job of the bot.
+
+        Args:
+            context: indicates that this is a callback function.
+        """
+        self.flush()
+
+    def update_conversation(
+        self, name: str, key: ConversationKey, new_state: Optional[object],
+    ) -> None:
+        """Do nothing as mapping of conversations buffers states itself.
+
+        Args:
+            name: name of the conversation handler.
+            key: IDs of the chat and the user.
+            new_state: new state of the conversation.
+        """
+
+    def get_user_data(self) -> DefaultDict[int, Dict[Any, Any]]:
+        """Get empty data of users as it is not persisted.
+
+        Returns:
+            Empty data of users.
+        """
+        return defaultdict(dict)
+
+    def get_chat_data(self) -> DefaultDict[int, Dict[Any, Any]]:
+        """Get empty data of chats as it is not persisted.
+
+        Returns:
+            Empty data of chats.
+        """
+        return defaultdict(dict)
+
+    def get_bot_data(self) -> Dict[Any, Any]:
+        """Get empty data of bot as it is not persisted.
+
+        Returns:
+            Empty data of bot.
+        """
+        return {}
+
+    def update_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        """Do nothing as data of users is not persisted.
+
+        Args:
+            user_id: id of the user.
+            user_data: data of the user.
+        """
+
+    def update_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        """Do nothing as data of chats is not persisted.
+
+        Args:
+            chat_id: id of the chat.
+            chat_data: data of the chat.
+        """
+
+    def update_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        """Do nothing as data of bot is not persisted.
+
+        Args:
+            bot_data: data of the bot.
+        """
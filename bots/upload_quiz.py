@@ -1,75 +1,565 @@
-"""Module for creating quiz questions and answers pairs in Redis from quiz fixture files."""
+"""Module for creating quiz questions and answers pairs in Redis from quiz fixture files.
 
+The upload publishes its progress and the ready flag, so it could run in the background
+while bots serve the tasks uploaded before.
+
+Run with "build" command, it compiles quiz files into the corpus instead, which could be
+uploaded to Redis with --corpus option or served by bots straight from the file.
+"""
+
+import argparse
 import logging
 import os
-import re
 import time
-from os.path import join
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+)
+from contextlib import closing
 from pathlib import Path
+from queue import Full, Queue
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
 
-from dotenv import load_dotenv
 from redis import Redis
+from redis.client import Pipeline
 
-from bots.constants import (
-    ANSWER_REGEX, PICTURE_INDICATOR, QUESTION_REGEX, REDIS_HOST, TASKS_DATABASE,
+from bots.constants import MANIFEST_DATABASE, QUIZ_CORPUS_PATH, TASKS_DATABASE, USERS_DATABASE
+from bots.corpus import QuizCorpus, write_corpus
+from bots.leaderboard import backfill_leaderboard
+from bots.manifest import (
+    FileRecord, get_file_task_ids, load_manifest, mark_pending, remove_file_record,
+    save_file_record, stat_quiz_file,
+)
+from bots.quiz_parser import ParsedFile, parse_quiz_tasks
+from bots.readiness import count_uploaded_file, finish_upload_progress, start_upload_progress
+from bots.storage import connect
+from bots.task_index import index_file_tasks, unindex_file_tasks
+from bots.task_store import (
+    TASKS_GENERATION_KEY, TaskText, add_task, allocate_task_ids, bump_tasks_generation,
+    migrate_legacy_layout, release_task_ids,
 )
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_QUIZ_TASKS_DIR = os.path.join(Path(__file__).absolute().parent.parent, 'quiz_tasks')
+DEFAULT_CORPUS_PATH = os.path.join(Path(__file__).absolute().parent.parent, 'quiz_corpus.bin')
+UPLOAD_COMMAND = 'upload'
+BUILD_COMMAND = 'build'
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_WRITERS = 1
+DEFAULT_BATCH_SIZE = 1000
+QUEUED_FILES_PER_WORKER = 4
+QUEUE_POLL_TIMEOUT = 1
+
+Manifest = Dict[str, FileRecord]
+
+
+class UploadedFile(NamedTuple):
+    """Class with texts of tasks of the quiz file to be uploaded along with record of the file."""
+
+    file_name: str
+    file_record: FileRecord
+    tasks: List[TaskText]
+
+
+class WrittenFile(NamedTuple):
+    """Class with the final record of the file written by the upload."""
+
+    file_record: FileRecord
+    task_ids: Optional[List[int]]
+
+
+def iterate_parsed_files(
+    quiz_folder: str, file_names: Iterable[str], workers: int,
+) -> Iterable[ParsedFile]:
+    """Parse quiz files on a process pool keeping limited number of files in flight.
+
+    Only a few results per worker are kept in memory at once, so memory consumption
+    does not depend on the size of the quiz tasks folder.
+
+    Args:
+        quiz_folder: path to folder with quiz tasks.
+        file_names: names of quiz files.
+        workers: number of parsing processes.
+
+    Yields:
+        Parsed files in order of parsing completion.
+    """
+    max_in_flight = workers * QUEUED_FILES_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight: Set[Future] = set()
+        for file_name in file_names:
+            in_flight.add(executor.submit(parse_quiz_tasks, quiz_folder, file_name))
+            if len(in_flight) < max_in_flight:
+                continue
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from (log_malformed_blocks(future.result()) for future in done)
+        yield from (log_malformed_blocks(future.result()) for future in in_flight)
+
+
+def log_malformed_blocks(parsed_file: ParsedFile) -> ParsedFile:
+    """Log blocks of the parsed file which could not be parsed into tasks.
+
+    Args:
+        parsed_file: parsed quiz file.
+
+    Returns:
+        The same parsed file.
+    """
+    for block in parsed_file.malformed_blocks:
+        location = f'{block.file_name}:{block.line_number}'
+        logger.warning(f'Malformed block at {location}: {block.reason}.')
+    return parsed_file
+
+
+def get_uploaded_file(parsed_file: ParsedFile) -> UploadedFile:
+    """Keep only questions and answers of the parsed file, which are uploaded to Redis.
+
+    Args:
+        parsed_file: parsed quiz file.
+
+    Returns:
+        Texts of tasks of the file along with its record.
+    """
+    return UploadedFile(
+        file_name=parsed_file.file_name,
+        file_record=parsed_file.file_record,
+        tasks=[TaskText(question=task.question, answer=task.answer) for task in parsed_file.tasks],
+    )
 
 
-def parse_quiz_file(path_to_file: str) -> zip:
-    """Parse quiz file and make pairs of questions and answers.
+def queue_file_tasks(
+    tasks_db: Redis,
+    tasks_pipeline: Pipeline,
+    manifest_db: Redis,
+    manifest_pipeline: Pipeline,
+    uploaded_file: UploadedFile,
+) -> List[int]:
+    """Queue writing of the file tasks reusing IDs of tasks previously uploaded from the file.
 
-    If question supposed to be with picture he won't be added to database.
+    IDs which are no longer needed by the file are released. Tasks uploaded from the file
+    before are removed from the indexes and the new ones are indexed. The pending record
+    of the file with both old and new IDs is queued to the manifest pipeline.
 
     Args:
-        path_to_file: path to file with quiz content.
+        tasks_db: connector to tasks database.
+        tasks_pipeline: pipeline of tasks database.
+        manifest_db: connector to manifest database.
+        manifest_pipeline: pipeline of manifest database, which is flushed before tasks.
+        uploaded_file: texts of tasks of the quiz file.
 
     Returns:
-        Questions and answers for them as zip generator.
-    """
-    with open(path_to_file, encoding='KOI8-R') as quiz_file:
-        quiz_content = quiz_file.read()
-    split_content = iter(quiz_content.replace('\n\n\n', '\n\n').split('\n\n'))
-    questions = []
-    answers = []
-    for split in split_content:
-        if PICTURE_INDICATOR in split:
-            next(split_content, None)
-            continue
-        elif re.match(QUESTION_REGEX, split):
-            questions.append(re.sub(QUESTION_REGEX, '', split))
-        elif re.match(ANSWER_REGEX, split):
-            answers.append(re.sub(ANSWER_REGEX, '', split))
-    return zip(questions, answers)
-
-
-def load_quiz_tasks(quiz_folder: str) -> None:
+        IDs of queued tasks.
+    """
+    tasks_amount = len(uploaded_file.tasks)
+    saved_task_ids = get_file_task_ids(manifest_db, uploaded_file.file_name)
+    unindex_file_tasks(tasks_db, tasks_pipeline, uploaded_file.file_name, saved_task_ids)
+    release_task_ids(tasks_pipeline, saved_task_ids[tasks_amount:])
+    task_ids = saved_task_ids[:tasks_amount]
+    task_ids.extend(allocate_task_ids(tasks_db, tasks_amount - len(task_ids)))
+    save_file_record(
+        manifest_pipeline,
+        uploaded_file.file_name,
+        mark_pending(uploaded_file.file_record),
+        {*saved_task_ids, *task_ids},
+    )
+    for task_id, task in zip(task_ids, uploaded_file.tasks):
+        add_task(tasks_pipeline, task_id, task.question, task.answer)
+    index_file_tasks(tasks_pipeline, uploaded_file.file_name, task_ids, uploaded_file.tasks)
+    return task_ids
+
+
+def flush_quiz_tasks(
+    tasks_pipeline: Pipeline, manifest_pipeline: Pipeline, written_files: Dict[str, WrittenFile],
+) -> None:
+    """Flush queued tasks between pending and final records of their files.
+
+    Args:
+        tasks_pipeline: pipeline of tasks database.
+        manifest_pipeline: pipeline of manifest database with pending records.
+        written_files: records of files and IDs of their tasks, None if tasks haven't changed.
+    """
+    manifest_pipeline.execute()
+    tasks_pipeline.execute()
+    for file_name, (file_record, task_ids) in written_files.items():
+        save_file_record(manifest_pipeline, file_name, file_record, task_ids)
+    manifest_pipeline.execute()
+    written_files.clear()
+
+
+def write_quiz_tasks(
+    tasks_queue: 'Queue[Optional[UploadedFile]]', manifest: Manifest, batch_size: int,
+) -> int:
+    """Write tasks from the queue to Redis flushing pipeline every time batch is full.
+
+    Tasks are written only for files which content has changed since the last upload.
+    Pending records of files are flushed before tasks and final ones after them,
+    so the manifest never refers to tasks that were not written as uploaded
+    and never loses IDs of the written ones. Writer stops when it receives None from the queue.
+
+    Args:
+        tasks_queue: queue with files to be uploaded.
+        manifest: records of files uploaded before.
+        batch_size: amount of tasks to be flushed with single pipeline execution.
+
+    Returns:
+        Amount of tasks written.
+    """
+    tasks_db = connect(TASKS_DATABASE)
+    tasks_pipeline = tasks_db.pipeline(transaction=False)
+    manifest_db = connect(MANIFEST_DATABASE, decode_responses=True)
+    manifest_pipeline = manifest_db.pipeline(transaction=False)
+    written_files: Dict[str, WrittenFile] = {}
+    written = 0
+    while (uploaded_file := tasks_queue.get()) is not None:
+        saved_record = manifest.get(uploaded_file.file_name)
+        task_ids = None
+        if uploaded_file.file_record.is_content_changed(saved_record):
+            task_ids = queue_file_tasks(
+                tasks_db, tasks_pipeline, manifest_db, manifest_pipeline, uploaded_file,
+            )
+            written += len(task_ids)
+        written_files[uploaded_file.file_name] = WrittenFile(uploaded_file.file_record, task_ids)
+        count_uploaded_file(tasks_pipeline, len(task_ids or []))
+        if len(tasks_pipeline) >= batch_size:
+            flush_quiz_tasks(tasks_pipeline, manifest_pipeline, written_files)
+    flush_quiz_tasks(tasks_pipeline, manifest_pipeline, written_files)
+    return written
+
+
+def put_to_queue(
+    tasks_queue: 'Queue[Optional[UploadedFile]]',
+    uploaded_file: Optional[UploadedFile],
+    writers: List[Future],
+) -> None:
+    """Put file to bounded queue without hanging forever if writers have failed.
+
+    Args:
+        tasks_queue: queue with files to be uploaded.
+        uploaded_file: file to put to the queue.
+        writers: futures of the writers consuming the queue.
+    """
+    while True:
+        try:
+            tasks_queue.put(uploaded_file, timeout=QUEUE_POLL_TIMEOUT)
+        except Full:
+            for writer in writers:
+                if writer.done():
+                    writer.result()
+        else:
+            break
+
+
+def stop_writers(tasks_queue: 'Queue[Optional[UploadedFile]]', writers: List[Future]) -> None:
+    """Send None to every writer, so it flushes its pipelines and stops.
+
+    Args:
+        tasks_queue: queue with files to be uploaded.
+        writers: futures of the writers consuming the queue.
+    """
+    for _ in writers:
+        put_to_queue(tasks_queue, None, writers)
+
+
+def remove_deleted_files(file_names: List[str], batch_size: int) -> Manifest:
+    """Delete tasks of quiz files which have been removed since the last upload.
+
+    Pipelines are flushed every time batch is full. Tasks are removed before records
+    of their files, so the removal is repeated if the upload crashes in between.
+    Released IDs are reused only after all removals, so repeating them is safe.
+
+    Args:
+        file_names: names of existing quiz files.
+        batch_size: amount of commands to be flushed with single pipeline execution.
+
+    Returns:
+        Records of files uploaded before which still exist.
+    """
+    manifest_db = connect(MANIFEST_DATABASE, decode_responses=True)
+    manifest = load_manifest(manifest_db)
+    if not (removed_files := manifest.keys() - set(file_names)):
+        return manifest
+    logger.info(f'Removing tasks of {len(removed_files)} deleted files.')
+    tasks_db = connect(TASKS_DATABASE)
+    tasks_pipeline = tasks_db.pipeline(transaction=False)
+    manifest_pipeline = manifest_db.pipeline(transaction=False)
+    for file_name in removed_files:
+        removed_task_ids = get_file_task_ids(manifest_db, file_name)
+        unindex_file_tasks(tasks_db, tasks_pipeline, file_name, removed_task_ids)
+        release_task_ids(tasks_pipeline, removed_task_ids)
+        remove_file_record(manifest_pipeline, file_name)
+        manifest.pop(file_name)
+        if len(tasks_pipeline) >= batch_size:
+            tasks_pipeline.execute()
+            manifest_pipeline.execute()
+    tasks_pipeline.incr(TASKS_GENERATION_KEY)
+    tasks_pipeline.execute()
+    manifest_pipeline.execute()
+    return manifest
+
+
+def find_modified_files(quiz_folder: str, file_names: List[str], manifest: Manifest) -> List[str]:
+    """Find files which are new or could have been modified since the last upload.
+
+    Args:
+        quiz_folder: path to folder with quiz tasks.
+        file_names: names of quiz files.
+        manifest: records of files uploaded before.
+
+    Returns:
+        Names of files to be parsed.
+    """
+    modified_files = []
+    for file_name in file_names:
+        file_record = stat_quiz_file(os.path.join(quiz_folder, file_name))
+        if file_record.is_modified(manifest.get(file_name)):
+            modified_files.append(file_name)
+    return modified_files
+
+
+def upload_quiz_files(
+    uploaded_files: Iterable[UploadedFile], manifest: Manifest, writers: int, batch_size: int,
+) -> int:
+    """Pass files through a bounded queue to writer threads.
+
+    Writers are stopped even if parsing fails, so its error is raised instead of hanging
+    on writers waiting for files forever.
+
+    Args:
+        uploaded_files: texts of tasks of quiz files.
+        manifest: records of files uploaded before.
+        writers: number of threads writing tasks to Redis.
+        batch_size: amount of tasks to be flushed with single pipeline execution.
+
+    Returns:
+        Amount of tasks written.
+
+    Raises:
+        Exception: error of parsing is raised again once writers are stopped.
+    """
+    tasks_queue: 'Queue[Optional[UploadedFile]]' = Queue(
+        maxsize=writers * QUEUED_FILES_PER_WORKER,
+    )
+    with ThreadPoolExecutor(max_workers=writers) as writers_executor:
+        writers_futures = []
+        for _ in range(writers):
+            writer = writers_executor.submit(write_quiz_tasks, tasks_queue, manifest, batch_size)
+            writers_futures.append(writer)
+        try:
+            for uploaded_file in uploaded_files:
+                put_to_queue(tasks_queue, uploaded_file, writers_futures)
+        except Exception:
+            stop_writers(tasks_queue, writers_futures)
+            raise
+        stop_writers(tasks_queue, writers_futures)
+        return sum(writer_future.result() for writer_future in writers_futures)
+
+
+def prepare_tasks_database() -> None:
+    """Drop tasks in the legacy layout so they are uploaded again and backfill the leaderboard."""
+    is_migrated = migrate_legacy_layout(
+        tasks_db=connect(TASKS_DATABASE),
+        users_db=connect(USERS_DATABASE),
+        manifest_db=connect(MANIFEST_DATABASE),
+    )
+    if is_migrated:
+        logger.info('Tasks in legacy layout were dropped: all tasks will be uploaded again.')
+    if backfilled := backfill_leaderboard(connect(USERS_DATABASE, decode_responses=True)):
+        logger.info(f'Added {backfilled} users to the leaderboard.')
+
+
+def finish_upload(uploaded: int, starting_time: float) -> None:
+    """Bump generation of tasks if any task has been changed, set the ready flag and log the result.
+
+    Args:
+        uploaded: amount of tasks written.
+        starting_time: moment the upload started at.
+    """
+    tasks_db = connect(TASKS_DATABASE)
+    if uploaded:
+        bump_tasks_generation(tasks_db)
+    finish_upload_progress(tasks_db, is_successful=True)
+    uploading_time = time.time() - starting_time
+    logger.info(f'Uploaded {uploaded} tasks in {uploading_time} seconds.')
+
+
+def load_quiz_tasks(
+    quiz_folder: str,
+    workers: int = DEFAULT_WORKERS,
+    writers: int = DEFAULT_WRITERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    force: bool = False,
+) -> None:
     """Script for loading quiz questions and answers to Redis from all quiz files.
 
+    Only new and changed files are parsed according to the manifest of previous uploads.
+    Questions of the removed files are deleted. Generation of tasks is bumped
+    if any task has been changed, so bots drop the answers they have cached.
+    Files are parsed on a process pool and passed through a bounded queue to writer threads.
+
     Args:
         quiz_folder: path to folder with quiz tasks.
+        workers: number of processes parsing quiz files.
+        writers: number of threads writing tasks to Redis.
+        batch_size: amount of tasks to be flushed with single pipeline execution.
+        force: parse and upload all files regardless of the manifest.
     """
     starting_time = time.time()
-    logger.info('Started uploading quiz tasks.')
-    redis_client = Redis(host=REDIS_HOST, db=TASKS_DATABASE)
-    loading_pipeline = redis_client.pipeline()
-    quiz_files_paths = [join(quiz_folder, file_name) for file_name in os.listdir(quiz_folder)]
-    for path in quiz_files_paths:
-        tasks = parse_quiz_file(path_to_file=path)
-        for question, answer in tasks:
-            loading_pipeline.set(question, answer)
-    loading_pipeline.execute()
-    logger.info(f'Uploading finished in {time.time() - starting_time} seconds.')
+    prepare_tasks_database()
+    file_names = os.listdir(quiz_folder)
+    saved_manifest = remove_deleted_files(file_names, batch_size)
+    manifest: Manifest = {} if force else saved_manifest
+    modified_files = find_modified_files(quiz_folder, file_names, manifest)
+    files_count = len(file_names)
+    logger.info(f'Started uploading {len(modified_files)} modified files of {files_count}.')
+    start_upload_progress(connect(TASKS_DATABASE), len(modified_files))
+    parsed_files = iterate_parsed_files(quiz_folder, modified_files, workers=workers)
+    uploaded = upload_quiz_files(
+        map(get_uploaded_file, parsed_files), manifest, writers=writers, batch_size=batch_size,
+    )
+    finish_upload(uploaded, starting_time)
 
 
-if __name__ == '__main__':
+def load_corpus_tasks(
+    corpus_path: str,
+    writers: int = DEFAULT_WRITERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    force: bool = False,
+) -> None:
+    """Script for loading quiz questions and answers to Redis from the corpus built before.
+
+    Files compiled into the corpus are compared with the manifest by content hash,
+    so only tasks of changed files are written, and nothing is parsed.
+
+    Args:
+        corpus_path: path to the corpus file.
+        writers: number of threads writing tasks to Redis.
+        batch_size: amount of tasks to be flushed with single pipeline execution.
+        force: upload all files regardless of the manifest.
+    """
+    starting_time = time.time()
+    prepare_tasks_database()
+    with closing(QuizCorpus(corpus_path)) as corpus:
+        corpus_files = list(corpus.iterate_files())
+        saved_manifest = remove_deleted_files(
+            [corpus_file.file_name for corpus_file in corpus_files], batch_size,
+        )
+        manifest: Manifest = {} if force else saved_manifest
+        modified_files = [
+            corpus_file
+            for corpus_file in corpus_files
+            if corpus_file.file_record.is_content_changed(manifest.get(corpus_file.file_name))
+        ]
+        files_count = len(corpus_files)
+        logger.info(f'Started uploading {len(modified_files)} modified files of {files_count}.')
+        start_upload_progress(connect(TASKS_DATABASE), len(modified_files))
+        uploaded_files = (
+            UploadedFile(
+                file_name=corpus_file.file_name,
+                file_record=corpus_file.file_record,
+                tasks=corpus.get_task_texts(corpus_file),
+            )
+            for corpus_file in modified_files
+        )
+        uploaded = upload_quiz_files(
+            uploaded_files, manifest, writers=writers, batch_size=batch_size,
+        )
+    finish_upload(uploaded, starting_time)
+
+
+def build_corpus(quiz_folder: str, corpus_path: str, workers: int = DEFAULT_WORKERS) -> None:
+    """Script for compiling all quiz files into the corpus.
+
+    Args:
+        quiz_folder: path to folder with quiz tasks.
+        corpus_path: path to the corpus file.
+        workers: number of processes parsing quiz files.
+    """
+    starting_time = time.time()
+    file_names = sorted(os.listdir(quiz_folder))
+    parsed_files = iterate_parsed_files(quiz_folder, file_names, workers=workers)
+    tasks_count = write_corpus(corpus_path, parsed_files)
+    building_time = time.time() - starting_time
+    logger.info(f'Built corpus of {tasks_count} tasks in {building_time} seconds.')
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parse command line arguments of the upload script.
+
+    Returns:
+        Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Upload quiz tasks to Redis.')
+    parser.add_argument(
+        'command',
+        nargs='?',
+        choices=(UPLOAD_COMMAND, BUILD_COMMAND),
+        default=UPLOAD_COMMAND,
+        help='upload tasks to Redis or build the corpus of tasks',
+    )
+    parser.add_argument(
+        '--corpus', help='corpus file to build or to upload tasks from instead of quiz files',
+    )
+    parser.add_argument(
+        '--workers', type=int, default=DEFAULT_WORKERS, help='number of parsing processes',
+    )
+    parser.add_argument(
+        '--writers', type=int, default=DEFAULT_WRITERS, help='number of Redis writing threads',
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='tasks per pipeline flush',
+    )
+    parser.add_argument(
+        '--force', action='store_true', help='upload all files regardless of the manifest',
+    )
+    return parser.parse_args()
+
+
+def upload_tasks(arguments: argparse.Namespace, quiz_folder_path: str) -> None:
+    """Upload tasks from the corpus if it is given or from quiz files.
+
+    Args:
+        arguments: parsed arguments of the script.
+        quiz_folder_path: path to folder with quiz tasks.
+    """
+    if arguments.corpus:
+        load_corpus_tasks(
+            arguments.corpus,
+            writers=arguments.writers,
+            batch_size=arguments.batch_size,
+            force=arguments.force,
+        )
+    else:
+        load_quiz_tasks(
+            quiz_folder_path,
+            workers=arguments.workers,
+            writers=arguments.writers,
+            batch_size=arguments.batch_size,
+            force=arguments.force,
+        )
+
+
+def main() -> None:
+    """Run the upload as script.
+
+    Raises:
+        Exception: error of the upload is raised again once the failure is published.
+    """
     logging.basicConfig(
         format='QUIZ_UPLOAD %(asctime)s %(levelname)s: %(message)s',
         level=logging.INFO,
     )
-    load_dotenv()
+    arguments = parse_arguments()
     quiz_folder_path = os.getenv('QUIZ_TASKS_DIR', DEFAULT_QUIZ_TASKS_DIR)
-    load_quiz_tasks(quiz_folder_path)
+    if arguments.command == BUILD_COMMAND:
+        corpus_path = arguments.corpus or QUIZ_CORPUS_PATH or DEFAULT_CORPUS_PATH
+        build_corpus(quiz_folder_path, corpus_path, workers=arguments.workers)
+        return
+    try:
+        upload_tasks(arguments, quiz_folder_path)
+    except Exception:
+        finish_upload_progress(connect(TASKS_DATABASE), is_successful=False)
+        raise
+
+
+if __name__ == '__main__':
+    main()
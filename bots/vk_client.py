@@ -0,0 +1,140 @@
+"""Module with asynchronous client of VK API and VK long poll server."""
+
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import aiohttp
+from vk_api.longpoll import DEFAULT_MODE, Event
+
+API_URL = 'https://api.vk.com/method/{method}'
+API_VERSION = '5.92'
+LONG_POLL_VERSION = 3
+LONG_POLL_WAIT = 25
+LONG_POLL_EXTRA_TIMEOUT = 10
+OUTDATED_HISTORY = 1
+EXPIRED_KEY = 2
+LOST_INFORMATION = 3
+TOO_MANY_REQUESTS = 6
+FLOOD_CONTROL = 9
+
+
+class VkApiCallError(Exception):
+    """Error returned by VK API."""
+
+    def __init__(self, error: Dict[str, Any]) -> None:
+        """Create error from VK API response.
+
+        Args:
+            error: error object of VK API response.
+        """
+        self.code = error.get('error_code')
+        error_message = error.get('error_msg')
+        super().__init__(f'[{self.code}] {error_message}')
+
+
+class AsyncVkApi(object):
+    """Class for calling VK API methods."""
+
+    def __init__(self, session: aiohttp.ClientSession, token: str) -> None:
+        """Create client of VK API.
+
+        Args:
+            session: HTTP session.
+            token: access token.
+        """
+        self.session = session
+        self._token = token
+
+    async def call(self, method: str, **method_params: Any) -> Any:
+        """Call method of VK API.
+
+        Args:
+            method: name of the method.
+            method_params: parameters of the method.
+
+        Returns:
+            Response of the method.
+
+        Raises:
+            VkApiCallError: if VK API returned an error.
+        """
+        request_data = {**method_params, 'access_token': self._token, 'v': API_VERSION}
+        async with self.session.post(API_URL.format(method=method), data=request_data) as response:
+            response_data = await response.json()
+        if (error := response_data.get('error')) is not None:
+            raise VkApiCallError(error)
+        return response_data['response']
+
+
+class AsyncVkLongPoll(object):
+    """Class for receiving events from VK long poll server."""
+
+    def __init__(self, vk_api: AsyncVkApi, wait: int = LONG_POLL_WAIT) -> None:
+        """Create client of long poll server.
+
+        Args:
+            vk_api: client of VK API.
+            wait: time in seconds to wait for events in a single request.
+        """
+        self._vk_api = vk_api
+        self._wait = wait
+        self._server: Optional[str] = None
+        self._key: Optional[str] = None
+        self._ts: Optional[int] = None
+        self._is_listening = False
+
+    async def update_server(self, update_ts: bool = True) -> None:
+        """Get address and key of long poll server.
+
+        Args:
+            update_ts: whether number of the last event should be updated too.
+        """
+        response = await self._vk_api.call(
+            'messages.getLongPollServer', lp_version=LONG_POLL_VERSION,
+        )
+        self._server = response['server']
+        self._key = response['key']
+        if update_ts:
+            self._ts = response['ts']
+
+    async def check(self) -> List[Event]:
+        """Get events from the server once.
+
+        Returns:
+            Received events.
+        """
+        if self._server is None:
+            await self.update_server()
+        request_params = {
+            'act': 'a_check',
+            'key': self._key,
+            'ts': self._ts,
+            'wait': self._wait,
+            'mode': DEFAULT_MODE,
+            'version': LONG_POLL_VERSION,
+        }
+        request_timeout = aiohttp.ClientTimeout(total=self._wait + LONG_POLL_EXTRA_TIMEOUT)
+        async with self._vk_api.session.get(
+            f'https://{self._server}', params=request_params, timeout=request_timeout,
+        ) as response:
+            response_data = await response.json(content_type=None)
+        failure = response_data.get('failed')
+        if failure is None or failure == OUTDATED_HISTORY:
+            self._ts = response_data['ts']
+        elif failure in {EXPIRED_KEY, LOST_INFORMATION}:
+            await self.update_server(update_ts=failure == LOST_INFORMATION)
+        return [Event(raw_event) for raw_event in response_data.get('updates', [])]
+
+    async def listen(self) -> AsyncIterator[Event]:
+        """Listen to the server until listening is stopped.
+
+        Yields:
+            Received events.
+        """
+        self._is_listening = True
+        while self._is_listening:
+            for event in await self.check():
+                yield event
+
+    def stop(self) -> None:
+        """Stop listening after the current request to the server."""
+        self._is_listening = False
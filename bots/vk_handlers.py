@@ -0,0 +1,148 @@
+"""Module with handlers of messages for vkontakte implementation of quiz bot.
+
+Handlers are thin wrappers over the asynchronous quiz engine, which keeps all the logic
+of the quiz shared with the telegram bot; their latencies are recorded under their names.
+"""
+
+import logging
+from types import MappingProxyType
+
+from vk_api.longpoll import Event, VkEventType
+
+from bots.constants import GREETING_VK, THEME_COMMAND, ButtonText
+from bots.metrics import HANDLER_STAGE, measure, measure_async_handler
+from bots.quiz_engine import AsyncQuizEngine
+
+logger = logging.getLogger(__name__)
+
+PLATFORM = 'vk'
+
+
+def is_incoming_message(event: Event) -> bool:
+    """Check whether the event is a new message sent to the bot.
+
+    Args:
+        event: event from long poll server.
+
+    Returns:
+        True if the message should be replied else False.
+    """
+    return event.type == VkEventType.MESSAGE_NEW and event.to_me
+
+
+async def get_reply_message(event: Event, quiz: AsyncQuizEngine) -> str:
+    """Choose handler for the message of user and get reply from it.
+
+    Args:
+        event: event of new message.
+        quiz: quiz engine of vkontakte users.
+
+    Returns:
+        Reply message for user.
+    """
+    with measure(HANDLER_STAGE, 'register_user'):
+        is_newcomer = await quiz.register_user(event.user_id)
+    if is_newcomer:
+        logger.info(f'User {event.user_id} entered the quiz.')
+        return GREETING_VK
+    if button_handler := BUTTON_HANDLERS.get(event.message):
+        return await button_handler(quiz, event.user_id)
+    command, _, theme = event.message.partition(' ')
+    if command == f'/{THEME_COMMAND}':
+        return await handle_theme_request(quiz, event.user_id, theme)
+    return await handle_solution_attempt(quiz, event.user_id, event.message)
+
+
+@measure_async_handler
+async def handle_new_question_request(quiz: AsyncQuizEngine, user_id: int) -> str:
+    """Pick random question and save it as last asked question for user.
+
+    Args:
+        quiz: quiz engine of vkontakte users.
+        user_id: id of the user in Vkontakte.
+
+    Returns:
+        Random question for user or stub message if there are no tasks.
+    """
+    return (await quiz.ask_question(user_id)).text
+
+
+@measure_async_handler
+async def handle_give_up_request(quiz: AsyncQuizEngine, user_id: int) -> str:
+    """Close last asked question to user and increase give up counter.
+
+    Args:
+        quiz: quiz engine of vkontakte users.
+        user_id: id of the user in Vkontakte.
+
+    Returns:
+        Answer for asked question or stub message if there haven't been any questions for user yet.
+    """
+    return (await quiz.give_up(user_id)).text
+
+
+@measure_async_handler
+async def handle_score_request(quiz: AsyncQuizEngine, user_id: int) -> str:
+    """Get user's score: successes and give ups.
+
+    Args:
+        quiz: quiz engine of vkontakte users.
+        user_id: id of the user in Vkontakte.
+
+    Returns:
+        Text message with score for user.
+    """
+    return (await quiz.get_score(user_id)).text
+
+
+@measure_async_handler
+async def handle_leaderboard_request(quiz: AsyncQuizEngine, user_id: int) -> str:
+    """Get the best users of both platforms and place of the user among them.
+
+    Args:
+        quiz: quiz engine of vkontakte users.
+        user_id: id of the user in Vkontakte.
+
+    Returns:
+        Text message with the leaderboard.
+    """
+    return (await quiz.get_leaderboard(user_id)).text
+
+
+@measure_async_handler
+async def handle_theme_request(quiz: AsyncQuizEngine, user_id: int, theme: str) -> str:
+    """Choose theme of questions asked to the user.
+
+    Args:
+        quiz: quiz engine of vkontakte users.
+        user_id: id of the user in Vkontakte.
+        theme: name of the tournament or words of questions, empty string resets the theme.
+
+    Returns:
+        Text message whether the theme has been changed.
+    """
+    return (await quiz.set_theme(user_id, theme)).text
+
+
+@measure_async_handler
+async def handle_solution_attempt(quiz: AsyncQuizEngine, user_id: int, users_answer: str) -> str:
+    """Check user's answer and increase success counter if he is correct.
+
+    Args:
+        quiz: quiz engine of vkontakte users.
+        user_id: id of the user in Vkontakte.
+        users_answer: answer received from user.
+
+    Returns:
+        Reply message for user whether he was correct or not.
+        Stub message could be also returned if there haven't been any questions for user yet.
+    """
+    return (await quiz.attempt(user_id, users_answer)).text
+
+
+BUTTON_HANDLERS = MappingProxyType({
+    ButtonText.QUESTION.value: handle_new_question_request,
+    ButtonText.GIVE_UP.value: handle_give_up_request,
+    ButtonText.SCORE.value: handle_score_request,
+    ButtonText.LEADERBOARD.value: handle_leaderboard_request,
+})
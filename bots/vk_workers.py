@@ -0,0 +1,248 @@
+"""Module for vkontakte implementation of quiz bot sharded among worker processes.
+
+The reader process only receives events from long poll server and puts incoming messages
+to bounded queues of worker processes picked by IDs of users, so messages of the same user
+are handled by the same worker in the order they have been received, while checking
+of answers is spread over all cores. Every worker handles messages like the single-process
+bot does with its own connections, outbox and metrics server on the port following
+the port of the reader; the limit of replies of the bot is shared by workers equally.
+Depths of queues of workers are recorded to metrics of the reader.
+
+On SIGINT or SIGTERM the reader stops listening, and workers handle queued messages
+and deliver replies before they exit. If any worker dies, the whole bot is stopped,
+so it could be restarted; messages for the dead worker are dropped meanwhile instead
+of blocking the reader on its full queue.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from functools import partial
+from multiprocessing.context import SpawnProcess
+from multiprocessing.queues import Queue
+from typing import Any, AsyncIterator, List, Optional
+
+import aiohttp
+from vk_api.longpoll import Event
+
+from bots.constants import (
+    VK_MESSAGES_PER_SECOND, VK_METRICS_PORT, VK_WORKER_QUEUE_SIZE, VK_WORKERS,
+)
+from bots.metrics import set_queue_depth, start_metrics_server
+from bots.outbox import get_shard
+from bots.vk_client import AsyncVkApi, AsyncVkLongPoll
+from bots.vk_handlers import is_incoming_message
+from bots.vkontakte_bot import handle_events, listen_with_backoff, open_bot_context
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH_INTERVAL = 1
+QUEUE_PUT_TIMEOUT = 1
+WORKER_STOP_TIMEOUT = 30
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+LOGGING_FORMAT = '{name} %(asctime)s %(levelname)s: %(message)s'
+
+QueuedEvent = Optional[List[Any]]
+
+
+async def receive_events(event_queue: 'Queue[QueuedEvent]') -> AsyncIterator[Event]:
+    """Receive events put to the queue of the worker until the reader stops it.
+
+    Args:
+        event_queue: queue of the worker.
+
+    Yields:
+        Events of new messages.
+    """
+    event_loop = asyncio.get_running_loop()
+    while (raw_event := await event_loop.run_in_executor(None, event_queue.get)) is not None:
+        yield Event(raw_event)
+
+
+async def run_worker_bot(vk_token: str, event_queue: 'Queue[QueuedEvent]', workers: int) -> None:
+    """Handle messages received from the reader until it stops the worker.
+
+    Args:
+        vk_token: group token of vkontakte.
+        event_queue: queue of the worker.
+        workers: amount of workers sharing the limit of replies.
+    """
+    async with aiohttp.ClientSession() as session:
+        vk_api = AsyncVkApi(session=session, token=vk_token)
+        async with open_bot_context(vk_api, VK_MESSAGES_PER_SECOND / workers) as context:
+            await handle_events(receive_events(event_queue), context)
+
+
+def run_worker(
+    worker_index: int, vk_token: str, event_queue: 'Queue[QueuedEvent]', workers: int,
+) -> None:
+    """Run the worker process.
+
+    SIGINT is ignored, so the worker is stopped only by the reader once queued
+    messages are put to its queue.
+
+    Args:
+        worker_index: index of the worker.
+        vk_token: group token of vkontakte.
+        event_queue: queue of the worker.
+        workers: amount of workers.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        format=LOGGING_FORMAT.format(name=f'VK_WORKER_{worker_index}'), level=logging.INFO,
+    )
+    if VK_METRICS_PORT:
+        start_metrics_server(VK_METRICS_PORT + worker_index + 1)
+    asyncio.run(run_worker_bot(vk_token, event_queue, workers))
+
+
+def put_event(
+    event_queue: 'Queue[QueuedEvent]', raw_event: List[Any], worker_process: SpawnProcess,
+) -> bool:
+    """Put event to the full queue of the worker waiting while the worker is alive.
+
+    Args:
+        event_queue: queue of the worker.
+        raw_event: raw event of the new message.
+        worker_process: process of the worker.
+
+    Returns:
+        True if event is put to the queue else False if the worker has died.
+    """
+    while worker_process.is_alive():
+        try:
+            event_queue.put(raw_event, timeout=QUEUE_PUT_TIMEOUT)
+        except queue.Full:
+            continue
+        return True
+    return False
+
+
+async def fan_out_events(
+    events: AsyncIterator[Event],
+    event_queues: List['Queue[QueuedEvent]'],
+    worker_processes: List[SpawnProcess],
+) -> None:
+    """Put incoming messages to queues of workers picked by IDs of users.
+
+    Reading events waits while the queue of the worker is full, unless the worker has died.
+
+    Args:
+        events: events from long poll server.
+        event_queues: queues of workers.
+        worker_processes: processes of workers.
+    """
+    event_loop = asyncio.get_running_loop()
+    async for event in events:
+        if not is_incoming_message(event):
+            continue
+        shard = get_shard(event.user_id, len(event_queues))
+        try:
+            event_queues[shard].put_nowait(event.raw)
+        except queue.Full:
+            is_put = await event_loop.run_in_executor(
+                None, put_event, event_queues[shard], event.raw, worker_processes[shard],
+            )
+            if not is_put:
+                logger.error(f'{worker_processes[shard].name} has died, the message is dropped.')
+
+
+async def watch_workers(
+    worker_processes: List[SpawnProcess], event_queues: List['Queue[QueuedEvent]'],
+) -> None:
+    """Record depths of queues of workers until any of them dies.
+
+    Args:
+        worker_processes: processes of workers.
+        event_queues: queues of workers.
+    """
+    while all(worker_process.is_alive() for worker_process in worker_processes):
+        for worker_process, event_queue in zip(worker_processes, event_queues):
+            set_queue_depth(worker_process.name, event_queue.qsize())
+        await asyncio.sleep(QUEUE_DEPTH_INTERVAL)
+    logger.error('Worker has exited unexpectedly, the bot is stopped.')
+
+
+async def run_reader(
+    vk_token: str,
+    worker_processes: List[SpawnProcess],
+    event_queues: List['Queue[QueuedEvent]'],
+) -> None:
+    """Listen to VK long poll server forwarding messages to workers until the bot is stopped.
+
+    Args:
+        vk_token: group token of vkontakte.
+        worker_processes: processes of workers.
+        event_queues: queues of workers.
+    """
+    event_loop = asyncio.get_running_loop()
+    async with aiohttp.ClientSession() as session:
+        listening = asyncio.create_task(listen_with_backoff(
+            vk_long_poll=AsyncVkLongPoll(AsyncVkApi(session=session, token=vk_token)),
+            receive=partial(
+                fan_out_events, event_queues=event_queues, worker_processes=worker_processes,
+            ),
+        ))
+        watching = asyncio.create_task(watch_workers(worker_processes, event_queues))
+        for stop_signal in STOP_SIGNALS:
+            event_loop.add_signal_handler(stop_signal, listening.cancel)
+        workers = len(worker_processes)
+        logger.info(f'Bot started with {workers} workers.')
+        await asyncio.wait({listening, watching}, return_when=asyncio.FIRST_COMPLETED)
+        listening.cancel()
+        watching.cancel()
+
+
+def stop_workers(
+    worker_processes: List[SpawnProcess], event_queues: List['Queue[QueuedEvent]'],
+) -> None:
+    """Stop workers once they handle queued messages, terminating those which hang.
+
+    Args:
+        worker_processes: processes of workers.
+        event_queues: queues of workers.
+    """
+    for worker_process, event_queue in zip(worker_processes, event_queues):
+        if worker_process.is_alive():
+            event_queue.put(None)
+    for stopped_process in worker_processes:
+        stopped_process.join(WORKER_STOP_TIMEOUT)
+        if stopped_process.is_alive():
+            logger.error(f'{stopped_process.name} has not stopped in time and is terminated.')
+            stopped_process.terminate()
+
+
+def main() -> None:
+    """Run the reader and workers of the bot as script.
+
+    Raises:
+        SystemExit: if any worker has failed, so the bot could be restarted.
+    """
+    logging.basicConfig(format=LOGGING_FORMAT.format(name='VK_READER'), level=logging.INFO)
+    vk_token = os.getenv('VKONTAKTE_TOKEN', '')
+    spawn_context = multiprocessing.get_context('spawn')
+    event_queues: List['Queue[QueuedEvent]'] = [
+        spawn_context.Queue(maxsize=VK_WORKER_QUEUE_SIZE) for _ in range(VK_WORKERS)
+    ]
+    worker_processes = [
+        spawn_context.Process(
+            target=run_worker,
+            args=(worker_index, vk_token, event_queue, VK_WORKERS),
+            name=f'worker_{worker_index}',
+        )
+        for worker_index, event_queue in enumerate(event_queues)
+    ]
+    for worker_process in worker_processes:
+        worker_process.start()
+    start_metrics_server(VK_METRICS_PORT)
+    asyncio.run(run_reader(vk_token, worker_processes, event_queues))
+    stop_workers(worker_processes, event_queues)
+    if any(stopped_process.exitcode for stopped_process in worker_processes):
+        raise SystemExit('Some workers of the bot have failed.')
+
+
+if __name__ == '__main__':
+    main()
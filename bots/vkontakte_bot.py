@@ -1,164 +1,243 @@
-"""Module for vkontakte implementation of quiz bot."""
+"""Module for vkontakte implementation of quiz bot.
 
-import json
+Events from long poll server are handled concurrently, but events of the same user
+are handled one by one in the order they have been received. Replies are put
+to the outbox, which sends them in the background paced by the limits of VK.
+Worker processes of the sharded bot handle events the same way,
+but receive them from the reader instead of the long poll server.
+Latencies of handlers and of sending replies are recorded to metrics.
+"""
+
+import asyncio
 import logging
 import os
-import time
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, NamedTuple, Optional, Set
 
-from dotenv import load_dotenv
-from redis import Redis
-from vk_api import VkApi
+import aiohttp
+from redis.backoff import EqualJitterBackoff
 from vk_api.keyboard import VkKeyboard, VkKeyboardColor
-from vk_api.longpoll import VkEventType, VkLongPoll
+from vk_api.longpoll import Event
 from vk_api.utils import get_random_id
-from vk_api.vk_api import VkApiMethod
 
-from bots.check_answer import is_correct_answer
+from bots.async_utils import KeyedLock
 from bots.constants import (
-    GIVE_UP, GREETING_VK, NEXT, NO_QUESTION_STUB, REDIS_HOST, RIGHT_ANSWER, SCORE_TEXT,
-    TASKS_DATABASE, USERS_DATABASE, WRONG_ANSWER, ButtonText,
+    CHAT_MESSAGES_BURST, CHAT_MESSAGES_PER_SECOND, TASKS_DATABASE, USERS_DATABASE,
+    VK_CONCURRENT_EVENTS, VK_MESSAGES_PER_SECOND, VK_METRICS_PORT, ButtonText,
+)
+from bots.corpus import open_configured_corpus
+from bots.metrics import start_metrics_server, watch_answers_cache
+from bots.outbox import AsyncOutbox, OutgoingMessage, Pacer
+from bots.quiz_engine import AsyncQuizEngine
+from bots.quiz_scripts import register_quiz_scripts
+from bots.storage import connect_async
+from bots.vk_client import (
+    FLOOD_CONTROL, TOO_MANY_REQUESTS, AsyncVkApi, AsyncVkLongPoll, VkApiCallError,
 )
+from bots.vk_handlers import PLATFORM, get_reply_message, is_incoming_message
 
 logger = logging.getLogger(__name__)
 
-UNEXPECTED_ERROR_LOG = '{exception}\nUnexpected error happened! Retrying in {timeout} seconds.'
-UNEXPECTED_ERROR_TIMEOUT = 100
+UNEXPECTED_ERROR_LOG = '{exception}\nUnexpected error happened! Retrying in {timeout:.3f} seconds.'
+LISTENING_BACKOFF_BASE = 0.05
+LISTENING_BACKOFF_CAP = 60
+SENDING_BACKOFF_BASE = 0.1
+SENDING_BACKOFF_CAP = 10
+SEND_METHOD = 'messages.send'
+
+
+class BotContext(NamedTuple):
+    """Class with everything needed to handle events."""
+
+    vk_api: AsyncVkApi
+    quiz: AsyncQuizEngine
+    outbox: AsyncOutbox
+    users_lock: KeyedLock
+    handling_slots: asyncio.Semaphore
 
 
 def create_keyboard() -> str:
     """Create keyboard for user to interact with him.
 
     Returns:
-        Keyboard with buttons for new question request, give up and score request in JSON format.
+        Keyboard with buttons for new question, give up, score and leaderboard in JSON format.
     """
     keyboard = VkKeyboard()
     keyboard.add_button(ButtonText.QUESTION.value, color=VkKeyboardColor.POSITIVE)
     keyboard.add_button(ButtonText.GIVE_UP.value, color=VkKeyboardColor.NEGATIVE)
     keyboard.add_line()
     keyboard.add_button(ButtonText.SCORE.value, color=VkKeyboardColor.PRIMARY)
+    keyboard.add_button(ButtonText.LEADERBOARD.value, color=VkKeyboardColor.SECONDARY)
     return keyboard.get_keyboard()
 
 
-def interact_longpoll(vk_long_poll: VkLongPoll, vk_api_method: VkApiMethod) -> None:
-    """Interact with VK longpoll server.
+async def send_message(vk_api: AsyncVkApi, keyboard: str, message: OutgoingMessage) -> Any:
+    """Send the message from the outbox to VK along with the keyboard.
 
     Args:
-        vk_long_poll: instance of VK Long Poll.
-        vk_api_method: instance of VK Api Method.
+        vk_api: client of VK API.
+        keyboard: keyboard in JSON format built once for all messages.
+        message: message from the outbox.
+
+    Returns:
+        ID of the sent message.
     """
-    tasks_connector = Redis(host=REDIS_HOST, db=TASKS_DATABASE, decode_responses=True)
-    users_connector = Redis(host=REDIS_HOST, db=USERS_DATABASE, decode_responses=True)
-    databases = {'tasks': tasks_connector, 'users': users_connector}
-    keyboard = create_keyboard()
-    for event in vk_long_poll.listen():
-        if not (event.type == VkEventType.MESSAGE_NEW and event.to_me):
-            continue
-        user_id = event.user_id
-        user_id_db = f'user_vk_{user_id}'
-        if not users_connector.get(user_id_db):
-            users_connector.set(
-                user_id_db, json.dumps({'last_asked_question': '', 'success': 0, 'give_up': 0}),
-            )
-            logger.info(f'User {user_id} entered the quiz.')
-            reply_message = GREETING_VK
-        elif event.message == ButtonText.QUESTION.value:
-            reply_message = handle_new_question_request(databases=databases, user_id=user_id_db)
-        elif event.message == ButtonText.GIVE_UP.value:
-            reply_message = handle_give_up_request(databases=databases, user_id=user_id_db)
-        elif event.message == ButtonText.SCORE.value:
-            reply_message = handle_score_request(databases=databases, user_id=user_id_db)
-        else:
-            reply_message = handle_solution_attempt(
-                databases=databases, user_id=user_id_db, users_answer=event.message,
-            )
-        vk_api_method.messages.send(
-            user_id=user_id, message=reply_message, random_id=get_random_id(), keyboard=keyboard,
-        )
+    return await vk_api.call(
+        SEND_METHOD, user_id=message.chat_id, keyboard=keyboard, **message.fields,
+    )
+
 
+def get_retry_after(error: Exception, attempt: int) -> Optional[float]:
+    """Get pause before sending again when VK refuses to send because of its limits.
 
-def handle_new_question_request(databases: dict, user_id: str) -> str:
-    """Get random question from database and update it as last asked question for user.
+    VK doesn't tell how long to wait, so pauses grow exponentially with jitter.
 
     Args:
-        databases: connectors to redis databases (users and tasks).
-        user_id: id of the user in Vkontakte in database representation.
+        error: error of sending.
+        attempt: number of the failed attempt.
 
     Returns:
-        Random question for user.
+        Pause in seconds if limits are exceeded else None.
     """
-    tasks_db = databases['tasks']
-    question = tasks_db.randomkey()
-    users_db = databases['users']
-    saved_user_data = json.loads(users_db.get(user_id))
-    saved_user_data['last_asked_question'] = question
-    users_db.set(user_id, json.dumps(saved_user_data))
-    return question
+    if isinstance(error, VkApiCallError) and error.code in {TOO_MANY_REQUESTS, FLOOD_CONTROL}:
+        return EqualJitterBackoff(cap=SENDING_BACKOFF_CAP, base=SENDING_BACKOFF_BASE).compute(
+            attempt,
+        )
+    return None
 
 
-def handle_give_up_request(databases: dict, user_id: str) -> str:
-    """Get answer for last asked question to user and increase give up counter.
+async def handle_events(events: AsyncIterator[Event], context: BotContext) -> None:
+    """Handle incoming messages concurrently.
 
-    Args:
-        databases: connectors to redis databases (users and tasks).
-        user_id: id of the user in Vkontakte in database representation.
+    Amount of messages handled at once is bounded, so reading events waits
+    when too many of them are being handled. Once events are over, messages
+    being handled are awaited.
 
-    Returns:
-        Answer for asked question or stub message if there haven't been any questions for user yet.
+    Args:
+        events: events from long poll server.
+        context: everything needed to handle events.
     """
-    users_db = databases['users']
-    saved_user_data = json.loads(users_db.get(user_id))
-    asked_question = saved_user_data['last_asked_question']
-    if not asked_question:
-        return NO_QUESTION_STUB
-    saved_user_data['give_up'] += 1
-    saved_user_data['last_asked_question'] = ''
-    users_db.set(user_id, json.dumps(saved_user_data))
-    tasks_db = databases['tasks']
-    return GIVE_UP.format(answer=tasks_db.get(asked_question), next=NEXT)
+    handling_tasks: Set[asyncio.Task] = set()
+    async for event in events:
+        if not is_incoming_message(event):
+            continue
+        await context.handling_slots.acquire()
+        handling_task = asyncio.create_task(handle_event(event, context))
+        handling_tasks.add(handling_task)
+        handling_task.add_done_callback(handling_tasks.discard)
+    await asyncio.gather(*handling_tasks)
+
 
+async def handle_event(event: Event, context: BotContext) -> None:
+    """Reply to the message of user.
 
-def handle_score_request(databases: dict, user_id: str) -> str:
-    """Get user's score: successes and give ups.
+    Errors are logged, so they don't affect handling of other events.
+    Handling slot taken for the event is released when reply is sent.
 
     Args:
-        databases: connectors to redis databases (users and tasks).
-        user_id: id of the user in Vkontakte in database representation.
+        event: event of new message.
+        context: everything needed to handle events.
+    """
+    try:
+        async with context.users_lock.hold(event.user_id):
+            reply_message = await get_reply_message(event, context.quiz)
+            await context.outbox.put(OutgoingMessage(
+                chat_id=event.user_id,
+                fields={'message': reply_message, 'random_id': get_random_id()},
+            ))
+    except Exception:
+        logger.exception(f'Failed to handle message of user {event.user_id}.')
+    finally:
+        context.handling_slots.release()
+
+
+async def listen_with_backoff(
+    vk_long_poll: AsyncVkLongPoll, receive: Callable[[AsyncIterator[Event]], Awaitable[None]],
+) -> None:
+    """Listen to VK long poll server restarting listening after unexpected errors.
+
+    Listening is restarted with the same client, so the key and number of the last event
+    are kept and no events are lost. Pauses grow exponentially with jitter while errors
+    follow each other and are reset once listening has lasted longer than the longest pause.
 
-    Returns:
-        Text message with score for user.
+    Args:
+        vk_long_poll: client of VK long poll server.
+        receive: handles or forwards events received from the server.
     """
-    users_db = databases['users']
-    saved_user_data = json.loads(users_db.get(user_id))
-    successes = saved_user_data['success']
-    give_ups = saved_user_data['give_up']
-    return SCORE_TEXT.format(successes=successes, give_ups=give_ups)
+    listening_backoff = EqualJitterBackoff(cap=LISTENING_BACKOFF_CAP, base=LISTENING_BACKOFF_BASE)
+    event_loop = asyncio.get_running_loop()
+    failures = 0
+    while True:
+        listening_start = event_loop.time()
+        try:
+            await receive(vk_long_poll.listen())
+        except Exception as exc:
+            if event_loop.time() - listening_start > LISTENING_BACKOFF_CAP:
+                failures = 0
+            failures += 1
+            timeout = listening_backoff.compute(failures)
+            logger.error(UNEXPECTED_ERROR_LOG.format(exception=exc, timeout=timeout))
+            await asyncio.sleep(timeout)
 
 
-def handle_solution_attempt(databases: dict, user_id: str, users_answer: str) -> str:
-    """Check user's answer and increase success counter if he is correct.
+@asynccontextmanager
+async def open_bot_context(
+    vk_api: AsyncVkApi, messages_per_second: float,
+) -> AsyncIterator[BotContext]:
+    """Connect to Redis and start the outbox sending replies through VK API.
 
     Args:
-        databases: connectors to redis databases (users and tasks).
-        user_id: id of the user in Vkontakte in database representation.
-        users_answer: answer received from user.
+        vk_api: client of VK API.
+        messages_per_second: maximum number of replies sent per second.
 
-    Returns:
-        Reply message for user whether he was correct or not.
-        Stub message could be also returned if there haven't been any questions for user yet.
+    Yields:
+        Everything needed to handle events; replies are delivered once the context is left.
     """
-    users_db = databases['users']
-    saved_user_data = json.loads(users_db.get(user_id))
-    asked_question = saved_user_data['last_asked_question']
-    if not asked_question:
-        return NO_QUESTION_STUB
-    tasks_db = databases['tasks']
-    correct_answer = tasks_db.get(asked_question)
-    if not is_correct_answer(users_answer=users_answer, correct_answer=correct_answer):
-        return WRONG_ANSWER
-    saved_user_data['success'] += 1
-    saved_user_data['last_asked_question'] = ''
-    users_db.set(user_id, json.dumps(saved_user_data))
-    return RIGHT_ANSWER
+    outbox = AsyncOutbox(
+        send=partial(send_message, vk_api, create_keyboard()),
+        pacer=Pacer(
+            rate=messages_per_second,
+            chat_rate=CHAT_MESSAGES_PER_SECOND,
+            chat_burst=CHAT_MESSAGES_BURST,
+        ),
+        get_retry_after=get_retry_after,
+        name=SEND_METHOD,
+    )
+    context = BotContext(
+        vk_api=vk_api,
+        quiz=AsyncQuizEngine(
+            scripts=register_quiz_scripts(
+                users_db=connect_async(USERS_DATABASE, decode_responses=True),
+                tasks_db=connect_async(TASKS_DATABASE, decode_responses=True, is_read_only=True),
+                themes_db=connect_async(TASKS_DATABASE, decode_responses=True),
+            ),
+            platform=PLATFORM,
+            corpus=open_configured_corpus(),
+        ),
+        outbox=outbox,
+        users_lock=KeyedLock(),
+        handling_slots=asyncio.Semaphore(VK_CONCURRENT_EVENTS),
+    )
+    watch_answers_cache(context.quiz.answers_cache)
+    async with outbox:
+        yield context
+
+
+async def run_bot(vk_token: str) -> None:
+    """Connect to Redis and VK and start listening to VK long poll server.
+
+    Args:
+        vk_token: group token of vkontakte.
+    """
+    async with aiohttp.ClientSession() as session:
+        vk_api = AsyncVkApi(session=session, token=vk_token)
+        async with open_bot_context(vk_api, VK_MESSAGES_PER_SECOND) as context:
+            logger.info('Bot started.')
+            await listen_with_backoff(
+                vk_long_poll=AsyncVkLongPoll(vk_api),
+                receive=partial(handle_events, context=context),
+            )
 
 
 def main() -> None:
@@ -167,21 +246,8 @@ def main() -> None:
         format='VK_BOT %(asctime)s %(levelname)s: %(message)s',
         level=logging.INFO,
     )
-    load_dotenv()
-    vk_token = os.getenv('VKONTAKTE_TOKEN')
-    vk_api = VkApi(token=vk_token)
-    vk_api_connector = vk_api.get_api()
-    vk_long_poll = VkLongPoll(vk_api)
-    logger.info('Bot started.')
-    while True:
-        try:
-            interact_longpoll(vk_long_poll=vk_long_poll, vk_api_method=vk_api_connector)
-        except Exception as exc:
-            error_message = UNEXPECTED_ERROR_LOG.format(
-                exception=exc, timeout=UNEXPECTED_ERROR_TIMEOUT,
-            )
-            logger.error(error_message)
-            time.sleep(UNEXPECTED_ERROR_TIMEOUT)
+    start_metrics_server(VK_METRICS_PORT)
+    asyncio.run(run_bot(os.getenv('VKONTAKTE_TOKEN', '')))
 
 
 if __name__ == '__main__':
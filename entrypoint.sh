@@ -1,6 +1,11 @@
 #!/bin/bash
 set -e
 
-python bots/upload_quiz.py
+python bots/upload_quiz.py &
+python bots/readiness.py
 python bots/telegram_bot.py &
-python bots/vkontakte_bot.py
+if [ "${VK_WORKERS:-1}" -gt 1 ]; then
+    exec python bots/vk_workers.py
+else
+    exec python bots/vkontakte_bot.py
+fi
@@ -0,0 +1 @@
+"""Tests of the bots run against Redis server started for them."""
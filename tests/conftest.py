@@ -0,0 +1,60 @@
+"""Fixtures of tests run against a throwaway Redis server."""
+
+import shutil
+import subprocess
+import time
+from typing import Iterator
+
+import pytest
+from redis import Redis
+from redis.exceptions import RedisError
+
+REDIS_SERVER_OPTIONS = ('--port', '0', '--save', '', '--appendonly', 'no')
+REDIS_STARTUP_TIMEOUT = 10
+REDIS_STARTUP_POLL = 0.05
+
+
+@pytest.fixture(scope='session')
+def redis_socket(tmp_path_factory: pytest.TempPathFactory) -> Iterator[str]:
+    """Start Redis server listening only on the unix socket, so no data of the bots is touched.
+
+    Args:
+        tmp_path_factory: factory of temporary folders of the session.
+
+    Yields:
+        Path to the socket of the server.
+    """
+    if (executable := shutil.which('redis-server')) is None:
+        pytest.skip('redis-server is not installed')
+    server_folder = tmp_path_factory.mktemp('redis')
+    socket_path = str(server_folder / 'redis.sock')
+    server_process = subprocess.Popen(
+        [executable, *REDIS_SERVER_OPTIONS, '--unixsocket', socket_path, '--dir', server_folder],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + REDIS_STARTUP_TIMEOUT
+    while True:
+        try:
+            Redis(unix_socket_path=socket_path).ping()
+        except RedisError:
+            assert time.monotonic() < deadline, 'Redis server has not started in time.'
+            time.sleep(REDIS_STARTUP_POLL)
+        else:
+            break
+    yield socket_path
+    server_process.terminate()
+    server_process.wait()
+
+
+@pytest.fixture()
+def redis_server(redis_socket: str) -> str:
+    """Give the empty Redis server to the test.
+
+    Args:
+        redis_socket: path to the socket of the server.
+
+    Returns:
+        Path to the socket of the server.
+    """
+    Redis(unix_socket_path=redis_socket).flushall()
+    return redis_socket
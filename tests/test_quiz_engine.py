@@ -0,0 +1,51 @@
+"""Tests of drawing questions by the quiz engine."""
+
+from typing import List
+
+import pytest
+from redis import Redis
+
+from bots.constants import TASKS_DATABASE, USERS_DATABASE
+from bots.quiz_engine import QuizEngine
+from bots.quiz_scripts import register_quiz_scripts
+from bots.task_store import LAST_ASKED_QUESTION_FIELD, add_task, allocate_task_ids
+
+USER_ID = 1
+PERMUTATIONS_ASKED = 4
+
+
+def ask_questions(quiz: QuizEngine, users_db: Redis, questions_count: int) -> List[int]:
+    """Ask questions to the user one by one.
+
+    Args:
+        quiz: quiz engine.
+        users_db: connector to users database.
+        questions_count: amount of questions to ask.
+
+    Returns:
+        IDs of asked tasks in the order of asking.
+    """
+    user_key = quiz.get_user_key(USER_ID)
+    asked_ids = []
+    for _ in range(questions_count):
+        assert quiz.ask_question(USER_ID).is_question_open
+        asked_ids.append(int(users_db.hget(user_key, LAST_ASKED_QUESTION_FIELD) or -1))
+    return asked_ids
+
+
+@pytest.mark.parametrize('tasks_count', [1, 5, 16, 17, 64, 256, 300])
+def test_every_task_is_asked_once_per_permutation(redis_server: str, tasks_count: int) -> None:
+    """Questions follow permutations of all tasks, so none is repeated before all are asked."""
+    users_db = Redis(unix_socket_path=redis_server, db=USERS_DATABASE, decode_responses=True)
+    tasks_db = Redis(unix_socket_path=redis_server, db=TASKS_DATABASE, decode_responses=True)
+    pipeline = tasks_db.pipeline()
+    for task_id in allocate_task_ids(tasks_db, tasks_count):
+        add_task(pipeline, task_id, question=f'Вопрос {task_id}', answer='Ответ')
+    pipeline.execute()
+    quiz = QuizEngine(register_quiz_scripts(users_db, tasks_db), 'tg')
+    quiz.register_user(USER_ID)
+
+    for _ in range(PERMUTATIONS_ASKED):
+        asked_ids = ask_questions(quiz, users_db, tasks_count)
+
+        assert sorted(asked_ids) == list(range(tasks_count))
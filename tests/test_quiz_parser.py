@@ -0,0 +1,78 @@
+"""Tests of parsing quiz files shipped in quiz_tasks."""
+
+import hashlib
+import os
+from pathlib import Path
+
+from bots.quiz_parser import QUIZ_FILE_ENCODING, parse_quiz_file, parse_quiz_tasks
+
+QUIZ_TASKS_DIR = os.path.join(Path(__file__).absolute().parent.parent, 'quiz_tasks')
+SAMPLE_FILE = '1vs1201.txt'
+TOUR_TASKS = 12
+ANSWER_BLOCK_LINES = 3
+
+
+def test_sample_file_is_parsed_into_tasks() -> None:
+    """Every question of the sample file becomes a task with its answer."""
+    parsed_file = parse_quiz_tasks(QUIZ_TASKS_DIR, SAMPLE_FILE)
+
+    task_numbers = [task.number for task in parsed_file.tasks]
+    tour_numbers = list(range(1, TOUR_TASKS + 1))
+    assert not parsed_file.malformed_blocks
+    assert task_numbers == tour_numbers + tour_numbers
+    assert all(task.question and task.answer for task in parsed_file.tasks)
+    first_task = parsed_file.tasks[0]
+    assert first_task.question.startswith('Лиссабонское метро имеет только одну ветку.')
+    assert first_task.answer == 'Футбольные стадионы "Бенфики" и "Спортинга".'
+
+
+def test_digest_is_taken_from_the_content() -> None:
+    """The record of the file keeps the hash of its bytes and its size."""
+    path_to_file = os.path.join(QUIZ_TASKS_DIR, SAMPLE_FILE)
+    with open(path_to_file, 'rb') as quiz_file:
+        file_content = quiz_file.read()
+
+    file_record = parse_quiz_tasks(QUIZ_TASKS_DIR, SAMPLE_FILE).file_record
+
+    assert file_record.digest == hashlib.sha256(file_content).hexdigest()
+    assert file_record.size == len(file_content)
+
+
+def test_streaming_parser_gives_the_same_tasks() -> None:
+    """Parsing the file by chunks of text gives the same tasks as parsing it for the upload."""
+    parsed_file = parse_quiz_tasks(QUIZ_TASKS_DIR, SAMPLE_FILE)
+    streamed_tasks = parse_quiz_file(os.path.join(QUIZ_TASKS_DIR, SAMPLE_FILE))
+
+    assert [
+        (task.question, task.answer) for task in streamed_tasks
+    ] == [
+        (task.question, task.answer) for task in parsed_file.tasks
+    ]
+
+
+def test_malformed_blocks_are_reported_without_shifting_tasks(tmp_path: Path) -> None:
+    """Question without answer and answer without question are skipped and reported."""
+    with open(os.path.join(QUIZ_TASKS_DIR, SAMPLE_FILE), encoding=QUIZ_FILE_ENCODING) as quiz_file:
+        lines = quiz_file.read().split('\n')
+    last_question = lines.index(f'Вопрос {TOUR_TASKS}:')
+    last_answer = lines.index('Ответ:', last_question)
+    next_tour_question = lines.index('Вопрос 1:', last_answer)
+    malformed_lines = [
+        *lines[:last_answer],
+        *lines[last_answer + ANSWER_BLOCK_LINES:next_tour_question],
+        *lines[lines.index('Ответ:', next_tour_question):],
+    ]
+    (tmp_path / SAMPLE_FILE).write_text('\n'.join(malformed_lines), encoding=QUIZ_FILE_ENCODING)
+
+    parsed_file = parse_quiz_tasks(str(tmp_path), SAMPLE_FILE)
+
+    assert [
+        (block.line_number, block.reason) for block in parsed_file.malformed_blocks
+    ] == [
+        (last_question + 1, 'question without answer'),
+        (malformed_lines.index('Ответ:', last_question) + 1, 'answer without question'),
+    ]
+    assert parsed_file.tasks == [
+        task for task_index, task in enumerate(parse_quiz_tasks(QUIZ_TASKS_DIR, SAMPLE_FILE).tasks)
+        if task_index not in {TOUR_TASKS - 1, TOUR_TASKS}
+    ]
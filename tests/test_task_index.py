@@ -0,0 +1,115 @@
+"""Tests of indexes of themes kept in tasks database."""
+
+from typing import List, Set
+
+import pytest
+from redis import Redis
+
+from bots.constants import TASKS_DATABASE
+from bots.task_index import (
+    FILE_INDEX_KEY, FILE_POSTINGS_KEY, WORD_INDEX_KEY, get_file_theme, get_words, index_file_tasks,
+    unindex_file_tasks,
+)
+from bots.task_store import TaskText, add_task, allocate_task_ids
+
+FILE_NAME = 'pushkin.txt'
+FIRST_QUESTIONS = (
+    'Какую сказку Пушкин написал в Болдине?',
+    'Где Пушкин встретил свою няню Арину Родионовну?',
+    'Какая дуэль закончилась для поэта трагически?',
+)
+CHANGED_QUESTIONS = (
+    'Какую повесть Пушкин написал в Болдине?',
+    'Какой лицейский друг навестил поэта в Михайловском?',
+    'Кто секундант на дуэли поэта?',
+)
+WORD_KEYS_PATTERN = WORD_INDEX_KEY.format(theme='*')
+
+
+@pytest.fixture()
+def tasks_db(redis_server: str) -> Redis:
+    """Connect to empty tasks database without decoding responses, as the uploader does.
+
+    Args:
+        redis_server: path to the socket of Redis server.
+
+    Returns:
+        Connector to tasks database.
+    """
+    return Redis(unix_socket_path=redis_server, db=TASKS_DATABASE)
+
+
+def upload_questions(tasks_db: Redis, task_ids: List[int], questions: List[str]) -> None:
+    """Save tasks of the file replacing the previous ones and index them.
+
+    Args:
+        tasks_db: connector to tasks database.
+        task_ids: IDs of the tasks.
+        questions: questions of the tasks.
+    """
+    tasks = [TaskText(question=question, answer='Ответ') for question in questions]
+    pipeline = tasks_db.pipeline()
+    unindex_file_tasks(tasks_db, pipeline, FILE_NAME, task_ids)
+    for task_id, task in zip(task_ids, tasks):
+        add_task(pipeline, task_id, task.question, task.answer)
+    index_file_tasks(pipeline, FILE_NAME, task_ids, tasks)
+    pipeline.execute()
+
+
+def read_indexed_words(tasks_db: Redis, task_id: int) -> Set[str]:
+    """Find stems of words whose indexes contain the task.
+
+    Args:
+        tasks_db: connector to tasks database.
+        task_id: ID of the task.
+
+    Returns:
+        Stems of words.
+    """
+    return {
+        word_key.decode().split(':')[-1]
+        for word_key in tasks_db.scan_iter(WORD_KEYS_PATTERN)
+        if tasks_db.sismember(word_key, task_id)
+    }
+
+
+def test_reindexed_tasks_keep_only_words_of_new_questions(tasks_db: Redis) -> None:
+    """Words of replaced questions don't point to the tasks any more."""
+    task_ids = allocate_task_ids(tasks_db, len(FIRST_QUESTIONS))
+    upload_questions(tasks_db, task_ids, list(FIRST_QUESTIONS))
+    upload_questions(tasks_db, task_ids, list(CHANGED_QUESTIONS))
+
+    assert [
+        read_indexed_words(tasks_db, task_id) for task_id in task_ids
+    ] == [get_words(question) for question in CHANGED_QUESTIONS]
+    file_index_key = FILE_INDEX_KEY.format(theme=get_file_theme(FILE_NAME))
+    assert set(map(int, tasks_db.smembers(file_index_key))) == set(task_ids)
+
+
+def test_unindexed_file_leaves_no_words(tasks_db: Redis) -> None:
+    """Removing the file from indexes deletes sets of its words and its postings."""
+    task_ids = allocate_task_ids(tasks_db, len(FIRST_QUESTIONS))
+    upload_questions(tasks_db, task_ids, list(FIRST_QUESTIONS))
+
+    pipeline = tasks_db.pipeline()
+    unindex_file_tasks(tasks_db, pipeline, FILE_NAME, task_ids)
+    pipeline.execute()
+
+    assert not list(tasks_db.scan_iter(WORD_KEYS_PATTERN))
+    assert not tasks_db.exists(
+        FILE_INDEX_KEY.format(theme=get_file_theme(FILE_NAME)),
+        FILE_POSTINGS_KEY.format(file_name=FILE_NAME),
+    )
+
+
+def test_file_without_postings_is_unindexed_by_saved_questions(tasks_db: Redis) -> None:
+    """Files indexed before postings were kept are unindexed by words of saved questions."""
+    task_ids = allocate_task_ids(tasks_db, len(FIRST_QUESTIONS))
+    upload_questions(tasks_db, task_ids, list(FIRST_QUESTIONS))
+    tasks_db.delete(FILE_POSTINGS_KEY.format(file_name=FILE_NAME))
+
+    upload_questions(tasks_db, task_ids, list(CHANGED_QUESTIONS))
+
+    assert [
+        read_indexed_words(tasks_db, task_id) for task_id in task_ids
+    ] == [get_words(question) for question in CHANGED_QUESTIONS]